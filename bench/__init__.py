@@ -0,0 +1,3 @@
+## @package onion_routing.bench Benchmarks.
+# Run with python -m unittest discover -s bench -p "bench_*.py".
+#
@@ -0,0 +1,237 @@
+#!/usr/bin/python
+## @package onion_routing.bench.bench_async_server
+# Benchmark of event loop cost with idle connections.
+## @file bench_async_server.py
+# Implementation of @ref onion_routing.bench.bench_async_server
+#
+
+import os
+import resource
+import select
+import signal
+import socket
+import sys
+import time
+import unittest
+
+from common.async import async_server
+from common.async import event_object
+from common.pollables import listener_socket
+from common.pollables import proxy_socket
+
+
+## Numbers of idle connections.
+CONNECTIONS = (100, 1000, 10000)
+
+## Loop iterations measured for every number of connections.
+ITERATIONS = 2000
+
+## Loop iterations measured when poller is rebuilt, which is slower.
+REBUILD_ITERATIONS = 50
+
+## Min ratio between loop cost of rebuilt poller and of persistent
+# registrations with most connections.
+#
+MIN_SPEEDUP = 2
+
+## Max ratio between loop cost with most and least connections.
+MAX_RATIO = 5
+
+
+## Server which counts loop iterations.
+#
+# Counting starts once all connections were accepted, server is closed
+# after the given number of iterations.
+#
+class CountingServer(async_server.AsyncServer):
+
+    ## Constructor.
+    # @param app_context (dict) application_context.
+    # @param connections (int) number of idle connections.
+    # @param iterations (int) number of iterations to measure.
+    #
+    def __init__(
+        self,
+        app_context,
+        connections,
+        iterations,
+    ):
+        super(CountingServer, self).__init__(app_context)
+
+        ## Number of idle connections.
+        self._connections = connections
+
+        ## Number of iterations to measure.
+        self._total = iterations
+
+        ## Number of iterations left.
+        self._iterations = iterations
+
+        ## CPU time when counting started.
+        self._start = None
+
+        ## CPU seconds of iteration, once measured.
+        self.seconds = None
+
+    ## Count iteration.
+    def _count(self):
+        if len(self._socket_data) <= self._connections or self.terminate:
+            return
+        if self._start is None:
+            self._start = cpu_time()
+        self._iterations -= 1
+        if not self._iterations:
+            self.seconds = (cpu_time() - self._start) / self._total
+            self.close_server()
+
+    ## Update poller and count iteration.
+    def _update_poller(self):
+        super(CountingServer, self)._update_poller()
+        self._count()
+
+
+## Server which rebuilds its poller on every loop iteration.
+#
+# Loop as it was before persistent registrations: every socket is
+# registered in a new poller before every poll. Poller is rebuilt only
+# while iterations are counted, so accepting connections is not slowed.
+#
+class RebuildServer(CountingServer):
+
+    ## Update poller by building a new one.
+    def _update_poller(self):
+        super(RebuildServer, self)._update_poller()
+        if self._start is None:
+            return
+        self._poller.close()
+        self._poller = self._poll_object()
+        for entry in self._socket_data.values():
+            self._register_socket(entry)
+
+
+## Connect idle clients in a child process.
+# @param port (int) port of listener.
+# @param connections (int) number of connections.
+# @returns (int) pid of child, which keeps connections open until killed.
+#
+def connect_clients(
+    port,
+    connections,
+):
+    pid = os.fork()
+    if pid:
+        return pid
+    try:
+        clients = []
+        for i in range(connections):
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.connect(("127.0.0.1", port))
+            clients.append(s)
+        while True:
+            time.sleep(1)
+    finally:
+        os._exit(0)
+
+
+## CPU time of process.
+# @returns (float) user and system seconds.
+#
+def cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+## Measure cost of event loop iteration.
+# @param server_type (class) type of server.
+# @param poll_object (@ref common.async.event_object.BaseEvent) event
+# type.
+# @param connections (int) number of idle connections.
+# @param iterations (int) number of iterations to measure.
+# @returns (float) CPU seconds of loop iteration.
+#
+# Loop does not block, so it iterates while all connections are idle.
+#
+def measure(
+    server_type,
+    poll_object,
+    connections,
+    iterations,
+):
+    app_context = {
+        "poll_object": poll_object,
+        "timeout": 0,
+        "max_connections": 4096,
+        "max_buffer_size": 1024,
+    }
+    server = server_type(app_context, connections, iterations)
+    listener = server.add_listener(
+        listener_socket.Listener,
+        "127.0.0.1",
+        0,
+        listener_type=proxy_socket.ProxySocket,
+    )
+    pid = connect_clients(listener.socket.getsockname()[1], connections)
+    try:
+        server.run()
+    finally:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+    return server.seconds
+
+
+## Async Server benchmark.
+#
+# A poller with persistent registrations does not register every idle
+# connection again on every loop iteration, and loop cost must not grow
+# with the number of idle connections.
+#
+@unittest.skipUnless(hasattr(select, "epoll"), "epoll is not supported")
+class AsyncServerBenchmark(unittest.TestCase):
+
+    ## Raise limit of open files for the connections.
+    def setUp(self):
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < max(CONNECTIONS) + 100 <= hard:
+            resource.setrlimit(
+                resource.RLIMIT_NOFILE,
+                (max(CONNECTIONS) + 100, hard),
+            )
+        if resource.getrlimit(
+            resource.RLIMIT_NOFILE,
+        )[0] < max(CONNECTIONS) + 100:
+            self.skipTest("not enough open files allowed")
+
+    ## Loop cost from least to most idle connections.
+    def test_idle_connections(self):
+        persistent = []
+        for connections in CONNECTIONS:
+            costs = (
+                measure(
+                    RebuildServer,
+                    event_object.PollEvent,
+                    connections,
+                    REBUILD_ITERATIONS,
+                ),
+                measure(
+                    CountingServer,
+                    event_object.EpollEvent,
+                    connections,
+                    ITERATIONS,
+                ),
+            )
+            persistent.append(costs[1])
+            sys.stderr.write(
+                "\n%6d idle connections: %.1f us per iteration rebuilt, "
+                "%.1f us persistent" % (
+                    connections,
+                    costs[0] * 1e6,
+                    costs[1] * 1e6,
+                )
+            )
+        sys.stderr.write("\n")
+        self.assertGreater(costs[0], costs[1] * MIN_SPEEDUP)
+        self.assertLess(persistent[-1], persistent[0] * MAX_RATIO)
+
+
+if __name__ == "__main__":
+    unittest.main()
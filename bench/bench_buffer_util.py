@@ -0,0 +1,324 @@
+#!/usr/bin/python
+## @package onion_routing.bench.bench_buffer_util
+# Benchmark of bytes copied by socket buffers while relaying.
+## @file bench_buffer_util.py
+# Implementation of @ref onion_routing.bench.bench_buffer_util
+#
+
+import os
+import signal
+import socket
+import sys
+import time
+import unittest
+
+from common import constants
+from common.async import async_server
+from common.async import event_object
+from common.pollables import listener_socket
+from common.pollables import proxy_socket
+from common.utilities import buffer_util
+
+
+## Bytes relayed.
+RELAY_BYTES = 32 * 1024 * 1024
+
+## Max buffer sizes of relay.
+BUFFER_SIZES = (
+    constants.DEFAULT_BUFFER_SIZE,
+    16 * 1024,
+    64 * 1024,
+)
+
+## Size of writes of client.
+BLOCK_SIZE = 64 * 1024
+
+## Receive buffer of sink, small so relay sends partially.
+SINK_RCVBUF = 4096
+
+## Max bytes copied by Buffer per relayed byte.
+MAX_COPIES = 0.1
+
+
+## Buffer which counts bytes it copies.
+#
+# Bytes moved between socket and buffer by recv_into and send are copied
+# by the kernel only, bytes appended, peeked or moved to the front of the
+# storage are copied by the process.
+#
+class CountingBuffer(buffer_util.Buffer):
+
+    ## Bytes copied by all buffers.
+    copied = 0
+
+    ## Make room for new data, counting data moved.
+    # @param size (int) number of bytes needed.
+    #
+    def _reserve(
+        self,
+        size,
+    ):
+        if len(self._data) - self._end < size:
+            CountingBuffer.copied += self._end - self._start
+        super(CountingBuffer, self)._reserve(size)
+
+    ## Append data, counting it.
+    # @param data (str) data to append.
+    #
+    def append(
+        self,
+        data,
+    ):
+        CountingBuffer.copied += len(data)
+        super(CountingBuffer, self).append(data)
+
+    ## Get beginning of content, counting it.
+    # @param size (optional, int) number of bytes, None for all content.
+    # @returns (str) copy of content.
+    #
+    def peek(
+        self,
+        size=None,
+    ):
+        data = super(CountingBuffer, self).peek(size)
+        CountingBuffer.copied += len(data)
+        return data
+
+
+## Buffer of immutable str.
+#
+# Socket buffer as it was before @ref common.utilities.buffer_util:
+# recieved data is added with +=, which copies the whole buffer, and
+# after a partial send the rest of it is copied by slicing.
+#
+class StrBuffer(object):
+
+    ## Bytes copied by all buffers.
+    copied = 0
+
+    ## Constructor.
+    def __init__(self):
+        ## Content.
+        self._data = ""
+
+    ## Receive data from socket into buffer.
+    # @param sock (socket) the socket to recieve data from.
+    # @param size (int) max size of bytes to read.
+    # @returns (int) number of bytes read.
+    #
+    def recv_into(
+        self,
+        sock,
+        size,
+    ):
+        data = sock.recv(size)
+        if self._data:
+            StrBuffer.copied += len(self._data) + len(data)
+        self._data += data
+        return len(data)
+
+    ## Send data from buffer to socket.
+    # @param sock (socket) the socket to send data to.
+    # @returns (int) number of bytes sent.
+    #
+    def send(
+        self,
+        sock,
+    ):
+        n = sock.send(self._data)
+        if n < len(self._data):
+            StrBuffer.copied += len(self._data) - n
+        self._data = self._data[n:]
+        return n
+
+    ## Remove all content of buffer.
+    def clear(self):
+        self._data = ""
+
+    ## Length of content.
+    def __len__(self):
+        return len(self._data)
+
+    ## Whether buffer has content.
+    def __nonzero__(self):
+        return bool(self._data)
+
+
+## Relay of benchmark.
+#
+# Connects every accepted connection to the sink in app_context, and
+# relays it by a pair of partnered
+# @ref common.pollables.proxy_socket.ProxySocket.
+#
+class Relay(listener_socket.Listener):
+
+    ## On read event.
+    # Accept connection and relay it to sink.
+    #
+    def on_read(self):
+        client, addr = self._socket.accept()
+        sink = socket.create_connection(self._app_context["sink"])
+        pair = [
+            proxy_socket.ProxySocket(
+                socket=s,
+                state=constants.ACTIVE,
+                app_context=self._app_context,
+            )
+            for s in (client, sink)
+        ]
+        pair[0].partner = pair[1]
+        pair[1].partner = pair[0]
+        for s in pair:
+            self._app_context["add_socket"](s)
+
+
+## Fork a process.
+# @param target (callable) function run by child, which then exits.
+# @returns (int) pid of child.
+#
+def fork(target):
+    pid = os.fork()
+    if pid:
+        return pid
+    try:
+        target()
+    finally:
+        os._exit(0)
+
+
+## Run relay until SIGTERM.
+# @param address (tuple) address of relay.
+# @param sink (tuple) address of sink.
+# @param buffer_type (class) type of socket buffers.
+# @param buffer_size (int) max buffer size.
+# @param done (int) fd to write a byte to once listening, and bytes
+# copied once stopped.
+#
+def run_relay(
+    address,
+    sink,
+    buffer_type,
+    buffer_size,
+    done,
+):
+    buffer_util.Buffer = buffer_type
+    app_context = {
+        "poll_object": event_object.PollEvent,
+        "timeout": -1,
+        "max_connections": 16,
+        "max_buffer_size": buffer_size,
+        "sink": sink,
+    }
+    server = async_server.AsyncServer(app_context)
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.close_server())
+    server.add_listener(Relay, address[0], address[1])
+    os.write(done, "\0")
+    server.run()
+    os.write(done, "%d\n" % buffer_type.copied)
+
+
+## Run sink which reads a connection until closed.
+# @param listener (socket) listening socket.
+# @param done (int) fd to write total bytes to once closed.
+#
+def run_sink(
+    listener,
+    done,
+):
+    s = listener.accept()[0]
+    total = 0
+    while True:
+        data = s.recv(SINK_RCVBUF)
+        if not data:
+            break
+        total += len(data)
+    os.write(done, "%d\n" % total)
+
+
+## Measure bytes copied by relay.
+# @param buffer_type (class) type of socket buffers.
+# @param buffer_size (int) max buffer size.
+# @returns (tuple) bytes copied per relayed byte, relayed bytes per
+# second.
+#
+def measure(
+    buffer_type,
+    buffer_size,
+):
+    sink = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sink.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SINK_RCVBUF)
+    sink.bind(("127.0.0.1", 0))
+    sink.listen(1)
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    address = s.getsockname()
+    s.close()
+    sink_read, sink_write = os.pipe()
+    relay_read, relay_write = os.pipe()
+
+    sink_pid = fork(lambda: run_sink(sink, sink_write))
+    relay_pid = fork(
+        lambda: run_relay(
+            address,
+            sink.getsockname(),
+            buffer_type,
+            buffer_size,
+            relay_write,
+        )
+    )
+    sink.close()
+    relay_done = os.fdopen(relay_read)
+    try:
+        relay_done.read(1)
+        time.sleep(0.1)
+        start = time.time()
+        client = socket.create_connection(address)
+        block = "\0" * BLOCK_SIZE
+        for i in range(RELAY_BYTES // BLOCK_SIZE):
+            client.sendall(block)
+        client.close()
+        total = int(os.fdopen(sink_read).readline())
+        seconds = time.time() - start
+    finally:
+        os.kill(relay_pid, signal.SIGTERM)
+        os.waitpid(relay_pid, 0)
+        os.kill(sink_pid, signal.SIGKILL)
+        os.waitpid(sink_pid, 0)
+    copied = int(relay_done.readline())
+    if total != RELAY_BYTES:
+        raise AssertionError("sink recieved %d bytes" % total)
+    return float(copied) / total, total / seconds
+
+
+## Buffer benchmark.
+#
+# Relaying through a Buffer must copy almost nothing in the process for
+# any buffer size, a buffer of immutable str copies more as it grows.
+#
+class BufferBenchmark(unittest.TestCase):
+
+    ## Bytes copied by str buffer and by Buffer, by buffer size.
+    def test_copies_per_relayed_byte(self):
+        for buffer_size in BUFFER_SIZES:
+            results = {}
+            for buffer_type in (StrBuffer, CountingBuffer):
+                results[buffer_type] = measure(buffer_type, buffer_size)
+                sys.stderr.write(
+                    "\n%6d bytes %14s: %.3f MB copied per relayed MB, "
+                    "%.1f MB/s" % (
+                        buffer_size,
+                        buffer_type.__name__,
+                        results[buffer_type][0],
+                        results[buffer_type][1] / 1e6,
+                    )
+                )
+            self.assertLess(results[CountingBuffer][0], MAX_COPIES)
+            self.assertLessEqual(
+                results[CountingBuffer][0],
+                results[StrBuffer][0],
+            )
+        sys.stderr.write("\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
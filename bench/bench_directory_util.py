@@ -0,0 +1,109 @@
+#!/usr/bin/python
+## @package onion_routing.bench.bench_directory_util
+# Benchmark of parsing the node directory.
+## @file bench_directory_util.py
+# Implementation of @ref onion_routing.bench.bench_directory_util
+#
+
+import ast
+import sys
+import timeit
+import unittest
+
+from common.utilities import directory_util
+
+
+## Nodes in registry.
+NODES = 10000
+
+## Nodes changed in a diff, heartbeats which moved load and a node which
+# left.
+#
+CHANGED_NODES = 20
+
+## Parses measured of every kind.
+ITERATIONS = 5
+
+## Min ratio between full parse and diff apply time.
+MIN_DIFF_SPEEDUP = 20
+
+
+## Create registry.
+# @returns (dict) registry of NODES nodes.
+#
+def create_registry():
+    registry = {}
+    for i in range(NODES):
+        name = "10.%d.%d.%d:9000" % (i >> 16, (i >> 8) & 0xff, i & 0xff)
+        registry[name] = {
+            "name": name,
+            "address": name.split(":")[0],
+            "port": 9000,
+            "key": i & 0xff,
+            "capacity": 100,
+            "load": 0,
+        }
+    return registry
+
+
+## Measure seconds of callable.
+# @param function (callable) function to measure.
+# @returns (float) best seconds of ITERATIONS calls.
+#
+def measure(function):
+    return min(timeit.repeat(function, number=1, repeat=ITERATIONS))
+
+
+## Directory benchmark.
+#
+# A client which has the directory applies a diff of few changes instead
+# of parsing all nodes again.
+#
+class DirectoryBenchmark(unittest.TestCase):
+
+    ## Parse time of full directory, diff and the old str(dict) format.
+    def test_parse(self):
+        registry = create_registry()
+        directory = directory_util.create_directory()
+        full = directory_util.encode(registry, directory)
+        version = directory["version"]
+
+        names = sorted(registry)[:CHANGED_NODES]
+        for name in names[:-1]:
+            registry[name]["load"] = 50
+            directory_util.record_change(directory, name)
+        del registry[names[-1]]
+        directory_util.record_change(directory, names[-1])
+        diff = directory_util.encode(
+            registry,
+            directory,
+            directory_util.changes(directory, version),
+        )
+        old = str(registry)
+
+        client = directory_util.decode(full, {})[2]
+        seconds = (
+            measure(lambda: ast.literal_eval(old)),
+            measure(lambda: directory_util.decode(full, {})),
+            measure(lambda: directory_util.decode(diff, client)),
+        )
+        self.assertEqual(client, registry)
+        sys.stderr.write(
+            "\n%d nodes, %d changed: %.1f ms str(dict), %d bytes, "
+            "%.1f ms full, %d bytes, %.3f ms diff, %d bytes\n" % (
+                NODES,
+                CHANGED_NODES,
+                seconds[0] * 1e3,
+                len(old),
+                seconds[1] * 1e3,
+                len(full),
+                seconds[2] * 1e3,
+                len(diff),
+            )
+        )
+        self.assertLess(seconds[1], seconds[0])
+        self.assertLess(seconds[2] * MIN_DIFF_SPEEDUP, seconds[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
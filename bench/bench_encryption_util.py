@@ -0,0 +1,121 @@
+#!/usr/bin/python
+## @package onion_routing.bench.bench_encryption_util
+# Benchmark of xor encryption throughput per core.
+## @file bench_encryption_util.py
+# Implementation of @ref onion_routing.bench.bench_encryption_util
+#
+
+import resource
+import sys
+import unittest
+
+from common.utilities import buffer_util
+from common.utilities import encryption_util
+
+
+## Sizes of encrypted chunks.
+# max_buffer_size of nodes, a read of a busy connection and a large
+# buffer.
+#
+CHUNK_SIZES = (1024, 64 * 1024, 1024 * 1024)
+
+## Bytes encrypted for every chunk size and encryption.
+TOTAL_BYTES = 64 * 1024 * 1024
+
+## Bytes encrypted by byte by byte encryption, which is much slower.
+BYTE_TOTAL_BYTES = 1024 * 1024
+
+## Secret key.
+KEY = 7
+
+## Min ratio between throughput of table and byte by byte encryption.
+MIN_SPEEDUP = 20
+
+
+## Encrypt byte by byte.
+# @param buffer (str) data.
+# @param key (int) key.
+# @returns (str) encrypted data.
+#
+# Encryption as it was before the translation tables.
+#
+def encrypt_bytes(
+    buffer,
+    key,
+):
+    return "".join(chr(ord(a) ^ key) for a in buffer)
+
+
+## CPU time of process.
+# @returns (float) user and system seconds.
+#
+def cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+## Measure throughput of encryption of str.
+# @param encrypt (callable) encryption, called with data and key.
+# @param chunk_size (int) bytes encrypted at once.
+# @param total (int) bytes to encrypt.
+# @returns (float) bytes encrypted per CPU second.
+#
+def measure_str(
+    encrypt,
+    chunk_size,
+    total,
+):
+    chunk = "\1" * chunk_size
+    start = cpu_time()
+    for i in range(max(total // chunk_size, 1)):
+        encrypt(chunk, KEY)
+    return max(total, chunk_size) / (cpu_time() - start)
+
+
+## Measure throughput of in place encryption of buffer.
+# @param chunk_size (int) bytes encrypted at once.
+# @param total (int) bytes to encrypt.
+# @returns (float) bytes encrypted per CPU second.
+#
+def measure_buffer(
+    chunk_size,
+    total,
+):
+    buffer = buffer_util.Buffer("\1" * chunk_size)
+    start = cpu_time()
+    for i in range(max(total // chunk_size, 1)):
+        encryption_util.encrypt_buffer(buffer, KEY)
+    return max(total, chunk_size) / (cpu_time() - start)
+
+
+## Encryption benchmark.
+#
+# Throughput of one core, so it is the same on any number of cores.
+#
+class EncryptionBenchmark(unittest.TestCase):
+
+    ## Throughput of byte by byte, table and in place encryption.
+    def test_throughput(self):
+        for chunk_size in CHUNK_SIZES:
+            throughputs = (
+                measure_str(encrypt_bytes, chunk_size, BYTE_TOTAL_BYTES),
+                measure_str(
+                    encryption_util.encrypt,
+                    chunk_size,
+                    TOTAL_BYTES,
+                ),
+                measure_buffer(chunk_size, TOTAL_BYTES),
+            )
+            sys.stderr.write(
+                "\n%8d bytes chunks: %.1f MB/s byte by byte, "
+                "%.1f MB/s table, %.1f MB/s in place" % (
+                    (chunk_size,) + tuple(t / 1e6 for t in throughputs)
+                )
+            )
+            self.assertGreater(throughputs[1], throughputs[0] * MIN_SPEEDUP)
+            self.assertGreater(throughputs[2], throughputs[0] * MIN_SPEEDUP)
+        sys.stderr.write("\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
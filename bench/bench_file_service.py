@@ -0,0 +1,199 @@
+#!/usr/bin/python
+## @package onion_routing.bench.bench_file_service
+# Benchmark of static files served per second by the registry.
+## @file bench_file_service.py
+# Implementation of @ref onion_routing.bench.bench_file_service
+#
+
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+import unittest
+
+from bench import bench_http_socket
+from common import constants
+from common.utilities import buffer_util
+from common.utilities import http_util
+from common.utilities import util
+
+
+## Size of page, which is cached.
+PAGE_SIZE = 512 * 1024
+
+## Size of large file, which is not cached and is sent from disk.
+LARGE_FILE_SIZE = 16 * 1024 * 1024
+
+## Bytes of file requested by every measure.
+TOTAL_BYTES = 64 * 1024 * 1024
+
+## Request of file.
+REQUEST = "GET /%s HTTP/1.1\r\nHost: registry\r\n%s\r\n"
+
+## Header of request accepting gzip.
+ACCEPT_GZIP = "Accept-Encoding: gzip\r\n"
+
+## Min ratio between throughput of sendfile and of reading large file.
+MIN_SENDFILE_SPEEDUP = 1.5
+
+
+## Create static files.
+# @returns (str) directory of files.
+#
+def create_files():
+    base = tempfile.mkdtemp()
+    line = "<tr><td>node</td><td>127.0.0.1</td><td>9000</td></tr>\n"
+    with open(os.path.join(base, "page.html"), "wb") as f:
+        f.write((line * (PAGE_SIZE // len(line) + 1))[:PAGE_SIZE])
+    with open(os.path.join(base, "large.bin"), "wb") as f:
+        f.write(os.urandom(LARGE_FILE_SIZE))
+    return base + os.sep
+
+
+## Run registry until SIGTERM.
+# @param address (tuple) address of registry.
+# @param base (str) directory of static files.
+# @param sendfile (bool) whether large files are sent with sendfile.
+#
+def run_registry(
+    address,
+    base,
+    sendfile,
+):
+    if not sendfile:
+        util.SENDFILE = None
+    bench_http_socket.run_registry(address, base)
+
+
+## Measure throughput of file.
+# @param address (tuple) address of registry.
+# @param request (str) request of file.
+# @param size (int) size of file.
+# @param encoding (str) expected Content-Encoding, None for plain.
+# @returns (tuple) bytes of file and of messages per second.
+#
+def measure(
+    address,
+    request,
+    size,
+    encoding,
+):
+    buffer = buffer_util.Buffer()
+    parser = http_util.HttpParser()
+    s = socket.create_connection(address)
+    received = 0
+    start = time.time()
+    for i in range(max(TOTAL_BYTES // size, 1)):
+        s.sendall(request)
+        while True:
+            if (
+                parser.recv_first_line(buffer) is not None and
+                parser.recv_headers(buffer, set(["Content-Encoding"]))
+            ):
+                parser.recv_content(buffer)
+                if parser.state == constants.PARSE_DONE:
+                    break
+            n = buffer.recv_into(s, 256 * 1024)
+            if not n:
+                raise RuntimeError("registry closed connection")
+            received += n
+        if parser.first_line[1] != "200":
+            raise RuntimeError("status %s" % parser.first_line[1])
+        if parser.headers.get("Content-Encoding") != encoding:
+            raise RuntimeError(
+                "Content-Encoding %s" % parser.headers.get("Content-Encoding")
+            )
+        parser.reset()
+    seconds = time.time() - start
+    s.close()
+    return max(TOTAL_BYTES // size, 1) * size / seconds, received / seconds
+
+
+## File Service benchmark.
+#
+# Cached pages are served from memory, plain or gzip, large files are
+# sent from disk by sendfile or by reading them.
+#
+@unittest.skipUnless(util.SENDFILE, "sendfile is not supported")
+class FileServiceBenchmark(unittest.TestCase):
+
+    ## Create files.
+    def setUp(self):
+        self.base = create_files()
+
+    ## Remove files.
+    def tearDown(self):
+        shutil.rmtree(self.base)
+
+    ## Throughput of every way of serving files.
+    def test_throughput(self):
+        results = {}
+        for name, sendfile, request, size, encoding in (
+            (
+                "cached page",
+                True,
+                REQUEST % ("page.html", ""),
+                PAGE_SIZE,
+                None,
+            ),
+            (
+                "cached page gzip",
+                True,
+                REQUEST % ("page.html", ACCEPT_GZIP),
+                PAGE_SIZE,
+                "gzip",
+            ),
+            (
+                "large file sendfile",
+                True,
+                REQUEST % ("large.bin", ""),
+                LARGE_FILE_SIZE,
+                None,
+            ),
+            (
+                "large file read",
+                False,
+                REQUEST % ("large.bin", ""),
+                LARGE_FILE_SIZE,
+                None,
+            ),
+        ):
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.bind(("127.0.0.1", 0))
+            address = s.getsockname()
+            s.close()
+            pid = os.fork()
+            if not pid:
+                try:
+                    run_registry(address, self.base, sendfile)
+                finally:
+                    os._exit(0)
+            try:
+                time.sleep(0.5)
+                results[name] = measure(address, request, size, encoding)
+            finally:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            sys.stderr.write(
+                "\n%20s: %.1f MB/s of file, %.1f MB/s on the wire" % (
+                    name,
+                    results[name][0] / 1e6,
+                    results[name][1] / 1e6,
+                )
+            )
+        sys.stderr.write("\n")
+        self.assertLess(
+            results["cached page gzip"][1],
+            results["cached page gzip"][0],
+        )
+        self.assertGreater(
+            results["large file sendfile"][0],
+            results["large file read"][0] * MIN_SENDFILE_SPEEDUP,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,318 @@
+#!/usr/bin/python
+## @package onion_routing.bench.bench_hops
+# Benchmark of latency by number of nodes in path.
+## @file bench_hops.py
+# Implementation of @ref onion_routing.bench.bench_hops
+#
+
+import os
+import select
+import signal
+import socket
+import sys
+import time
+import unittest
+
+from common import constants
+from common.async import async_server
+from common.async import event_object
+from common.pollables import listener_socket
+from common.utilities import path_util
+from common.utilities import socks5_util
+from entry.pollables import socks5_client
+from entry.pollables import socks5_stream
+from onion.pollables import onion_node
+
+
+## Numbers of nodes in path.
+HOPS = (1, 2, 3, 4)
+
+## Browser connections for every number of hops.
+CONNECTIONS = 20
+
+## Requests sent on every connection.
+REQUESTS = 20
+
+## Size of request.
+REQUEST_SIZE = 100
+
+## Size of response.
+RESPONSE_SIZE = 1000
+
+## Secret key of nodes.
+KEY = 7
+
+## Max median seconds of request round trip through most hops.
+# A stall of Nagle algorithm or delayed acknowledgement on any hop is
+# tens of milliseconds.
+#
+MAX_REQUEST_LATENCY = 0.02
+
+## Size of socks5 connection response.
+RESPONSE_HEADER_SIZE = 2 + 10
+
+
+## Entry of benchmark.
+#
+# Builds a new circuit through the path in app_context for every browser
+# connection and carries the connection as its stream, like
+# @ref entry.pollables.entry_node.EntryNode without a registry.
+#
+class Entry(listener_socket.Listener):
+
+    ## On read event.
+    # Accept browser connection, create circuit and stream.
+    #
+    def on_read(self):
+        client, addr = self._socket.accept()
+        circuit = socks5_client.Socks5Client(
+            socket=socket.socket(socket.AF_INET, socket.SOCK_STREAM),
+            state=constants.ACTIVE,
+            app_context=self._app_context,
+            path=self._app_context["path"],
+        )
+        self._app_context["add_socket"](circuit)
+        self._app_context["add_socket"](
+            socks5_stream.Socks5Stream(
+                socket=client,
+                state=constants.ACTIVE,
+                app_context=self._app_context,
+                circuit=circuit,
+            )
+        )
+
+
+## Free port of loopback.
+# @returns (int) port.
+#
+def free_port():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+## Fork a process.
+# @param target (callable) function run by child, which then exits.
+# @returns (int) pid of child.
+#
+def fork(target):
+    pid = os.fork()
+    if pid:
+        return pid
+    try:
+        target()
+    finally:
+        os._exit(0)
+
+
+## Run server until SIGTERM.
+# @param server (@ref common.async.async_server.AsyncServer) server.
+#
+def run_server(server):
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.close_server())
+    server.run()
+
+
+## Run onion nodes.
+# @param ports (list) ports of nodes.
+#
+def run_nodes(ports):
+    app_context = {
+        "poll_object": event_object.PollEvent,
+        "timeout": -1,
+        "max_connections": 4096,
+        "max_buffer_size": constants.DEFAULT_BUFFER_SIZE,
+        "key": KEY,
+        "loads": [0],
+        "worker": 0,
+        "register": False,
+    }
+    server = async_server.AsyncServer(app_context)
+    for port in ports:
+        server.add_listener(onion_node.OnionNode, "127.0.0.1", port)
+    run_server(server)
+
+
+## Run entry.
+# @param port (int) port of entry.
+# @param path (dict) nodes of path, key - position from "1".
+#
+def run_entry(
+    port,
+    path,
+):
+    app_context = {
+        "poll_object": event_object.PollEvent,
+        "timeout": -1,
+        "max_connections": 4096,
+        "max_buffer_size": constants.DEFAULT_BUFFER_SIZE,
+        "optimistic_data": False,
+        "connections": {},
+        "path_selector": path_util.PathSelector(),
+        "path": path,
+    }
+    server = async_server.AsyncServer(app_context)
+    server.add_listener(Entry, "127.0.0.1", port)
+    run_server(server)
+
+
+## Run destination which answers every request.
+# @param listener (socket) listening socket.
+#
+def run_destination(listener):
+    received = {}
+    while True:
+        readable = select.select([listener] + received.keys(), [], [])[0]
+        for s in readable:
+            if s is listener:
+                received[listener.accept()[0]] = 0
+                continue
+            data = s.recv(64 * 1024)
+            if not data:
+                s.close()
+                del received[s]
+                continue
+            received[s] += len(data)
+            while received[s] >= REQUEST_SIZE:
+                received[s] -= REQUEST_SIZE
+                s.sendall("\0" * RESPONSE_SIZE)
+
+
+## Recieve exactly size bytes.
+# @param s (socket) socket.
+# @param size (int) number of bytes.
+# @returns (str) data.
+#
+def recv_all(
+    s,
+    size,
+):
+    data = ""
+    while len(data) < size:
+        chunk = s.recv(size - len(data))
+        if not chunk:
+            raise RuntimeError("connection closed")
+        data += chunk
+    return data
+
+
+## Median of samples.
+# @param samples (list) numbers.
+# @returns (float) median.
+#
+def median(samples):
+    return sorted(samples)[len(samples) // 2]
+
+
+## Measure latency through path.
+# @param port (int) port of entry.
+# @param destination_port (int) port of destination.
+# @returns (tuple) median seconds of connect, circuit and CONNECT, and
+# median seconds of request round trip.
+#
+def measure(
+    port,
+    destination_port,
+):
+    connects = []
+    requests = []
+    for i in range(CONNECTIONS):
+        s = socket.create_connection(("127.0.0.1", port))
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        start = time.time()
+        s.sendall(
+            socks5_util.GreetingRequest.encode(
+                {
+                    "version": constants.SOCKS5_VERSION,
+                    "number_methods": 1,
+                    "methods": [constants.NO_AUTH],
+                },
+            ) + socks5_util.Socks5Request.encode(
+                {
+                    "version": constants.SOCKS5_VERSION,
+                    "command": constants.CONNECT,
+                    "reserved": constants.SOCKS5_RESERVED,
+                    "address_type": constants.IP_4,
+                    "address": "127.0.0.1",
+                    "port": destination_port,
+                },
+            )
+        )
+        response = recv_all(s, RESPONSE_HEADER_SIZE)
+        connects.append(time.time() - start)
+        if ord(response[3]) != constants.SUCCESS:
+            raise RuntimeError("connect failed")
+
+        for j in range(REQUESTS):
+            start = time.time()
+            s.sendall("\0" * REQUEST_SIZE)
+            recv_all(s, RESPONSE_SIZE)
+            requests.append(time.time() - start)
+        s.close()
+    return median(connects), median(requests)
+
+
+## Hops benchmark.
+#
+# Latency of connecting and of requests through paths of every number of
+# hops, on loopback. Every hop adds a round trip of its own, so latency
+# grows with hops, but no hop may stall.
+#
+class HopsBenchmark(unittest.TestCase):
+
+    ## Latency from least to most hops.
+    def test_latency(self):
+        ports = [free_port() for i in range(max(HOPS))]
+        destination = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        destination.bind(("127.0.0.1", 0))
+        destination.listen(CONNECTIONS)
+        destination_port = destination.getsockname()[1]
+
+        pids = [
+            fork(lambda: run_nodes(ports)),
+            fork(lambda: run_destination(destination)),
+        ]
+        destination.close()
+        latencies = []
+        try:
+            for hops in HOPS:
+                path = {}
+                for i in range(hops):
+                    path[str(i + 1)] = {
+                        "name": "127.0.0.1:%d" % ports[i],
+                        "address": "127.0.0.1",
+                        "port": ports[i],
+                        "key": KEY,
+                    }
+                port = free_port()
+                entry = fork(lambda: run_entry(port, path))
+                try:
+                    time.sleep(0.5)
+                    latencies.append(measure(port, destination_port))
+                finally:
+                    os.kill(entry, signal.SIGTERM)
+                    os.waitpid(entry, 0)
+                sys.stderr.write(
+                    "\n%d hops: %.2f ms connect, %.2f ms per request" % (
+                        hops,
+                        latencies[-1][0] * 1e3,
+                        latencies[-1][1] * 1e3,
+                    )
+                )
+        finally:
+            for pid in pids:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+        sys.stderr.write(
+            "\n%.2f ms per request per additional hop\n" % (
+                (latencies[-1][1] - latencies[0][1]) /
+                (max(HOPS) - min(HOPS)) * 1e3,
+            )
+        )
+        self.assertLess(latencies[-1][1], MAX_REQUEST_LATENCY)
+
+
+if __name__ == "__main__":
+    unittest.main()
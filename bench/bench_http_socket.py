@@ -0,0 +1,192 @@
+#!/usr/bin/python
+## @package onion_routing.bench.bench_http_socket
+# Benchmark of registry requests per second.
+## @file bench_http_socket.py
+# Implementation of @ref onion_routing.bench.bench_http_socket
+#
+
+import os
+import signal
+import socket
+import sys
+import time
+import unittest
+
+from common import constants
+from common.async import async_server
+from common.async import event_object
+from common.pollables import listener_socket
+from common.utilities import buffer_util
+from common.utilities import cache_util
+from common.utilities import directory_util
+from common.utilities import http_util
+from common.utilities import router_util
+from registry.pollables import http_socket
+
+
+## Requests of every kind of connection.
+REQUESTS = 4000
+
+## Requests sent at once on a pipelined connection.
+PIPELINE = 32
+
+## Nodes in registry.
+NODES = 10
+
+## Min ratio between requests per second of pipelined connection and of
+# a connection per request.
+#
+MIN_SPEEDUP = 2
+
+## Request of directory.
+REQUEST = "GET /nodes HTTP/1.1\r\nHost: registry\r\n\r\n"
+
+## Request of directory which closes connection.
+CLOSE_REQUEST = (
+    "GET /nodes HTTP/1.1\r\nHost: registry\r\nConnection: close\r\n\r\n"
+)
+
+
+## Run registry until SIGTERM.
+# @param address (tuple) address of registry.
+# @param base (optional, str) directory of static files.
+# @param socket_type (optional, class) type of accepted connections.
+#
+def run_registry(
+    address,
+    base=constants.DEFAULT_BASE_DIRECTORY,
+    socket_type=http_socket.HttpSocket,
+):
+    registry = {}
+    for i in range(NODES):
+        name = "127.0.0.1:%d" % (9000 + i)
+        registry[name] = {
+            "name": name,
+            "address": "127.0.0.1",
+            "port": 9000 + i,
+            "key": i,
+            "capacity": 100,
+            "load": 0,
+        }
+    app_context = {
+        "poll_object": event_object.PollEvent,
+        "timeout": -1,
+        "max_connections": 4096,
+        "max_buffer_size": constants.DEFAULT_BUFFER_SIZE,
+        "base": base,
+        "registry": registry,
+        "directory": directory_util.create_directory(),
+        "assets": cache_util.AssetCache(constants.ASSET_CACHE_SIZE),
+        "router": router_util.Router(
+            [router_util.load(s) for s in constants.SERVICES],
+        ),
+        "nodes": {},
+    }
+    server = async_server.AsyncServer(app_context)
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.close_server())
+    server.add_listener(
+        listener_socket.Listener,
+        address[0],
+        address[1],
+        listener_type=socket_type,
+    )
+    server.run()
+
+
+## Recieve responses.
+# @param s (socket) connection to registry.
+# @param buffer (Buffer) recieved bytes which were not parsed.
+# @param parser (HttpParser) parser of responses.
+# @param count (int) number of responses.
+#
+def recv_responses(
+    s,
+    buffer,
+    parser,
+    count,
+):
+    while count:
+        if (
+            parser.recv_first_line(buffer) is not None and
+            parser.recv_headers(buffer, set()) and
+            (parser.recv_content(buffer) or True) and
+            parser.state == constants.PARSE_DONE
+        ):
+            if parser.first_line[1] != "200":
+                raise RuntimeError("status %s" % parser.first_line[1])
+            parser.reset()
+            count -= 1
+            continue
+        if not buffer.recv_into(s, 64 * 1024):
+            raise RuntimeError("registry closed connection")
+
+
+## Measure requests per second.
+# @param address (tuple) address of registry.
+# @param pipeline (int) requests sent at once on a connection, None for
+# a connection per request.
+# @returns (float) requests per second.
+#
+def measure(
+    address,
+    pipeline,
+):
+    buffer = buffer_util.Buffer()
+    parser = http_util.HttpParser()
+    start = time.time()
+    if pipeline is None:
+        for i in range(REQUESTS):
+            s = socket.create_connection(address)
+            s.sendall(CLOSE_REQUEST)
+            recv_responses(s, buffer, parser, 1)
+            s.close()
+    else:
+        s = socket.create_connection(address)
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        for i in range(REQUESTS // pipeline):
+            s.sendall(REQUEST * pipeline)
+            recv_responses(s, buffer, parser, pipeline)
+        s.close()
+    return REQUESTS / (time.time() - start)
+
+
+## Http Socket benchmark.
+#
+# Persistent connections save a connect and accept per request, and
+# pipelined requests save a round trip per request.
+#
+class HttpSocketBenchmark(unittest.TestCase):
+
+    ## Requests per second by kind of connection.
+    def test_requests_per_second(self):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.bind(("127.0.0.1", 0))
+        address = s.getsockname()
+        s.close()
+        pid = os.fork()
+        if not pid:
+            try:
+                run_registry(address)
+            finally:
+                os._exit(0)
+        try:
+            time.sleep(0.5)
+            results = []
+            for name, pipeline in (
+                ("connection per request", None),
+                ("persistent", 1),
+                ("pipelined", PIPELINE),
+            ):
+                results.append(measure(address, pipeline))
+                sys.stderr.write(
+                    "\n%22s: %.0f requests/s" % (name, results[-1])
+                )
+            sys.stderr.write("\n")
+        finally:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+        self.assertGreater(results[2], results[0] * MIN_SPEEDUP)
+
+
+if __name__ == "__main__":
+    unittest.main()
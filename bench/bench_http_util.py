@@ -0,0 +1,84 @@
+#!/usr/bin/python
+## @package onion_routing.bench.bench_http_util
+# Benchmark of parsing headers followed by content.
+## @file bench_http_util.py
+# Implementation of @ref onion_routing.bench.bench_http_util
+#
+
+import sys
+import timeit
+import unittest
+
+from common.utilities import buffer_util
+from common.utilities import http_util
+
+
+## Bytes of content recieved along with the headers.
+CONTENT_SIZES = (0, 64 * 1024, 4 * 1024 * 1024)
+
+## Header lines of message.
+HEADERS = 20
+
+## Parses measured for every content size.
+ITERATIONS = 2000
+
+## Max ratio between parse cost with most and least content.
+MAX_RATIO = 5
+
+
+## Measure cost of parsing headers.
+# @param content_size (int) bytes of content after headers.
+# @returns (float) seconds of parsing first line and headers.
+#
+# Content is full of empty lines, so a parser which scans past the
+# headers pays for every one of them.
+#
+def measure(content_size):
+    message = "POST / HTTP/1.1\r\n%sContent-Length: %d\r\n\r\n%s" % (
+        "".join("X-Header-%d: value\r\n" % i for i in range(HEADERS)),
+        content_size,
+        "\r\n" * (content_size // 2),
+    )
+    buffer = buffer_util.Buffer()
+    buffer.append(message)
+    parser = http_util.HttpParser()
+
+    def parse():
+        parser.reset()
+        parser.recv_first_line(buffer)
+        parser.recv_headers(buffer, set(["Host"]))
+
+    def restore():
+        buffer.clear()
+        buffer.append(message)
+
+    total = 0.0
+    for i in range(ITERATIONS):
+        restore()
+        total += timeit.timeit(parse, number=1)
+    return total / ITERATIONS
+
+
+## Http Parser benchmark.
+#
+# Cost of headers must not grow with the content recieved after them.
+#
+class HttpParserBenchmark(unittest.TestCase):
+
+    ## Parse cost from least to most content.
+    def test_headers_with_content(self):
+        costs = []
+        for content_size in CONTENT_SIZES:
+            costs.append(measure(content_size))
+            sys.stderr.write(
+                "\n%8d bytes of content: %.1f us per headers" % (
+                    content_size,
+                    costs[-1] * 1e6,
+                )
+            )
+        sys.stderr.write("\n")
+        self.assertLess(costs[-1], costs[0] * MAX_RATIO)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,323 @@
+#!/usr/bin/python
+## @package onion_routing.bench.bench_onion_workers
+# Benchmark of onion node throughput by number of worker processes.
+## @file bench_onion_workers.py
+# Implementation of @ref onion_routing.bench.bench_onion_workers
+#
+
+import multiprocessing
+import os
+import select
+import signal
+import socket
+import sys
+import time
+import unittest
+
+from common import constants
+from common.async import async_server
+from common.async import event_object
+from common.utilities import encryption_util
+from common.utilities import socks5_util
+from onion.pollables import onion_node
+
+
+## Numbers of worker processes.
+WORKERS = (1, 2, 4)
+
+## Clients streaming through the node at once.
+CLIENTS = 8
+
+## Bytes sent by every client.
+CLIENT_BYTES = 16 * 1024 * 1024
+
+## Secret key of node.
+KEY = 7
+
+## Probes connected to the node while its load is read.
+PROBES = 4
+
+## Min speedup of workers over one worker per worker, when every worker
+# and client have a core of their own.
+#
+MIN_SPEEDUP_PER_WORKER = 0.6
+
+## Size of socks5 connection response.
+RESPONSE_SIZE = 10
+
+
+## Free port of loopback.
+# @returns (int) port.
+#
+def free_port():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+## Fork a process.
+# @param target (callable) function run by child, which then exits.
+# @returns (int) pid of child.
+#
+def fork(target):
+    pid = os.fork()
+    if pid:
+        return pid
+    try:
+        target()
+    finally:
+        os._exit(0)
+
+
+## Run onion node worker.
+# @param app_context (dict) application context shared by workers.
+# @param port (int) port of node.
+# @param worker (int) index of worker.
+#
+def run_worker(
+    app_context,
+    port,
+    worker,
+):
+    app_context = dict(app_context, worker=worker)
+    server = async_server.AsyncServer(app_context)
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.close_server())
+    server.add_listener(onion_node.OnionNode, "127.0.0.1", port)
+    server.run()
+
+
+## Run sink which reads all connections until closed.
+# @param listener (socket) listening socket.
+# @param done (int) fd to write total bytes to once all clients closed.
+#
+def run_sink(
+    listener,
+    done,
+):
+    connections = []
+    total = 0
+    closed = 0
+    while closed < CLIENTS:
+        readable = select.select([listener] + connections, [], [])[0]
+        for s in readable:
+            if s is listener:
+                connections.append(listener.accept()[0])
+                continue
+            data = s.recv(1024 * 1024)
+            total += len(data)
+            if not data:
+                s.close()
+                connections.remove(s)
+                closed += 1
+    os.write(done, "%d\n" % total)
+
+
+## Probe node.
+# @param port (int) port of node.
+# @returns (socket) connection which sent a greeting and recieved its
+# response only, as @ref entry.pollables.probe_socket.ProbeSocket does.
+#
+def probe(port):
+    s = socket.create_connection(("127.0.0.1", port))
+    s.sendall(
+        encryption_util.encrypt(
+            socks5_util.GreetingRequest.encode(
+                {
+                    "version": constants.SOCKS5_VERSION,
+                    "number_methods": 1,
+                    "methods": [constants.NO_AUTH],
+                },
+            ),
+            KEY,
+        )
+    )
+    response = ""
+    while len(response) < 2:
+        data = s.recv(2 - len(response))
+        if not data:
+            raise RuntimeError("node closed probe")
+        response += data
+    return s
+
+
+## Run client.
+# @param port (int) port of node.
+# @param sink_port (int) port of sink.
+# @param ready (int) fd to write a byte to once connected through node.
+# @param go (int) fd to read a byte from before sending.
+#
+def run_client(
+    port,
+    sink_port,
+    ready,
+    go,
+):
+    s = socket.create_connection(("127.0.0.1", port))
+    s.sendall(
+        encryption_util.encrypt(
+            socks5_util.GreetingRequest.encode(
+                {
+                    "version": constants.SOCKS5_VERSION,
+                    "number_methods": 1,
+                    "methods": [constants.NO_AUTH],
+                },
+            ) + socks5_util.Socks5Request.encode(
+                {
+                    "version": constants.SOCKS5_VERSION,
+                    "command": constants.CONNECT,
+                    "reserved": constants.SOCKS5_RESERVED,
+                    "address_type": constants.IP_4,
+                    "address": "127.0.0.1",
+                    "port": sink_port,
+                },
+            ),
+            KEY,
+        )
+    )
+    response = ""
+    while len(response) < 2 + RESPONSE_SIZE:
+        data = s.recv(2 + RESPONSE_SIZE - len(response))
+        if not data:
+            raise RuntimeError("node closed connection")
+        response += data
+    os.write(ready, "\0")
+    os.read(go, 1)
+
+    block = "\0" * (1024 * 1024)
+    for i in range(CLIENT_BYTES // len(block)):
+        s.sendall(block)
+    s.close()
+
+
+## Measure throughput of node.
+# @param workers (int) number of worker processes.
+# @returns (float) bytes per second relayed by node.
+#
+# Clients connect through the node first, load of node, the sum of
+# loads of its workers, must then be the number of clients, while
+# PROBES probes which only greeted the node are connected too.
+#
+def measure(workers):
+    port = free_port()
+    app_context = {
+        "poll_object": event_object.PollEvent,
+        "timeout": -1,
+        "max_connections": 4096,
+        "max_buffer_size": constants.DEFAULT_BUFFER_SIZE,
+        "key": KEY,
+        "loads": multiprocessing.RawArray("l", workers),
+        "workers": workers,
+        "register": False,
+        "reuse_port": True,
+    }
+    sink = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sink.bind(("127.0.0.1", 0))
+    sink.listen(CLIENTS)
+    sink_port = sink.getsockname()[1]
+    done_read, done_write = os.pipe()
+    ready_read, ready_write = os.pipe()
+    go_read, go_write = os.pipe()
+
+    pids = [
+        fork(lambda: run_worker(app_context, port, worker))
+        for worker in range(workers)
+    ]
+    try:
+        time.sleep(0.5)
+        sink_pid = fork(lambda: run_sink(sink, done_write))
+        sink.close()
+        clients = []
+        for i in range(CLIENTS):
+            clients.append(
+                fork(
+                    lambda: run_client(
+                        port,
+                        sink_port,
+                        ready_write,
+                        go_read,
+                    )
+                )
+            )
+        for i in range(CLIENTS):
+            os.read(ready_read, 1)
+        probes = [probe(port) for i in range(PROBES)]
+        load = sum(app_context["loads"])
+        for s in probes:
+            s.close()
+
+        start = time.time()
+        os.write(go_write, "\0" * CLIENTS)
+        total = int(os.fdopen(done_read).readline())
+        seconds = time.time() - start
+        for pid in clients + [sink_pid]:
+            os.waitpid(pid, 0)
+    finally:
+        for pid in pids:
+            os.kill(pid, signal.SIGTERM)
+        for pid in pids:
+            os.waitpid(pid, 0)
+    if load != CLIENTS:
+        raise AssertionError(
+            "load %d of %d clients and %d probes" % (load, CLIENTS, PROBES)
+        )
+    if total != CLIENTS * CLIENT_BYTES:
+        raise AssertionError("sink recieved %d bytes" % total)
+    return total / seconds
+
+
+## Onion workers benchmark.
+#
+# Throughput should grow with workers while there are enough cores, this
+# is checked for every number of workers for which every worker and
+# client can have its own core, the others are reported as not checked.
+#
+@unittest.skipUnless(hasattr(socket, "SO_REUSEPORT"), "no SO_REUSEPORT")
+class OnionWorkersBenchmark(unittest.TestCase):
+
+    ## Throughput from least to most workers.
+    def test_throughput(self):
+        cores = multiprocessing.cpu_count()
+        throughputs = []
+        failures = []
+        skipped = []
+        for workers in WORKERS:
+            throughputs.append(measure(workers))
+            speedup = throughputs[-1] / throughputs[0]
+            min_speedup = MIN_SPEEDUP_PER_WORKER * workers
+            if workers == WORKERS[0]:
+                result = "baseline"
+            elif cores < workers + CLIENTS:
+                result = "not checked, needs %d cores, has %d" % (
+                    workers + CLIENTS,
+                    cores,
+                )
+                skipped.append("%d workers %s" % (workers, result))
+            elif speedup < min_speedup:
+                result = "FAILED, speedup %.2f below %.2f" % (
+                    speedup,
+                    min_speedup,
+                )
+                failures.append("%d workers %s" % (workers, result))
+            else:
+                result = "ok, speedup %.2f of min %.2f" % (
+                    speedup,
+                    min_speedup,
+                )
+            sys.stderr.write(
+                "\n%d workers: %.1f MB/s, %s" % (
+                    workers,
+                    throughputs[-1] / 1e6,
+                    result,
+                )
+            )
+        sys.stderr.write("\n")
+        if failures:
+            self.fail("; ".join(failures))
+        if len(skipped) == len(WORKERS) - 1:
+            self.skipTest("; ".join(skipped))
+
+
+if __name__ == "__main__":
+    unittest.main()
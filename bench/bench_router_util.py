@@ -0,0 +1,135 @@
+#!/usr/bin/python
+## @package onion_routing.bench.bench_router_util
+# Benchmark of accept to first byte latency of registry under connection
+# churn.
+## @file bench_router_util.py
+# Implementation of @ref onion_routing.bench.bench_router_util
+#
+
+import importlib
+import os
+import signal
+import socket
+import sys
+import time
+import unittest
+
+from bench import bench_http_socket
+from common import constants
+from registry.pollables import http_socket
+from registry.services import base_service
+
+
+## Connections opened by every measure, one request each.
+CONNECTIONS = 2000
+
+## Max ratio between median latency of router and of per connection
+# service discovery.
+#
+MAX_RATIO = 1.1
+
+
+## Http Socket with per connection service discovery.
+#
+# Connection setup as it was before @ref common.utilities.router_util:
+# every accepted connection imported the modules of all services and
+# built a dict of them. Requests are still routed by the router.
+#
+class DiscoverySocket(http_socket.HttpSocket):
+
+    ## Constructor.
+    # @param socket (socket) the wrapped socket.
+    # @param state (int) state of HttpSocket.
+    # @param app_context (dict) application context.
+    #
+    def __init__(
+        self,
+        socket,
+        state,
+        app_context,
+    ):
+        super(DiscoverySocket, self).__init__(
+            socket,
+            state,
+            app_context,
+        )
+        for service in constants.SERVICES:
+            importlib.import_module(service.rsplit(".", 1)[0])
+
+        ## SERVICES dict for all supported services.
+        self.SERVICES = {
+            s.NAME: s for s in base_service.BaseService.__subclasses__()
+        }
+
+
+## Measure latency of connections.
+# @param address (tuple) address of registry.
+# @returns (tuple) seconds from connect to first byte of every connection
+# sorted, connections per second.
+#
+def measure(address):
+    latencies = []
+    start = time.time()
+    for i in range(CONNECTIONS):
+        connected = time.time()
+        s = socket.create_connection(address)
+        s.sendall(bench_http_socket.CLOSE_REQUEST)
+        data = s.recv(64 * 1024)
+        latencies.append(time.time() - connected)
+        while data:
+            data = s.recv(64 * 1024)
+        s.close()
+    seconds = time.time() - start
+    return sorted(latencies), CONNECTIONS / seconds
+
+
+## Router benchmark.
+#
+# A connection which is closed after a single request pays the setup of
+# the socket on every request, services are found once at startup by the
+# router instead of on every accept.
+#
+class RouterBenchmark(unittest.TestCase):
+
+    ## Accept to first byte latency by connection setup.
+    def test_first_byte_under_churn(self):
+        results = {}
+        for socket_type in (DiscoverySocket, http_socket.HttpSocket):
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.bind(("127.0.0.1", 0))
+            address = s.getsockname()
+            s.close()
+            pid = os.fork()
+            if not pid:
+                try:
+                    bench_http_socket.run_registry(
+                        address,
+                        socket_type=socket_type,
+                    )
+                finally:
+                    os._exit(0)
+            try:
+                time.sleep(0.5)
+                latencies, rate = measure(address)
+            finally:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            results[socket_type] = latencies[len(latencies) // 2]
+            sys.stderr.write(
+                "\n%15s: %.0f connections/s, first byte p50 %.0f us, "
+                "p99 %.0f us" % (
+                    socket_type.__name__,
+                    rate,
+                    latencies[len(latencies) // 2] * 1e6,
+                    latencies[len(latencies) * 99 // 100] * 1e6,
+                )
+            )
+        sys.stderr.write("\n")
+        self.assertLess(
+            results[http_socket.HttpSocket],
+            results[DiscoverySocket] * MAX_RATIO,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
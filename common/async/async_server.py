@@ -11,6 +11,7 @@ import select
 import traceback
 
 from common.async import event_object
+from common.async import timer_queue
 from common.utilities import util
 
 
@@ -37,18 +38,79 @@ class AsyncServer(object):
         self._app_context = app_context
 
         self._app_context["socket_data"] = self._socket_data
+        self._app_context["add_socket"] = self.add_socket
 
-    ## Create new poller.
-    # @returns (dict) key - socket fd, value - event.
-    # Use event_object to create new poller and handle all events
-    # of all sockets.
+        ## Timers scheduled by the server and its pollables.
+        self._timers = timer_queue.TimerQueue()
+        self._app_context["timers"] = self._timers
+
+        ## Poller which holds the registrations of all sockets.
+        self._poller = self._poll_object()
+
+        ## Events each socket is registered with in @ref _poller.
+        # key - pollable, value - registered event.
+        #
+        self._registered_events = {}
+
+        ## Pollables whose events or closing state may have changed since
+        # last poll.
+        # Pollables which had events are added by the server, pollables
+        # changed by others or by timers add themselves with their
+        # mark_dirty(), see @ref common.pollables.pollable.Pollable.
+        #
+        self._dirty = set()
+        self._app_context["dirty_sockets"] = self._dirty
+
+    ## Register socket in poller.
+    # @param entry (@ref common.pollables.pollable) wrapper of socket.
+    #
+    def _register_socket(
+        self,
+        entry,
+    ):
+        event = entry.get_events()
+        self._poller.register(entry.socket, event)
+        self._registered_events[entry] = event
+        self._dirty.add(entry)
+
+    ## Update poller.
+    # Only sockets in @ref _dirty are visited, so cost of update does not
+    # depend on the number of idle sockets:
+    # - Remove sockets which are ready for closing.
+    # - Modify registration of sockets whose events changed.
+    # Sockets which were removed already are ignored.
     #
-    def _create_poller(self):
-        poller = self._poll_object()
-        for fd in self._socket_data:
-            entry = self._socket_data[fd]
-            poller.register(entry.socket, entry.get_events())
-        return poller
+    def _update_poller(self):
+        while self._dirty:
+            entry = self._dirty.pop()
+            registered = self._registered_events.get(entry)
+            if registered is None:
+                continue
+            if entry.is_closing():
+                self._remove_socket(entry)
+                continue
+            event = entry.get_events()
+            if event != registered:
+                self._poller.modify(entry.socket, event)
+                self._registered_events[entry] = event
+
+    ## Get poll timeout.
+    # @returns (int) milliseconds to wait for events.
+    #
+    # Block until next timer deadline, limited by the configured timeout
+    # (negative timeout means no limit).
+    # While terminating, sockets are closed on every iteration so the poller
+    # must not block.
+    #
+    def _get_timeout(self):
+        if self.terminate:
+            return 0
+        timeout = self._timers.timeout()
+        if timeout is None:
+            return self._timeout
+        if self._timeout < 0:
+            return timeout
+        return min(timeout, self._timeout)
 
     ## Remove socket.
     # @param entry (@ref common.pollables.pollable) wrapper of socket.
@@ -61,17 +123,20 @@ class AsyncServer(object):
         logging.debug("remove %s" % entry)
 
         entry.on_close()
+        if self._registered_events.pop(entry, None) is not None:
+            self._poller.unregister(entry.socket)
         del self._socket_data[entry.fileno()]
         entry.close()
 
     ## Terminate the server.
     # Enters common.pollables.pollable.Pollable.on_close()
-    # state for all pollables in socket data.
+    # state for all pollables in socket data, and marks all of them dirty.
     #
     def _terminate(self):
         logging.info("Terminating")
         for entry in self._socket_data.values():
             entry.on_close()
+        self._dirty.update(self._socket_data.values())
 
     ## Close server.
     def close_server(self):
@@ -101,14 +166,34 @@ class AsyncServer(object):
             listener_type,
         )
         self._socket_data[listener.fileno()] = listener
+        self._register_socket(listener)
         return listener
 
     ## Add @ref onion_routing.common.pollables.pollable to socket data.
+    # Pollables add sockets they create with add_socket of app_context, so
+    # they are registered in the poller right away.
+    #
     def add_socket(
         self,
         async_socket,
     ):
         self._socket_data[async_socket.fileno()] = async_socket
+        self._register_socket(async_socket)
+
+    ## Add timer.
+    # @param delay (float) seconds until callback is called.
+    # @param callback (callable) function to call.
+    # @param interval (optional, float) seconds between calls of a
+    # repeating timer.
+    # @returns (@ref common.async.timer_queue.Timer) new timer.
+    #
+    def add_timer(
+        self,
+        delay,
+        callback,
+        interval=None,
+    ):
+        return self._timers.add(delay, callback, interval)
 
     ## Main loop - running server.
     def run(self):
@@ -116,12 +201,11 @@ class AsyncServer(object):
             try:
                 if self.terminate:
                     self._terminate()
-                for entry in self._socket_data.values()[:]:
-                    if entry.is_closing():
-                        self._remove_socket(entry)
+                self._update_poller()
                 try:
-                    for fd, event in self._create_poller().poll(self._timeout):
+                    for fd, event in self._poller.poll(self._get_timeout()):
                         entry = self._socket_data[fd]
+                        self._dirty.add(entry)
                         logging.debug("event %d: %s" % (event, entry))
                         try:
                             if (
@@ -149,6 +233,8 @@ class AsyncServer(object):
                 except select.error as e:
                     if e[0] != errno.EINTR:
                         raise
+                self._timers.run()
             except Exception as e:
                 logging.critical(traceback.format_exc())
                 self._terminate()
+        self._poller.close()
@@ -5,6 +5,7 @@
 # Implementation of @ref onion_routing.common.async.event_object
 #
 
+import errno
 import os
 import select
 
@@ -35,12 +36,30 @@ class BaseEvent(object):
     def register(self, fd, event):
         raise NotImplementedError()
 
+    ## Modify events of registered socket.
+    # @param fd (int) socket file descriptor.
+    # @param event (int) event.
+    #
+    def modify(self, fd, event):
+        raise NotImplementedError()
+
+    ## Unregister socket.
+    # @param fd (int) socket file descriptor.
+    #
+    def unregister(self, fd):
+        raise NotImplementedError()
+
     ## Poll for events.
-    # @param timeout (int) poll timeout.
+    # @param timeout (int) poll timeout in milliseconds, negative timeout
+    # blocks until an event arrives.
     #
     def poll(self, timeout):
         raise NotImplementedError()
 
+    ## Close event object.
+    def close(self):
+        pass
+
 
 if os.name != "nt":
     ## Poll Event.
@@ -63,6 +82,19 @@ if os.name != "nt":
         def register(self, fd, event):
             self._poller.register(fd, event)
 
+        ## Modify events of registered socket.
+        # @param fd (int) socket file descriptor.
+        # @param event (int) event.
+        #
+        def modify(self, fd, event):
+            self._poller.modify(fd, event)
+
+        ## Unregister socket.
+        # @param fd (int) socket file descriptor.
+        #
+        def unregister(self, fd):
+            self._poller.unregister(fd)
+
         ## Poll for events.
         # @param timeout (int) poll timeout.
         # @returns poll dict (dict) poll dict.
@@ -71,6 +103,64 @@ if os.name != "nt":
             return self._poller.poll(timeout)
 
 
+if hasattr(select, "epoll"):
+    ## Epoll Event.
+    #
+    # Epoll event created only on linux machines.
+    # Registrations are kept by the kernel between polls, so waiting costs
+    # only the number of ready sockets and not the number of registered ones.
+    #
+    class EpollEvent(BaseEvent):
+        ## Name of event.
+        NAME = "Epoll"
+
+        ## Constructor.
+        def __init__(self):
+            super(EpollEvent, self).__init__()
+            self._poller = select.epoll()
+
+        ## Register new socket.
+        # @param fd (int) socket file descriptor.
+        # @param event (int) event.
+        #
+        def register(self, fd, event):
+            self._poller.register(fd, event)
+
+        ## Modify events of registered socket.
+        # @param fd (int) socket file descriptor.
+        # @param event (int) event.
+        #
+        def modify(self, fd, event):
+            self._poller.modify(fd, event)
+
+        ## Unregister socket.
+        # @param fd (int) socket file descriptor.
+        #
+        def unregister(self, fd):
+            self._poller.unregister(fd)
+
+        ## Poll for events.
+        # @param timeout (int) poll timeout in milliseconds.
+        # @returns poll dict (dict) poll dict.
+        #
+        # epoll expects seconds and raises IOError when interrupted,
+        # convert both so it behaves like poll object.
+        #
+        def poll(self, timeout):
+            try:
+                return self._poller.poll(
+                    timeout / 1000.0 if timeout >= 0 else -1,
+                )
+            except IOError as e:
+                if e.errno != errno.EINTR:
+                    raise
+                return []
+
+        ## Close event object.
+        def close(self):
+            self._poller.close()
+
+
 ## Select Event.
 #
 # Select event.
@@ -92,12 +182,26 @@ class SelectEvent(BaseEvent):
     def register(self, fd, event):
         self._fd_dict[fd] = event
 
+    ## Modify events of registered socket.
+    # @param fd (int) socket file descriptor.
+    # @param event (int) event.
+    #
+    def modify(self, fd, event):
+        self._fd_dict[fd] = event
+
+    ## Unregister socket.
+    # @param fd (int) socket file descriptor.
+    #
+    def unregister(self, fd):
+        del self._fd_dict[fd]
+
     ## Poll for events.
-    # @param timeout (int) poll timeout.
+    # @param timeout (int) poll timeout in milliseconds.
     # @returns poll dict (dict) poll dict.
     #
     # Using select lists to identify different events, and builds
     # a copy of poll dict.
+    # select expects seconds and None for blocking.
     #
     def poll(self, timeout):
         rlist, wlist, xlist = [], [], []
@@ -110,7 +214,12 @@ class SelectEvent(BaseEvent):
             if self._fd_dict[fd] & SelectEvent.POLLOUT:
                 wlist.append(fd)
 
-        r, w, x = select.select(rlist, wlist, xlist, timeout)
+        r, w, x = select.select(
+            rlist,
+            wlist,
+            xlist,
+            timeout / 1000.0 if timeout >= 0 else None,
+        )
 
         poll_dict = {}
         for s in r + w + x:
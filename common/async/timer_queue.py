@@ -0,0 +1,131 @@
+#!/usr/bin/python
+## @package onion_routing.common.async.timer_queue
+# Timers for scheduling work from the async server loop.
+## @file timer_queue.py
+# Implementation of @ref onion_routing.common.async.timer_queue
+#
+
+import heapq
+import itertools
+import logging
+import time
+import traceback
+
+
+## Timer.
+#
+# Handle of a scheduled callback.
+#
+class Timer(object):
+
+    ## Constructor.
+    # @param deadline (float) time in which callback should be called.
+    # @param callback (callable) function to call.
+    # @param interval (optional, float) seconds between calls of a
+    # repeating timer.
+    #
+    def __init__(
+        self,
+        deadline,
+        callback,
+        interval=None,
+    ):
+        ## Time in which callback should be called.
+        self.deadline = deadline
+
+        ## Function to call.
+        self.callback = callback
+
+        ## Seconds between calls, None for a single call.
+        self.interval = interval
+
+        ## Whether timer was cancelled.
+        self.cancelled = False
+
+    ## Cancel timer.
+    def cancel(self):
+        self.cancelled = True
+
+    ## String representation.
+    def __repr__(self):
+        return "Timer object. deadline: %s, interval: %s." % (
+            self.deadline,
+            self.interval,
+        )
+
+
+## Timer Queue.
+#
+# Heap of timers ordered by deadline.
+# Used by @ref common.async.async_server to know how long it may block
+# waiting for events.
+#
+class TimerQueue(object):
+
+    ## Constructor.
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+
+    ## Add timer.
+    # @param delay (float) seconds until callback is called.
+    # @param callback (callable) function to call.
+    # @param interval (optional, float) seconds between calls of a
+    # repeating timer.
+    # @returns (@ref Timer) timer handle which can be cancelled.
+    #
+    def add(
+        self,
+        delay,
+        callback,
+        interval=None,
+    ):
+        timer = Timer(time.time() + delay, callback, interval)
+        self._push(timer)
+        return timer
+
+    ## Push timer into heap.
+    # @param timer (@ref Timer) timer to push.
+    #
+    # Counter keeps timers with equal deadlines in insertion order.
+    #
+    def _push(
+        self,
+        timer,
+    ):
+        heapq.heappush(
+            self._heap,
+            (timer.deadline, next(self._counter), timer),
+        )
+
+    ## Timeout until next timer.
+    # @returns (int) milliseconds until next deadline, None if no timers.
+    #
+    def timeout(self):
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        return max(0, int((self._heap[0][0] - time.time()) * 1000) + 1)
+
+    ## Run expired timers.
+    # Repeating timers are pushed back with their next deadline.
+    # Exception in a callback is logged and does not stop other timers.
+    #
+    def run(self):
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            deadline, counter, timer = heapq.heappop(self._heap)
+            if timer.cancelled:
+                continue
+            if timer.interval is not None:
+                timer.deadline = max(deadline + timer.interval, now)
+                self._push(timer)
+            try:
+                timer.callback()
+            except Exception:
+                logging.error(traceback.format_exc())
+
+    ## Number of pending timers.
+    def __len__(self):
+        return len(self._heap)
@@ -0,0 +1,112 @@
+#!/usr/bin/python
+## @package onion_routing.common.async.timer_wheel
+# Expiry of many keys which are refreshed often.
+## @file timer_wheel.py
+# Implementation of @ref onion_routing.common.async.timer_wheel
+#
+
+import logging
+import math
+import time
+import traceback
+
+
+## Timer Wheel.
+#
+# Hashed timing wheel: a ring of slots, each holding the keys which
+# expire when the wheel turns to it.
+# Adding, refreshing and removing a key moves it between slots in O(1),
+# and every tick only the keys of the current slot are visited, so keys
+# are never scanned periodically.
+# Keys expire between delay and delay + tick seconds after they were
+# added.
+#
+class TimerWheel(object):
+
+    ## Constructor.
+    # @param tick (float) seconds between turns of wheel.
+    # @param max_delay (float) max delay of key.
+    # @param callback (callable) called with every expired key.
+    #
+    def __init__(
+        self,
+        tick,
+        max_delay,
+        callback,
+    ):
+        ## Seconds between turns.
+        self._tick = tick
+
+        ## Function called with expired keys.
+        self._callback = callback
+
+        ## Slots of wheel, sets of keys.
+        self._slots = [
+            set() for i in range(int(math.ceil(max_delay / tick)) + 2)
+        ]
+
+        ## Slot of every key.
+        self._key_slots = {}
+
+        ## Index of current slot.
+        self._position = 0
+
+        ## Time of last turn.
+        self._time = time.time()
+
+    ## Add key, or refresh it if it was added before.
+    # @param key (object) hashable key.
+    # @param delay (float) seconds until key expires.
+    #
+    def add(
+        self,
+        key,
+        delay,
+    ):
+        ticks = int(math.ceil(delay / self._tick)) + 1
+        if ticks >= len(self._slots):
+            raise ValueError("delay %s is too long for wheel" % delay)
+        self.remove(key)
+        index = (self._position + ticks) % len(self._slots)
+        self._slots[index].add(key)
+        self._key_slots[key] = index
+
+    ## Remove key.
+    # @param key (object) hashable key, ignored if it was not added.
+    #
+    def remove(
+        self,
+        key,
+    ):
+        index = self._key_slots.pop(key, None)
+        if index is not None:
+            self._slots[index].discard(key)
+
+    ## Turn wheel to current time.
+    # Call callback with keys of every slot passed, exception in callback
+    # is logged and does not stop other keys from expiring.
+    #
+    def advance(self):
+        now = time.time()
+        while self._time + self._tick <= now:
+            self._time += self._tick
+            self._position = (self._position + 1) % len(self._slots)
+            expired = self._slots[self._position]
+            self._slots[self._position] = set()
+            for key in expired:
+                del self._key_slots[key]
+                try:
+                    self._callback(key)
+                except Exception:
+                    logging.error(traceback.format_exc())
+
+    ## Whether key is in wheel.
+    def __contains__(
+        self,
+        key,
+    ):
+        return key in self._key_slots
+
+    ## Number of keys.
+    def __len__(self):
+        return len(self._key_slots)
@@ -12,13 +12,26 @@ PACKAGE_VERSION = "0.0.0"
 
 
 ## Default timout.
-DEFAULT_TIMEOUT = 0
+# Maximum milliseconds to wait for events, negative waits until next event
+# or timer.
+#
+DEFAULT_TIMEOUT = -1
 ## Default base directory of files.
 DEFAULT_BASE_DIRECTORY = "files/"
 ## Default connection number for listeners.
 DEFAULT_CONNECTIONS_NUMBER = 10
 ## Default maximum size of buffer.
 DEFAULT_BUFFER_SIZE = 1024
+## Default max bytes of static files cached by registry.
+ASSET_CACHE_SIZE = 16 * 1024 * 1024
+## Max size of a static file cached by registry, larger files are sent
+# from disk.
+#
+ASSET_CACHE_MAX_FILE_SIZE = 1024 * 1024
+## Seconds a cached static file is served without checking it for changes.
+ASSET_CACHE_CHECK_INTERVAL = 1
+## Default maximum number of prebuilt circuits in entry node.
+DEFAULT_CIRCUIT_POOL_SIZE = 4
 
 
 ## Path of registry config file.
@@ -28,12 +41,82 @@ ONION_NODE_CONFIG = "onion/config.ini"
 ## Path of node client config file.
 ENTRY_NODE_CONFIG = "entry/config.ini"
 
-## The number of nodes in path to anonymize message.
+## The number of nodes in path to anonymize message, by default.
 OPTIMAL_NODES_IN_PATH = 3
+## Max number of nodes in path.
+MAX_NODES_IN_PATH = 8
 
 ## Time between every update of xml statistics file.
 XML_TIME_UPDATE = 1
 
+## Number of threads resolving host names.
+DNS_RESOLVER_THREADS = 4
+## Seconds a resolved address is kept in cache.
+DNS_CACHE_TTL = 300
+## Seconds a failed resolution is kept in cache.
+DNS_NEGATIVE_CACHE_TTL = 30
+
+## Version of nodes directory format, @ref common.utilities.directory_util.
+DIRECTORY_FORMAT = 3
+## Number of registry changes kept for directory diffs.
+DIRECTORY_LOG_SIZE = 1000
+## Number of node records encoded at once when directory is streamed.
+DIRECTORY_STREAM_BATCH = 100
+## Seconds registry holds a nodes request which waits for changes.
+DIRECTORY_WAIT_TIMEOUT = 30
+## Seconds between heartbeats of registered nodes.
+NODE_HEARTBEAT_INTERVAL = 10
+## Seconds without heartbeat after which registry removes a node.
+NODE_EXPIRY_TIMEOUT = 30
+## Seconds between checks of registry for expired nodes.
+NODE_EXPIRY_TICK = 1
+## Load of node is published in steps of its capacity divided by this.
+NODE_LOAD_STEPS = 10
+## Min seconds between forks of a worker process which died.
+WORKER_RESPAWN_DELAY = 1
+## Seconds between refreshes of the nodes directory in entry node.
+DIRECTORY_REFRESH_INTERVAL = 10
+
+## Seconds of recent browser connections the circuit pool is sized by.
+CIRCUIT_POOL_DEMAND_WINDOW = 10
+## Seconds between refills of the circuit pool.
+CIRCUIT_POOL_REFILL_INTERVAL = 1
+## Seconds in which a circuit is used for new streams.
+# Afterwards the circuit is closed once its last stream is closed.
+#
+CIRCUIT_POOL_MAX_AGE = 60
+## Number of streams sharing a circuit.
+CIRCUIT_MAX_STREAMS = 32
+## Seconds between attempts to take a circuit for browser connections
+# which wait for enough nodes.
+#
+CIRCUIT_PENDING_RETRY_INTERVAL = 1
+## Seconds a browser connection waits for a circuit before it is closed.
+CIRCUIT_PENDING_TIMEOUT = 30
+
+## Weight of a new sample in the moving averages of node measurements.
+NODE_STATS_ALPHA = 0.3
+## RTT of node, in seconds, which does not change its path weight.
+PATH_DEFAULT_RTT = 0.05
+## Throughput of node, in bytes per second, which does not change its
+# path weight.
+#
+PATH_DEFAULT_THROUGHPUT = 1 << 20
+## Min RTT of node, in seconds, lower measurements are rounded up.
+PATH_MIN_RTT = 0.001
+## Max factor by which measurements raise or lower path weight of node.
+PATH_WEIGHT_SPREAD = 10.0
+## Min bytes recieved by a stream for measuring throughput of its path.
+PATH_MIN_STREAM_BYTES = 64 << 10
+## Seconds between probes of every node by entry node.
+PROBE_INTERVAL = 30
+## Seconds between starts of queued probes.
+PROBE_TICK = 1
+## Max number of probes running at once.
+PROBE_MAX_CONCURRENT = 16
+## Seconds after which a probe fails.
+PROBE_TIMEOUT = 5
+
 
 ## Async server socket states for @ref common.async.async_server.
 # - ACTIVE: Used for all active sockets that are ready for reading/writing.
@@ -55,11 +138,14 @@ ASYNC_SERVER_STATES = (
 # - SEND_CONNECTION_REQUEST: Send socks5 connection response to client.
 # - PARTNER_STATE: Partner state when socket is used as TCP proxy
 #       after the end socks5 communication.
-# - CLIENT_SEND_GREETING: Send socks5 greeting to server.
+# - CLIENT_SEND_GREETING: Send socks5 greeting to server, followed by
+#       connection request unless server is the last node.
 # - CLIENT_RECV_GREETING: Recieve socks5 greeting response from server.
-# - CLIENT_SEND_CONNECTION_REQUEST: Send socks5 connection request to server.
 # - CLIENT_RECV_CONNECTION_REQUEST: Recieve socks5 connection
 #       response from server.
+# - CIRCUIT_STATE: Socks5 is established with all nodes, circuit carries
+#       cells of streams.
+# - STREAM_BEGIN: Waiting for the circuit to connect stream to destination.
 #
 SOCKS5_STATES = (
     RECV_GREETING,
@@ -69,9 +155,10 @@ SOCKS5_STATES = (
     PARTNER_STATE,
     CLIENT_SEND_GREETING,
     CLIENT_RECV_GREETING,
-    CLIENT_SEND_CONNECTION_REQUEST,
     CLIENT_RECV_CONNECTION_REQUEST,
-) = range(9)
+    CIRCUIT_STATE,
+    STREAM_BEGIN,
+) = range(10)
 
 
 ## HTTP socket states for @ref registry.pollables.http_socket.
@@ -92,6 +179,28 @@ HTTP_STATES = (
 ) = range(6)
 
 
+## HTTP parser states for @ref common.utilities.http_util.HttpParser.
+# - PARSE_FIRST_LINE: Parse request or status line.
+# - PARSE_HEADERS: Parse headers.
+# - PARSE_CONTENT: Parse content of Content-Length.
+# - PARSE_CHUNK_SIZE: Parse size line of chunk.
+# - PARSE_CHUNK_DATA: Parse data of chunk.
+# - PARSE_CHUNK_END: Parse CRLF after data of chunk.
+# - PARSE_TRAILERS: Parse trailers after last chunk.
+# - PARSE_DONE: Message is complete.
+#
+HTTP_PARSER_STATES = (
+    PARSE_FIRST_LINE,
+    PARSE_HEADERS,
+    PARSE_CONTENT,
+    PARSE_CHUNK_SIZE,
+    PARSE_CHUNK_DATA,
+    PARSE_CHUNK_END,
+    PARSE_TRAILERS,
+    PARSE_DONE,
+) = range(8)
+
+
 ## http client states for registering new
 ##     @ref onion.pollables.socks5_server
 ##     for @ref common.pollables.http_client.
@@ -103,6 +212,8 @@ HTTP_STATES = (
 # - UNREGISTERED: Node unregistered state.
 # - SEND_NODES: Sending a request to get connect nodes to registry.
 # - RECV_NODES: Recieving string representation of nodes dict.
+# - SEND_HEARTBEAT: Sending heartbeat of registered node.
+# - RECV_HEARTBEAT: Recieving response for heartbeat.
 #
 REGISTRY_STATES = (
     SEND_REGISTER,
@@ -113,7 +224,9 @@ REGISTRY_STATES = (
     UNREGISTERED,
     SEND_NODES,
     RECV_NODES,
-) = range(8)
+    SEND_HEARTBEAT,
+    RECV_HEARTBEAT,
+) = range(10)
 
 
 ## Socks5 supported version.
@@ -140,6 +253,12 @@ SUPPORTED_METHODS = (
 # server knows it should decrypt the encrypted messages.
 #
 MY_SOCKS_SIGNATURE = 0x80
+## Private method for socks5 protocol.
+# Sent to the last node, after greeting the connection carries cells of
+# streams as described in @ref common.utilities.cell_util instead of a
+# single socks5 connection.
+#
+MY_CELL_SIGNATURE = 0x81
 
 ## Socks5 Supported commands.
 # - CONNECT: Establish a TCP/IP stream connection.
@@ -159,6 +278,22 @@ ADDRESS_TYPE = (
     0x01,
 )
 
+## Cell commands.
+# - CELL_BEGIN: Connect stream to the address in payload, sent back with
+#       the socks5 reply as payload.
+# - CELL_DATA: Data of stream.
+# - CELL_END: Stream is closed.
+#
+CELL_COMMANDS = (
+    CELL_BEGIN,
+    CELL_DATA,
+    CELL_END,
+) = (
+    0x01,
+    0x02,
+    0x03,
+)
+
 ## Socks5 Replies used by server.
 # - SUCCESS: request granted.
 # - GENERAL_SERVER_FAILURE: general failure.
@@ -179,12 +314,32 @@ CRLF = "\r\n"
 ## Binary carriage return.
 CRLF_BIN = CRLF.encode("utf-8")
 
+## Seconds a HTTP connection is kept open without requests.
+HTTP_IDLE_TIMEOUT = 60
 ## Max number of headers in HTTP request.
 MAX_NUMBER_OF_HEADERS = 100
+## Max bytes of status line and headers of HTTP message.
+MAX_HEADER_SIZE = 8192
 ## Content type header.
 CONTENT_TYPE = "Content-Type"
 ## Content length header.
 CONTENT_LENGTH = "Content-Length"
+## Connection header.
+CONNECTION = "Connection"
+## Transfer-Encoding header.
+TRANSFER_ENCODING = "Transfer-Encoding"
+## ETag header.
+ETAG = "ETag"
+## If-None-Match header.
+IF_NONE_MATCH = "If-None-Match"
+## Last-Modified header.
+LAST_MODIFIED = "Last-Modified"
+## Accept-Encoding header.
+ACCEPT_ENCODING = "Accept-Encoding"
+## Content-Encoding header.
+CONTENT_ENCODING = "Content-Encoding"
+## Vary header.
+VARY = "Vary"
 ## Internal error header.
 INTERNAL_ERROR = "Internal Error"
 
@@ -194,15 +349,20 @@ MIME_MAPPING = {
     "png": "image/png",
     "txt": "text/plain",
     "css": "text/css",
+    "js": "application/javascript",
+    "xml": "text/xml",
+    "jpg": "image/jpeg",
+    "ico": "image/x-icon",
 }
 
-## Paths of all special services for @ref registry.pollables.http_socket.
+## Classes of all services for @ref registry.pollables.http_socket.
 SERVICES = [
-    "registry.services.register_service",
-    "registry.services.register_service",
-    "registry.services.unregister_service",
-    "registry.services.menu_service",
-    "registry.services.nodes_service",
+    "registry.services.register_service.RegisterService",
+    "registry.services.unregister_service.UnregisterService",
+    "registry.services.menu_service.MenuService",
+    "registry.services.nodes_service.NodesService",
+    "registry.services.heartbeat_service.HeartbeatService",
+    "registry.services.file_service.FileService",
 ]
 
 
@@ -216,6 +376,7 @@ XML_CONNECTION_LAYOUT = (
     "<Statistics>"
     "<connection_number>%s</connection_number>"
     "%s"
+    "%s"
     "</Statistics>"
 )
 
@@ -227,9 +388,20 @@ XML_CONNECTION_BLOCK_LAYOUT = (
     "<in>%s</in>"
     "<partner>%s</partner>"
     "<out>%s</out>"
+    "<ttfb>%s</ttfb>"
     "</connection>"
 )
 
+## Layout of every latency block of each measured node.
+XML_LATENCY_BLOCK_LAYOUT = (
+    "<latency>"
+    "<name>%s</name>"
+    "<handshake>%s</handshake>"
+    "<rtt>%s</rtt>"
+    "<throughput>%s</throughput>"
+    "</latency>"
+)
+
 ## Basic layout for xml file.
 XML_NODES_LAYOUT = (
     "<Statistics>"
@@ -243,5 +415,6 @@ XML_NODES_BLOCK_LAYOUT = (
     "<node>"
     "<address>%s</address>"
     "<port>%s</port>"
+    "<expires>%s</expires>"
     "</node>"
 )
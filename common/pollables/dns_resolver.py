@@ -0,0 +1,254 @@
+#!/usr/bin/python
+## @package onion_routing.common.pollables.dns_resolver
+# Asynchronous host name resolver used by the poller.
+## @file dns_resolver.py
+# Implementation of @ref onion_routing.common.pollables.dns_resolver
+#
+
+import collections
+import errno
+import fcntl
+import logging
+import os
+import Queue
+import socket
+import threading
+import time
+import traceback
+
+from common import constants
+from common.async import event_object
+from common.pollables import pollable
+from common.utilities import socks5_util
+
+
+## Dns Resolver.
+#
+# Host names are resolved by a pool of threads so that a slow resolution
+# never blocks the async server.
+# Threads report results through a pipe which is polled like any other
+# socket, and callbacks are called from the async server loop.
+# Results are kept in a cache for @ref common.constants.DNS_CACHE_TTL
+# seconds (failures for @ref common.constants.DNS_NEGATIVE_CACHE_TTL).
+# Threads write to the pipe under @ref _lock, so the pipe is never written
+# after @ref close().
+#
+class DnsResolver(pollable.Pollable):
+
+    ## Constructor.
+    # @param app_context (dict) application context.
+    # @param threads (optional, int) number of resolving threads.
+    #
+    def __init__(
+        self,
+        app_context,
+        threads=constants.DNS_RESOLVER_THREADS,
+    ):
+        read_fd, write_fd = os.pipe()
+        for fd in (read_fd, write_fd):
+            fcntl.fcntl(
+                fd,
+                fcntl.F_SETFL,
+                fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK,
+            )
+
+        ## Read end of pipe, threads write a byte on every result.
+        self._pipe = os.fdopen(read_fd, "rb", 0)
+
+        ## Write end of pipe.
+        self._write_fd = write_fd
+
+        ## State of resolver.
+        self._state = constants.ACTIVE
+
+        ## Application context.
+        self._app_context = app_context
+
+        ## Cache of resolved names.
+        # key - host name, value - (address or None, expiry time).
+        #
+        self._cache = {}
+
+        ## Names being resolved.
+        # key - host name, value - list of callbacks waiting for result.
+        #
+        self._pending = {}
+
+        ## Names waiting for a thread.
+        self._requests = Queue.Queue()
+
+        ## Results of threads waiting for the async server loop.
+        self._results = collections.deque()
+
+        ## Lock of @ref _closed and of writes to pipe.
+        self._lock = threading.Lock()
+
+        ## Whether pipe was closed.
+        self._closed = False
+
+        ## Number of resolving threads.
+        self._threads = threads
+
+        for i in range(threads):
+            thread = threading.Thread(target=self._worker)
+            thread.daemon = True
+            thread.start()
+
+    ## Thread main loop.
+    # Resolve requested names and wake up the async server through the pipe.
+    # Thread exits on a None request or once resolver is closed.
+    #
+    def _worker(self):
+        while True:
+            name = self._requests.get()
+            if name is None:
+                return
+            try:
+                address = socket.gethostbyname(name)
+            except Exception:
+                address = None
+            with self._lock:
+                if self._closed:
+                    return
+                self._results.append((name, address))
+                try:
+                    os.write(self._write_fd, "\0")
+                except OSError as e:
+                    if e.errno != errno.EAGAIN:
+                        return
+
+    ## Resolve host name.
+    # @param name (str) host name.
+    # @param callback (callable) called with address, None if failed.
+    #
+    # IP addresses and fresh cache entries call callback immediately,
+    # otherwise callback is called once a thread resolved the name.
+    #
+    def resolve(
+        self,
+        name,
+        callback,
+    ):
+        if socks5_util.validate_ip(name):
+            callback(name)
+            return
+        cached = self._cache.get(name)
+        if cached and cached[1] > time.time():
+            callback(cached[0])
+            return
+        self._request(name).append(callback)
+
+    ## Lookup host name without waiting.
+    # @param name (str) host name.
+    # @returns (str) address of name, None if it was not resolved yet.
+    #
+    # Expired cache entries are still returned while they are resolved
+    # again in the background.
+    #
+    def lookup(
+        self,
+        name,
+    ):
+        if socks5_util.validate_ip(name):
+            return name
+        cached = self._cache.get(name)
+        if not cached or cached[1] <= time.time():
+            self._request(name)
+        if cached:
+            return cached[0]
+
+    ## Request resolution of name from threads.
+    # @param name (str) host name.
+    # @returns (list) callbacks waiting for name.
+    #
+    def _request(
+        self,
+        name,
+    ):
+        if name not in self._pending:
+            self._pending[name] = []
+            self._requests.put(name)
+        return self._pending[name]
+
+    ## On read event.
+    # Empty pipe, cache results of threads and call waiting callbacks.
+    #
+    def on_read(self):
+        try:
+            while os.read(self._pipe.fileno(), 4096):
+                pass
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+
+        while self._results:
+            name, address = self._results.popleft()
+            if address is None:
+                logging.error("failed to resolve %s" % name)
+                ttl = constants.DNS_NEGATIVE_CACHE_TTL
+            else:
+                ttl = constants.DNS_CACHE_TTL
+            self._cache[name] = (address, time.time() + ttl)
+            for callback in self._pending.pop(name, []):
+                try:
+                    callback(address)
+                except Exception:
+                    logging.error(traceback.format_exc())
+
+    ## On close event.
+    # Change @ref _state of resolver to CLOSING.
+    #
+    def on_close(self):
+        self._state = constants.CLOSING
+        self.mark_dirty()
+
+    ## Is closing.
+    # @returns (bool) True if ready for closing.
+    #
+    def is_closing(self):
+        return self._state == constants.CLOSING
+
+    ## Close resolver.
+    # Closing both ends of pipe, idle threads get a None request, threads
+    # which are resolving exit with their result.
+    #
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._pipe.close()
+            os.close(self._write_fd)
+        for i in range(self._threads):
+            self._requests.put(None)
+
+    ## Get events for poller.
+    # @returns (int) events to register for poller.
+    #
+    # POLLIN while @ref _state is ACTIVE.
+    #
+    def get_events(self):
+        event = event_object.BaseEvent.POLLERR
+        if self._state == constants.ACTIVE:
+            event |= event_object.BaseEvent.POLLIN
+        return event
+
+    ## Mark dirty.
+    # Add resolver to dirty sockets of app_context, see
+    # @ref common.async.async_server.AsyncServer._dirty.
+    #
+    def mark_dirty(self):
+        self._app_context["dirty_sockets"].add(self)
+
+    ## fileno of resolver.
+    def fileno(self):
+        return self._pipe.fileno()
+
+    ## Retrive read end of pipe.
+    @property
+    def socket(self):
+        return self._pipe
+
+    ## String representation.
+    def __repr__(self):
+        return "DnsResolver object. fileno: %d." % (
+            self.fileno(),
+        )
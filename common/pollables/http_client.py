@@ -5,16 +5,16 @@
 # Implementation of @ref onion_routing.common.pollables.http_client
 #
 
-import ast
 import errno
 import logging
 
 from common import constants
 from common.async import event_object
 from common.pollables import tcp_socket
+from common.utilities import buffer_util
+from common.utilities import directory_util
 from common.utilities import http_util
 from common.utilities import util
-from registry.services import base_service
 
 
 ## Http client socket.
@@ -26,22 +26,70 @@ from registry.services import base_service
 class HttpClient(tcp_socket.TCPSocket):
 
     ## Register request structure.
-    # Missing the address and port fields
+    # Missing the address, port, key and capacity fields
     # which are filled by each node saperately.
     #
     REGISTER_REQUEST = (
-        "GET /register?address=%s&port=%s&key=%s HTTP/1.1\r\n\r\n"
+        "GET /register?address=%s&port=%s&key=%s&capacity=%s HTTP/1.1"
+        "\r\n\r\n"
     )
 
     ## Unregister request structure.
-    # Missing the port field which is filled by each node saperately.
+    # Missing the address and port fields which are filled by each node
+    # saperately.
     #
     UNREGISTER_REQUEST = (
-        "GET /unregister?port=%s HTTP/1.1\r\n\r\n"
+        "GET /unregister?address=%s&port=%s HTTP/1.1\r\n\r\n"
     )
 
+    ## Heartbeat request structure.
+    # Missing the address, port and load fields which are filled by each
+    # node saperately.
+    #
+    HEARTBEAT_REQUEST = (
+        "GET /heartbeat?address=%s&port=%s&load=%s HTTP/1.1\r\n\r\n"
+    )
+
+    ## Nodes request structure.
+    # Missing the query, which is sent once nodes were recieved.
+    #
     NODES_REQUEST = (
-        "GET /nodes HTTP/1.1\r\n\r\n"
+        "GET /nodes%s HTTP/1.1\r\n\r\n"
+    )
+
+    ## Query of nodes request.
+    # Missing the version and epoch of the last recieved directory.
+    # Registry holds the request until directory changes.
+    #
+    NODES_SINCE_QUERY = (
+        "?since=%s&epoch=%s&wait=1"
+    )
+
+    ## States in which a request is sent.
+    SEND_STATES = (
+        constants.SEND_REGISTER,
+        constants.SEND_UNREGISTER,
+        constants.SEND_NODES,
+        constants.SEND_HEARTBEAT,
+    )
+
+    ## States in which a response is recieved.
+    RECV_STATES = (
+        constants.RECV_REGISTER,
+        constants.RECV_UNREGISTER,
+        constants.RECV_NODES,
+        constants.RECV_HEARTBEAT,
+    )
+
+    ## States in which a request is in progress.
+    BUSY_STATES = (
+        constants.SEND_UNREGISTER,
+        constants.RECV_UNREGISTER,
+        constants.UNREGISTERED,
+        constants.SEND_NODES,
+        constants.RECV_NODES,
+        constants.SEND_HEARTBEAT,
+        constants.RECV_HEARTBEAT,
     )
 
     ## Constructor.
@@ -83,7 +131,29 @@ class HttpClient(tcp_socket.TCPSocket):
         self._machine_state = constants.SEND_REGISTER
 
         ## node instance that is registering.
-        self._node = node            
+        self._node = node
+
+        ## Recieved responses which were not handled yet.
+        # Requests are sent from
+        # @ref common.pollables.tcp_socket.TCPSocket._buffer, so the
+        # connection is reused for all requests.
+        #
+        self._read_buffer = buffer_util.Buffer()
+
+        ## Parser of current response.
+        self._parser = http_util.HttpParser()
+
+        ## Content of current response recieved so far.
+        self._content = []
+
+        ## Epoch of last recieved directory, None if none was recieved.
+        self._nodes_epoch = None
+
+        ## Version of last recieved directory.
+        self._nodes_version = None
+
+        ## Timer sending heartbeats once node registered, None before.
+        self._heartbeat_timer = None
 
     ## Create the state machine for socket.
     # @returns (dict) states to the thier methods.
@@ -118,6 +188,14 @@ class HttpClient(tcp_socket.TCPSocket):
                 "method": self._recv_nodes,
                 "next": None,
             },
+            constants.SEND_HEARTBEAT: {
+                "method": self._send_heartbeat,
+                "next": constants.RECV_HEARTBEAT,
+            },
+            constants.RECV_HEARTBEAT: {
+                "method": self._recv_heartbeat,
+                "next": None,
+            },
         }
 
     ## Send register request.
@@ -125,40 +203,53 @@ class HttpClient(tcp_socket.TCPSocket):
     # @returns (bool) whether sending is finished.
     #
     def _send_register(self):
-        self._buffer = HttpClient.REGISTER_REQUEST % (
-            self._node.bind_address,
-            self._node.bind_port,
-            self._node.key,
+        self._buffer.append(
+            HttpClient.REGISTER_REQUEST % (
+                self._node.bind_address,
+                self._node.bind_port,
+                self._node.key,
+                self._request_context["app_context"]["capacity"],
+            )
         )
-        super(HttpClient, self).on_write()
         return True
 
     ## Register response.
     # Whether the registry accepted the node or something failed.
-    # - success: continue to sleeping state until unregister.
+    # - success: send heartbeats every NODE_HEARTBEAT_INTERVAL seconds
+    # until unregister.
     # - fail: something went wrong, close this socket and @ref _node.
     # @returns (bool) whether message was recieved properly.
     #
     def _recv_register(self):
-        if "success" in self._buffer:
+        response = self._recv_response()
+        if not response:
+            return False
+        if "success" in response[1]:
+            if self._heartbeat_timer is None:
+                self._heartbeat_timer = self._request_context[
+                    "app_context"
+                ]["timers"].add(
+                    constants.NODE_HEARTBEAT_INTERVAL,
+                    self.heartbeat,
+                    interval=constants.NODE_HEARTBEAT_INTERVAL,
+                )
             return True
-        elif "fail" in self._buffer:
-            logging.info("failed to registry: %s" % self._buffer)
+        logging.info("failed to registry: %s" % response[1])
 
-            self._state = constants.CLOSING
-            self._node.state = constants.CLOSING
-        else:
-            return False
+        self._state = constants.CLOSING
+        self._node.state = constants.CLOSING
 
     ## Send unregister request.
     # Sending unregister request for the @ref _node to Registry.
     # @returns (bool) whether sending is finished.
     #
     def _send_unregister(self):
-        self._buffer = HttpClient.UNREGISTER_REQUEST % (
-            self._node.bind_port,
+        self._buffer.append(
+            HttpClient.UNREGISTER_REQUEST % (
+                self._node.bind_address,
+                self._node.bind_port,
+            )
         )
-        super(HttpClient, self).on_write()
         return True
 
     ## Recv unregister request.
@@ -166,82 +257,220 @@ class HttpClient(tcp_socket.TCPSocket):
     # @returns (bool) whether unregister was performed cleanly.
     #
     def _recv_unregister(self):
-        if "unregistered" in self._buffer:
+        response = self._recv_response()
+        if response and "unregistered" in response[1]:
             logging.info("node unregistered!")
             return True
         else:
             return False
 
+    ## Send heartbeat request.
+    # Tell registry that @ref _node is alive, along with its load.
+    # Only one process registers, every worker counts its connections in
+    # its own entry of loads in app_context, which is shared memory created
+    # before workers forked, and load of node is their sum.
+    # @returns (bool) whether sending is finished.
+    #
+    def _send_heartbeat(self):
+        app_context = self._request_context["app_context"]
+        self._buffer.append(
+            HttpClient.HEARTBEAT_REQUEST % (
+                self._node.bind_address,
+                self._node.bind_port,
+                sum(app_context["loads"]),
+            )
+        )
+        return True
+
+    ## Recv heartbeat response.
+    # If registry does not know @ref _node, because it expired or registry
+    # was restarted, register again.
+    # @returns (bool) whether response finished reading.
+    #
+    def _recv_heartbeat(self):
+        response = self._recv_response()
+        if not response:
+            return False
+        if response[0] == "404":
+            logging.warning("registry lost node, registering again")
+            self._request_context["app_context"]["timers"].add(
+                0,
+                self._register_again,
+            )
+        elif response[0] != "200":
+            logging.warning("heartbeat failed: %s" % response[1])
+        return True
+
+    ## Change @ref _machine_state to SEND_REGISTER.
+    # Ignored while another request is in progress.
+    #
+    def _register_again(self):
+        if self._machine_state not in HttpClient.BUSY_STATES:
+            self._machine_state = constants.SEND_REGISTER
+            self.mark_dirty()
+
     ## Send nodes request.
     # Sending nodes request to Registry to retrieve connected nodes.
     # @returns (bool) whether sending is finished.
     #
+    # If nodes were already recieved, wait for changes since their
+    # version.
+    #
     def _send_nodes(self):
-        self._buffer = HttpClient.NODES_REQUEST
-        super(HttpClient, self).on_write()
+        query = ""
+        if self._nodes_epoch is not None:
+            query = HttpClient.NODES_SINCE_QUERY % (
+                self._nodes_version,
+                self._nodes_epoch,
+            )
+        self._buffer.append(HttpClient.NODES_REQUEST % query)
         return True
 
     ## Recv nodes request.
-    # Recieving dictionary of all nodes from registry and storing
-    # it in app_context.
-    # @returns (bool) whether nodes finished reading and converted
-    # string to dict.
+    # Recieving directory of all nodes, or changes since last directory,
+    # from registry and storing it in app_context as dict, see
+    # @ref common.utilities.directory_util, along with its epoch and
+    # version as registry_version.
+    # Addresses of nodes are resolved in the background by the resolver in
+    # app_context so they are ready when a path is created.
+    # If nodes did not change since last request, or request failed, the
+    # last recieved nodes are kept.
+    # Unless request failed, nodes are requested again right away, so
+    # changes are recieved as soon as registry has them.
+    # @returns (bool) whether response finished reading.
     #
     def _recv_nodes(self):
-        line, updated_buffer = http_util.recv_line(self._buffer)
-        if not line:
+        response = self._recv_response()
+        if not response:
             return False
-        if not ("200" in line.split() and "OK" in line.split()):
-            return False
-        status, updated_buffer = http_util.get_headers(
-            updated_buffer,
-            self._request_context,
-            base_service.BaseService(self._request_context),
+        code, content = response
+        if code == "304":
+            self._subscribe()
+            return True
+        try:
+            if code != "200":
+                raise RuntimeError("status %s" % code)
+            (
+                self._nodes_epoch,
+                self._nodes_version,
+                registry,
+            ) = directory_util.decode(
+                content,
+                self._request_context["app_context"]["registry"],
+            )
+        except Exception as e:
+            logging.warning(
+                "nodes request failed, keeping last nodes: %s" % e,
+            )
+            return True
+
+        self._request_context["app_context"]["registry"] = registry
+        self._request_context["app_context"]["registry_version"] = (
+            self._nodes_epoch,
+            self._nodes_version,
         )
-        if(
-            not status or
-            constants.CONTENT_LENGTH not in self._request_context[
-                "request_headers"
-            ]
+        for node in registry.values():
+            self._request_context["app_context"]["resolver"].lookup(
+                node["address"],
+            )
+        self._subscribe()
+        return True
+
+    ## Recieve response.
+    # @returns (tuple) status code and content of response, consumed from
+    # @ref _read_buffer, None if response is not complete.
+    #
+    # Response is parsed by @ref _parser as it arrives, its content is
+    # kept in @ref _content until it is complete.
+    #
+    def _recv_response(self):
+        first_line = self._parser.recv_first_line(self._read_buffer)
+        if not first_line:
+            return None
+        code = first_line[1]
+        if not self._parser.recv_headers(
+            self._read_buffer,
+            self.wanted_headers(),
+            content=code not in ("204", "304") and code[:1] != "1",
         ):
-            return False
+            return None
+        self._content.append(self._parser.recv_content(self._read_buffer))
+        if self._parser.state != constants.PARSE_DONE:
+            return None
 
-        length = int(
-            self._request_context["request_headers"][constants.CONTENT_LENGTH]
+        content = "".join(self._content)
+        self._content = []
+        self._parser.reset()
+        return code, content
+
+    ## Request nodes again once current response is handled.
+    def _subscribe(self):
+        self._request_context["app_context"]["timers"].add(
+            0,
+            self.get_nodes,
         )
-        self._request_context[
-            "app_context"
-        ]["registry"] = ast.literal_eval(updated_buffer[:length])
-        self._buffer = self._buffer[self._buffer.find("/r/n/r/n") + 4:]
-        return True
+
+    ## Wanted headers dictionary.
+    # @returns (dict) dictionary of wanted headers to parse from registry
+    # responses.
+    #
+    def wanted_headers(self):
+        return {
+            constants.CONTENT_LENGTH,
+        }
 
     ## Change @ref _machine_state to SEND_NODE.
+    # Ignored while another request is in progress, so nodes are requested
+    # at most once at a time.
+    #
     def get_nodes(self):
-        self._machine_state = constants.SEND_NODES
+        if self._machine_state not in HttpClient.BUSY_STATES:
+            self._machine_state = constants.SEND_NODES
+            self.mark_dirty()
+
+    ## Change @ref _machine_state to SEND_HEARTBEAT.
+    # Ignored while another request is in progress, a heartbeat is sent
+    # several times before node expires.
+    #
+    def heartbeat(self):
+        if self._machine_state not in HttpClient.BUSY_STATES:
+            self._machine_state = constants.SEND_HEARTBEAT
+            self.mark_dirty()
 
     ## Change @ref _machine_state to SEND_UNREGISTER.
+    # Stop sending heartbeats.
+    #
     def unregister(self):
-        self._machine_state = constants.SEND_UNREGISTER        
+        if self._heartbeat_timer:
+            self._heartbeat_timer.cancel()
+        self._machine_state = constants.SEND_UNREGISTER
+        self.mark_dirty()
 
     ## On read event.
-    # Read from @ref _socket and enter the state function afterwards.
+    # Read from @ref _socket to @ref _read_buffer and enter the state
+    # function afterwards.
     # Change to the next state once operation is done.
     # If registry disconnected, closes both @ref _node and HttpClient.
     #
     def on_read(self):
         try:
-            self._buffer += util.recieve_buffer(
+            util.recieve_buffer(
                 self._socket,
+                self._read_buffer,
                 self._request_context[
                     "app_context"
-                ]["max_buffer_size"] - len(self._buffer),
+                ]["max_buffer_size"] - len(self._read_buffer),
             )
             if self._state_machine[self._machine_state]["method"]():
                 self._machine_state = self._state_machine[
                     self._machine_state
                 ]["next"]
         except Exception as e:
-            if e.errno not in (errno.ECONNRESET, errno.ECONNABORTED):
+            if not isinstance(e, util.DisconnectError) and getattr(
+                e,
+                "errno",
+                None,
+            ) not in (errno.ECONNRESET, errno.ECONNABORTED):
                 raise
             logging.error("Registry disconnected")
             self._machine_state = constants.UNREGISTERED
@@ -249,17 +478,27 @@ class HttpClient(tcp_socket.TCPSocket):
             self.on_close()
 
     ## On write event.
-    # Enter the state function and change to the next state once done.
+    # Enter the state function if request should be sent and change to the
+    # next state once done.
+    # Write request from @ref common.pollables.tcp_socket.TCPSocket._buffer.
     # If registry disconnected, closes both @ref _node and HttpClient.
     #
     def on_write(self):
         try:
-            if self._state_machine[self._machine_state]["method"]():
+            if (
+                self._machine_state in HttpClient.SEND_STATES and
+                self._state_machine[self._machine_state]["method"]()
+            ):
                 self._machine_state = self._state_machine[
                     self._machine_state
                 ]["next"]
+            super(HttpClient, self).on_write()
         except Exception as e:
-            if e.errno != errno.ENOTCONN:
+            if getattr(e, "errno", None) not in (
+                errno.ENOTCONN,
+                errno.EPIPE,
+                errno.ECONNRESET,
+            ):
                 raise
             logging.error("Registry disconnected")
             self._machine_state = constants.UNREGISTERED
@@ -269,22 +508,15 @@ class HttpClient(tcp_socket.TCPSocket):
     ## Get events for poller.
     # @returns (int) events to register for poller.
     #
-    # - POLLIN when @ref _machine_state is RECV_REGISTER.
-    # - POLLOUT when @ref _machine_state is SEND_REGISTER or SEND_UNREGISTER.
+    # - POLLIN when @ref _machine_state is in @ref RECV_STATES.
+    # - POLLOUT when @ref _machine_state is in @ref SEND_STATES or request
+    # was not sent completely.
     #
     def get_events(self):
         event = event_object.BaseEvent.POLLERR
-        if self._machine_state in (
-            constants.RECV_REGISTER,
-            constants.RECV_UNREGISTER,
-            constants.RECV_NODES,
-        ):
+        if self._machine_state in HttpClient.RECV_STATES:
             event |= event_object.BaseEvent.POLLIN
-        if self._machine_state in (
-            constants.SEND_REGISTER,
-            constants.SEND_UNREGISTER,
-            constants.SEND_NODES,
-        ):
+        if self._machine_state in HttpClient.SEND_STATES or self._buffer:
             event |= event_object.BaseEvent.POLLOUT
         return event
 
@@ -6,6 +6,7 @@
 #
 
 import logging
+import os
 import socket
 import traceback
 
@@ -27,6 +28,11 @@ class Listener(pollable.Pollable):
     # type of socket to listen to.
     #
     # Creates a new socket and binds it to (bind_address, bind_port).
+    # When app_context reuse_port is set, several processes may bind the same
+    # address and the kernel balances accepted connections between them.
+    # Address is reused, so connections which the server closed and are
+    # in TIME_WAIT do not prevent a restart. Not on Windows, where reusing
+    # the address lets another process bind the same port.
     # Starts in LISTEN state.
     #
     def __init__(
@@ -38,6 +44,18 @@ class Listener(pollable.Pollable):
     ):
         ## Socket used by the Listener.
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if os.name != "nt":
+            self._socket.setsockopt(
+                socket.SOL_SOCKET,
+                socket.SO_REUSEADDR,
+                1,
+            )
+        if app_context.get("reuse_port"):
+            self._socket.setsockopt(
+                socket.SOL_SOCKET,
+                socket.SO_REUSEPORT,
+                1,
+            )
         self._socket.bind((bind_address, bind_port))
         self._socket.listen(app_context["max_connections"])
         self._socket.setblocking(False)
@@ -54,7 +72,7 @@ class Listener(pollable.Pollable):
     ## On read event.
     # Accept new connection.
     # Wrap client according to @ref _type.
-    # Add socket to socket_data of @ref common.async.async_server.
+    # Add socket to @ref common.async.async_server.
     #
     def on_read(self):
         try:
@@ -68,7 +86,7 @@ class Listener(pollable.Pollable):
                 app_context=self._app_context,
             )
 
-            self._app_context["socket_data"][server.fileno()] = server
+            self._app_context["add_socket"](server)
         except Exception:
             logging.error(traceback.format_exc())
             if server:
@@ -83,6 +101,7 @@ class Listener(pollable.Pollable):
     #
     def on_close(self):
         self._state = constants.CLOSING
+        self.mark_dirty()
 
     ## Is closing.
     # @returns (bool) True if ready for closing.
@@ -109,6 +128,13 @@ class Listener(pollable.Pollable):
             event |= event_object.BaseEvent.POLLIN
         return event
 
+    ## Mark dirty.
+    # Add listener to dirty sockets of app_context, see
+    # @ref common.async.async_server.AsyncServer._dirty.
+    #
+    def mark_dirty(self):
+        self._app_context["dirty_sockets"].add(self)
+
     ## fileno of Listener.
     def fileno(self):
         return self._socket.fileno()
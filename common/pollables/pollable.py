@@ -35,6 +35,15 @@ class Pollable(object):
     def get_events(self):
         pass
 
+    ## Mark dirty.
+    # Tell the async server that events or closing state may have changed,
+    # they are checked again before next poll. Needed only when changed by
+    # another pollable or by a timer, the server marks pollables which had
+    # events.
+    #
+    def mark_dirty(self):
+        pass
+
     ## fileno of Pollable.
     def fileno(self):
         pass
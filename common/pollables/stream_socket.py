@@ -0,0 +1,170 @@
+#!/usr/bin/python
+## @package onion_routing.common.pollables.stream_socket
+# Socket of a stream which is multiplexed over a circuit.
+## @file stream_socket.py
+# Implementation of @ref onion_routing.common.pollables.stream_socket
+#
+
+from common import constants
+from common.async import event_object
+from common.pollables import tcp_socket
+from common.utilities import buffer_util
+from common.utilities import util
+
+
+## Stream Socket.
+#
+# One end of a stream which shares a circuit with other streams.
+# Data read from socket is sent to the circuit as DATA cells, data of
+# DATA cells recieved by the circuit is written to socket.
+# The circuit must provide send_cell(), remove_stream() and add_stream()
+# of @ref common.utilities.cell_util.Multiplexer, and buffer and state
+# like @ref common.pollables.tcp_socket.TCPSocket.
+#
+class StreamSocket(tcp_socket.TCPSocket):
+
+    ## Constructor.
+    # @param socket (socket) the wrapped socket.
+    # @param state (int) state of StreamSocket.
+    # @param app_context (dict) application context.
+    # @param circuit (@ref common.pollables.tcp_socket.TCPSocket) circuit
+    # which carries the stream.
+    # @param stream_id (optional, int) id of stream, None for a new id.
+    #
+    def __init__(
+        self,
+        socket,
+        state,
+        app_context,
+        circuit,
+        stream_id=None,
+    ):
+        super(StreamSocket, self).__init__(
+            socket,
+            state,
+            app_context,
+        )
+
+        ## Circuit which carries the stream.
+        self._circuit = circuit
+
+        ## Data read from socket which was not sent to circuit yet.
+        self._read_buffer = buffer_util.Buffer()
+
+        ## Whether stream ended, END cell was sent or recieved.
+        self._ended = False
+
+        ## Id of stream in circuit.
+        self._stream_id = circuit.add_stream(self, stream_id)
+
+    ## Send data read from socket as DATA cells.
+    # @returns (int) number of bytes sent.
+    #
+    def _send_data(self):
+        length = len(self._read_buffer)
+        if length:
+            self._circuit.send_cell(
+                self._stream_id,
+                constants.CELL_DATA,
+                str(self._read_buffer),
+            )
+            self._read_buffer.clear()
+        return length
+
+    ## On read event.
+    # Read from socket as long as buffer of circuit is not full and send
+    # what was read, also when socket was disconnected.
+    #
+    def on_read(self):
+        try:
+            util.recieve_buffer(
+                self._socket,
+                self._read_buffer,
+                self._request_context[
+                    "app_context"
+                ]["max_buffer_size"] - len(self._circuit.buffer),
+            )
+        finally:
+            self._send_data()
+
+    ## On write event.
+    # Write @ref common.pollables.tcp_socket.TCPSocket._buffer.
+    # Circuit stops reading while buffer is full, so it is marked dirty
+    # once buffer is not full anymore.
+    #
+    def on_write(self):
+        max_buffer_size = self._request_context[
+            "app_context"
+        ]["max_buffer_size"]
+        full = len(self._buffer) >= max_buffer_size
+        super(StreamSocket, self).on_write()
+        if full and len(self._buffer) < max_buffer_size:
+            self._circuit.mark_dirty()
+
+    ## Data recieved from circuit.
+    # @param data (str) content of DATA cell.
+    #
+    def on_data(
+        self,
+        data,
+    ):
+        self._buffer.append(data)
+        self.mark_dirty()
+
+    ## Stream ended by other side of circuit.
+    # Socket is closed once @ref common.pollables.tcp_socket.TCPSocket._buffer
+    # is sent.
+    #
+    def on_end(self):
+        self._ended = True
+        self._state = constants.CLOSING
+        self._circuit.remove_stream(self._stream_id)
+        self.mark_dirty()
+
+    ## On close event.
+    # Change @ref common.pollables.tcp_socket.TCPSocket._state to CLOSING.
+    # Send END cell unless stream already ended or circuit is closing.
+    #
+    def on_close(self):
+        super(StreamSocket, self).on_close()
+        if not self._ended:
+            self._ended = True
+            if self._circuit.state == constants.ACTIVE:
+                self._circuit.send_cell(
+                    self._stream_id,
+                    constants.CELL_END,
+                )
+            self._circuit.remove_stream(self._stream_id)
+
+    ## Get events for poller.
+    # @returns (int) events to register for poller.
+    #
+    # - POLLIN when @ref common.pollables.tcp_socket.TCPSocket._state is
+    # ACTIVE and buffer of circuit is not full.
+    # - POLLOUT when @ref common.pollables.tcp_socket.TCPSocket._buffer
+    # is not empty.
+    #
+    def get_events(self):
+        event = event_object.BaseEvent.POLLERR
+        if (
+            self._state == constants.ACTIVE and
+            len(self._circuit.buffer) < self._request_context[
+                "app_context"
+            ]["max_buffer_size"]
+        ):
+            event |= event_object.BaseEvent.POLLIN
+        if self._buffer:
+            event |= event_object.BaseEvent.POLLOUT
+        return event
+
+    ## Retrive @ref _stream_id.
+    @property
+    def stream_id(self):
+        return self._stream_id
+
+    ## String representation.
+    def __repr__(self):
+        return "StreamSocket object. stream %s. fileno: %d." % (
+            self._stream_id,
+            self.fileno(),
+        )
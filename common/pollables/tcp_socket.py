@@ -6,6 +6,7 @@
 #
 
 from common import constants
+from common.utilities import buffer_util
 from common.utilities import util
 from common.pollables import pollable
 from common.async import event_object
@@ -27,6 +28,9 @@ class TCPSocket(pollable.Pollable):
     #
     # Creates a wrapper for the given @ref _socket to be able to
     # read and write from it asynchronously.
+    # Messages are written whole, so Nagle algorithm is disabled and small
+    # messages, like socks5 requests and cells, are not held until
+    # previous ones are acknowledged.
     #
     def __init__(
         self,
@@ -37,12 +41,13 @@ class TCPSocket(pollable.Pollable):
         ## Socket used by the Listener.
         self._socket = socket
         self._socket.setblocking(False)
+        util.set_nodelay(self._socket)
 
         ## State of TCPSocket.
         self._state = state
 
         ## Buffer in which messages for reading/writing are stored.
-        self._buffer = ""
+        self._buffer = buffer_util.Buffer()
 
         ## Partner of socket.
         # Initialized as self to read and write to client.
@@ -54,20 +59,24 @@ class TCPSocket(pollable.Pollable):
 
     ## On read event.
     # Read from @ref _partner until maximum size of @ref _buffer is recived.
+    # @ref _partner has data to write, so it is marked dirty.
     #
     def on_read(self):
-        self._partner.buffer += util.recieve_buffer(
+        util.recieve_buffer(
             self._socket,
+            self._partner.buffer,
             self._request_context[
                 "app_context"
             ]["max_buffer_size"] - len(self._partner.buffer),
         )
+        if self._partner is not self:
+            self._partner.mark_dirty()
 
     ## On write event.
     # Write everything stored and @ref _buffer.
     #
     def on_write(self):
-        self._buffer = util.send_buffer(
+        util.send_buffer(
             self._socket,
             self._buffer,
         )
@@ -75,10 +84,12 @@ class TCPSocket(pollable.Pollable):
     ## On close event.
     # Change @ref _state of socket to CLOSING and empty @ref _buffer.
     # If TCPSocket is proxy run on_close on @ref _partner.
+    # Socket may be closed by others, so it is marked dirty.
     #
     def on_close(self):
         self._state = constants.CLOSING
-        self._buffer = ""
+        self._buffer.clear()
+        self.mark_dirty()
 
         if (
             self != self._partner and
@@ -120,6 +131,13 @@ class TCPSocket(pollable.Pollable):
             event |= event_object.BaseEvent.POLLOUT
         return event
 
+    ## Mark dirty.
+    # Add socket to dirty sockets of app_context, see
+    # @ref common.async.async_server.AsyncServer._dirty.
+    #
+    def mark_dirty(self):
+        self._request_context["app_context"]["dirty_sockets"].add(self)
+
     ## fileno of TCPSocket.
     def fileno(self):
         return self._socket.fileno()
@@ -0,0 +1,203 @@
+#!/usr/bin/python
+## @package onion_routing.common.utilities.buffer_util
+# utilities for handling socket buffers.
+## @file buffer_util.py
+# Implementation of @ref onion_routing.common.utilities.buffer_util
+#
+
+
+## Buffer.
+#
+# Byte buffer used for reading and writing sockets without copying.
+# Data lives in a bytearray between a start and an end offset:
+# - Reading from socket is done with recv_into directly after the end.
+# - Writing to socket is done with a memoryview from the start.
+# - Consuming data from the front only advances the start offset.
+#
+# Data is moved to the front of the bytearray only when there is no room
+# left after the end, and never when the buffer is emptied.
+#
+class Buffer(object):
+
+    ## Constructor.
+    # @param data (optional, str) initial content.
+    #
+    def __init__(
+        self,
+        data="",
+    ):
+        ## Storage of buffer.
+        self._data = bytearray(data)
+
+        ## Offset of first byte of content.
+        self._start = 0
+
+        ## Offset after last byte of content.
+        self._end = len(self._data)
+
+    ## Make room for new data after @ref _end.
+    # @param size (int) number of bytes needed.
+    #
+    def _reserve(
+        self,
+        size,
+    ):
+        if len(self._data) - self._end >= size:
+            return
+        length = self._end - self._start
+        if self._start and len(self._data) - length >= size:
+            view = memoryview(self._data)
+            view[:length] = view[self._start:self._end]
+            del view
+        else:
+            self._data.extend(
+                bytearray(length + size - len(self._data)),
+            )
+            if self._start:
+                self._data[:length] = self._data[self._start:self._end]
+        self._start, self._end = 0, length
+
+    ## Append data to buffer.
+    # @param data (str) data to append.
+    #
+    def append(
+        self,
+        data,
+    ):
+        self._reserve(len(data))
+        self._data[self._end:self._end + len(data)] = data
+        self._end += len(data)
+
+    ## Receive data from socket into buffer.
+    # @param sock (socket) the socket to recieve data from.
+    # @param size (int) max size of bytes to read.
+    # @returns (int) number of bytes read.
+    #
+    def recv_into(
+        self,
+        sock,
+        size,
+    ):
+        self._reserve(size)
+        view = memoryview(self._data)
+        try:
+            n = sock.recv_into(view[self._end:self._end + size], size)
+        finally:
+            del view
+        self._end += n
+        return n
+
+    ## Send data from buffer to socket.
+    # @param sock (socket) the socket to send data to.
+    # @returns (int) number of bytes sent.
+    #
+    # Sent data is consumed from buffer.
+    #
+    def send(
+        self,
+        sock,
+    ):
+        view = memoryview(self._data)
+        try:
+            n = sock.send(view[self._start:self._end])
+        finally:
+            del view
+        self.consume(n)
+        return n
+
+    ## Consume data from the front of buffer.
+    # @param size (int) number of bytes to consume.
+    #
+    def consume(
+        self,
+        size,
+    ):
+        self._start = min(self._start + size, self._end)
+        if self._start == self._end:
+            self._start = self._end = 0
+
+    ## Remove all content of buffer.
+    def clear(self):
+        self._start = self._end = 0
+
+    ## Get beginning of content.
+    # @param size (optional, int) number of bytes, None for all content.
+    # @returns (str) copy of content.
+    #
+    def peek(
+        self,
+        size=None,
+    ):
+        if size is None:
+            size = self._end - self._start
+        return str(
+            self._data[self._start:min(self._start + size, self._end)]
+        )
+
+    ## Find sub string in content.
+    # @param sub (str) string to find.
+    # @param start (optional, int) offset in content to start from.
+    # @returns (int) offset of sub in content, -1 if not found.
+    #
+    def find(
+        self,
+        sub,
+        start=0,
+    ):
+        n = self._data.find(sub, self._start + start, self._end)
+        if n == -1:
+            return n
+        return n - self._start
+
+    ## Find last sub string in content.
+    # @param sub (str) string to find.
+    # @param start (optional, int) offset in content to start from.
+    # @returns (int) offset of last sub in content, -1 if not found.
+    #
+    def rfind(
+        self,
+        sub,
+        start=0,
+    ):
+        n = self._data.rfind(sub, self._start + start, self._end)
+        if n == -1:
+            return n
+        return n - self._start
+
+    ## Get writable view of content.
+    # @param start (optional, int) offset in content.
+    # @returns (memoryview) view of content from start.
+    #
+    # View must be released before buffer grows.
+    #
+    def view(
+        self,
+        start=0,
+    ):
+        return memoryview(self._data)[self._start + start:self._end]
+
+    ## Length of content.
+    def __len__(self):
+        return self._end - self._start
+
+    ## Whether buffer has content.
+    def __nonzero__(self):
+        return self._end != self._start
+
+    ## Whether sub string is in content.
+    def __contains__(
+        self,
+        sub,
+    ):
+        return self.find(sub) != -1
+
+    ## Content of buffer.
+    def __str__(self):
+        return self.peek()
+
+    ## String representation.
+    def __repr__(self):
+        return "Buffer object. length: %d, capacity: %d." % (
+            len(self),
+            len(self._data),
+        )
@@ -0,0 +1,216 @@
+#!/usr/bin/python
+## @package onion_routing.common.utilities.cache_util
+# utilities for caching static files served over HTTP.
+## @file cache_util.py
+# Implementation of @ref onion_routing.common.utilities.cache_util
+#
+
+import collections
+import email.utils
+import hashlib
+import os
+import stat
+import time
+import zlib
+
+from common import constants
+
+
+## Asset Cache.
+#
+# Static files kept in memory by path, least recently used first, so
+# repeated requests do not touch the file system.
+# Every asset holds the content of the file and its gzip variant, if it
+# is smaller, along with their ETags and Last-Modified date.
+# A file is checked for changes at most once every
+# ASSET_CACHE_CHECK_INTERVAL seconds and reloaded if its mtime or size
+# changed.
+# Once total size of cached content exceeds max_size, least recently
+# used assets are dropped.
+#
+class AssetCache(object):
+
+    ## Constructor.
+    # @param max_size (optional, int) max bytes of cached content.
+    # @param max_file_size (optional, int) max size of a cached file,
+    # larger files are not cached.
+    #
+    def __init__(
+        self,
+        max_size=constants.ASSET_CACHE_SIZE,
+        max_file_size=constants.ASSET_CACHE_MAX_FILE_SIZE,
+    ):
+        ## Max bytes of cached content.
+        self._max_size = max_size
+
+        ## Max size of cached file.
+        self._max_file_size = max_file_size
+
+        ## Cached assets.
+        # key - path of file, value - asset, least recently used first.
+        #
+        self._assets = collections.OrderedDict()
+
+        ## Bytes of cached content.
+        self._size = 0
+
+    ## Get asset of file.
+    # @param file_name (str) path of file.
+    # @returns (dict) asset of file, None if file is too large to cache.
+    #
+    # Raises OSError if file can not be read and RuntimeError if it is
+    # not a regular file.
+    #
+    def get(
+        self,
+        file_name,
+    ):
+        now = time.time()
+        asset = self._assets.pop(file_name, None)
+        if asset is not None:
+            self._size -= asset["memory"]
+
+        if (
+            asset is None or
+            now - asset["checked"] >= constants.ASSET_CACHE_CHECK_INTERVAL
+        ):
+            st = os.stat(file_name)
+            if not stat.S_ISREG(st.st_mode):
+                raise RuntimeError("%s is not a file" % file_name)
+            if st.st_size > self._max_file_size:
+                return None
+            if asset is None or (
+                asset["mtime"],
+                asset["size"],
+            ) != (
+                st.st_mtime,
+                st.st_size,
+            ):
+                asset = self._load(file_name, st)
+            asset["checked"] = now
+
+        self._assets[file_name] = asset
+        self._size += asset["memory"]
+        while self._size > self._max_size:
+            self._size -= self._assets.popitem(last=False)[1]["memory"]
+        return asset
+
+    ## Load asset of file.
+    # @param file_name (str) path of file.
+    # @param st (stat_result) stat of file.
+    # @returns (dict) asset of file.
+    #
+    def _load(
+        self,
+        file_name,
+        st,
+    ):
+        with open(file_name, "rb") as f:
+            content = f.read(self._max_file_size)
+        etag = hashlib.md5(content).hexdigest()
+
+        compressor = zlib.compressobj(
+            9,
+            zlib.DEFLATED,
+            16 + zlib.MAX_WBITS,
+        )
+        gzip = compressor.compress(content) + compressor.flush()
+        if len(gzip) >= len(content):
+            gzip = None
+
+        return {
+            "mtime": st.st_mtime,
+            "size": st.st_size,
+            "checked": 0,
+            "content": content,
+            "etag": '"%s"' % etag,
+            "gzip": gzip,
+            "gzip_etag": '"%s-gzip"' % etag,
+            "last_modified": email.utils.formatdate(
+                st.st_mtime,
+                usegmt=True,
+            ),
+            "type": constants.MIME_MAPPING.get(
+                os.path.splitext(file_name)[1].lstrip("."),
+                "application/octet-stream",
+            ),
+            "memory": len(content) + len(gzip or ""),
+        }
+
+
+## Whether client accepts gzip content.
+# @param accept_encoding (str) Accept-Encoding header of request.
+# @returns (bool) whether gzip is accepted.
+#
+def accepts_gzip(accept_encoding):
+    for coding in accept_encoding.split(","):
+        params = coding.split(";")
+        if params[0].strip().lower() not in ("gzip", "x-gzip", "*"):
+            continue
+        for param in params[1:]:
+            key, sep, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+## Whether ETag matches If-None-Match header of request.
+# @param etag (str) ETag of response.
+# @param if_none_match (str) If-None-Match header of request.
+# @returns (bool) whether client has the response already.
+#
+def etag_matches(
+    etag,
+    if_none_match,
+):
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag in (etag, "*"):
+            return True
+    return False
+
+
+## Set response of asset.
+# @param request_context (dict) request context.
+# @param asset (dict) asset of @ref AssetCache.
+#
+# Send gzip variant if client accepts it.
+# If client already has the variant according to If-None-Match, send 304
+# without content.
+#
+def set_response(
+    request_context,
+    asset,
+):
+    request_headers = request_context["request_headers"]
+    response_headers = request_context["response_headers"]
+
+    content, etag = asset["content"], asset["etag"]
+    if asset["gzip"] is not None:
+        response_headers[constants.VARY] = constants.ACCEPT_ENCODING
+        if accepts_gzip(
+            request_headers.get(constants.ACCEPT_ENCODING, ""),
+        ):
+            content, etag = asset["gzip"], asset["gzip_etag"]
+            response_headers[constants.CONTENT_ENCODING] = "gzip"
+
+    response_headers[constants.CONTENT_TYPE] = asset["type"]
+    response_headers[constants.CONTENT_LENGTH] = len(content)
+    response_headers[constants.ETAG] = etag
+    response_headers[constants.LAST_MODIFIED] = asset["last_modified"]
+
+    if etag_matches(
+        etag,
+        request_headers.get(constants.IF_NONE_MATCH, ""),
+    ):
+        request_context["code"] = 304
+        request_context["status"] = "Not Modified"
+        request_context["response"] = ""
+    else:
+        request_context["response"] = content
@@ -0,0 +1,207 @@
+#!/usr/bin/python
+## @package onion_routing.common.utilities.cell_util
+# utilities for multiplexing streams over a circuit using cells.
+## @file cell_util.py
+# Implementation of @ref onion_routing.common.utilities.cell_util
+#
+
+import struct
+
+from common import constants
+from common.utilities import buffer_util
+
+
+## Cell header.
+#
+# | stream id | command | length |
+# | :-------: | :-----: | :----: |
+# | 2         | 1       | 2      |
+#
+CELL_HEADER = struct.Struct("!HBH")
+
+## Maximum size of cell payload.
+MAX_CELL_PAYLOAD = 0xffff
+
+## Number of stream ids.
+MAX_STREAM_ID = 0xffff
+
+
+## Encode cell.
+# @param stream_id (int) id of stream.
+# @param command (int) cell command.
+# @param payload (optional, str) content of cell.
+# @returns (str) encoded cell.
+#
+def encode(
+    stream_id,
+    command,
+    payload="",
+):
+    return CELL_HEADER.pack(
+        stream_id,
+        command,
+        len(payload),
+    ) + payload
+
+
+## Decode cell.
+# @param buffer (@ref common.utilities.buffer_util.Buffer) buffer with
+# cells, decoded cell is consumed from buffer.
+# @returns (tuple) stream id, command and payload, None if there is no
+# complete cell in buffer.
+#
+def decode(
+    buffer,
+):
+    if len(buffer) < CELL_HEADER.size:
+        return
+    stream_id, command, length = CELL_HEADER.unpack(
+        buffer.peek(CELL_HEADER.size),
+    )
+    if len(buffer) < CELL_HEADER.size + length:
+        return
+    if command not in constants.CELL_COMMANDS:
+        raise RuntimeError("Unknown cell command %s" % command)
+    payload = buffer.peek(CELL_HEADER.size + length)[CELL_HEADER.size:]
+    buffer.consume(CELL_HEADER.size + length)
+    return stream_id, command, payload
+
+
+## Multiplexer.
+#
+# Streams of a circuit.
+# Cells of all streams are written to the buffer of the circuit socket,
+# cells read from circuit socket are collected in @ref cells and passed
+# to their streams.
+#
+class Multiplexer(object):
+
+    ## Constructor.
+    # @param buffer (@ref common.utilities.buffer_util.Buffer) buffer in
+    # which cells are sent.
+    #
+    def __init__(
+        self,
+        buffer,
+    ):
+        ## Buffer in which cells are sent.
+        self._buffer = buffer
+
+        ## Recieved data which is not a complete cell yet.
+        self.cells = buffer_util.Buffer()
+
+        ## Streams of circuit.
+        # key - stream id, value - stream.
+        #
+        self.streams = {}
+
+        ## Last stream id given by @ref add_stream.
+        self._last_id = 0
+
+    ## Add stream.
+    # @param stream (@ref common.pollables.stream_socket.StreamSocket)
+    # the stream.
+    # @param stream_id (optional, int) id of stream, None for a new id.
+    # @returns (int) id of stream.
+    #
+    def add_stream(
+        self,
+        stream,
+        stream_id=None,
+    ):
+        if stream_id is None:
+            if len(self.streams) >= MAX_STREAM_ID:
+                raise RuntimeError("No free stream id in circuit")
+            stream_id = (self._last_id + 1) % (MAX_STREAM_ID + 1)
+            while stream_id == 0 or stream_id in self.streams:
+                stream_id = (stream_id + 1) % (MAX_STREAM_ID + 1)
+            self._last_id = stream_id
+        self.streams[stream_id] = stream
+        return stream_id
+
+    ## Remove stream.
+    # @param stream_id (int) id of stream.
+    #
+    def remove_stream(
+        self,
+        stream_id,
+    ):
+        self.streams.pop(stream_id, None)
+
+    ## Send cell.
+    # @param stream_id (int) id of stream.
+    # @param command (int) cell command.
+    # @param payload (optional, str) content, split to several cells when
+    # longer than @ref MAX_CELL_PAYLOAD.
+    #
+    def send(
+        self,
+        stream_id,
+        command,
+        payload="",
+    ):
+        self._buffer.append(
+            encode(
+                stream_id,
+                command,
+                payload[:MAX_CELL_PAYLOAD],
+            )
+        )
+        for i in range(MAX_CELL_PAYLOAD, len(payload), MAX_CELL_PAYLOAD):
+            self._buffer.append(
+                encode(
+                    stream_id,
+                    command,
+                    payload[i:i + MAX_CELL_PAYLOAD],
+                )
+            )
+
+    ## Pass recieved cells to their streams.
+    # @param begin (callable) called with stream id and payload of
+    # BEGIN cells.
+    #
+    # Cells of unknown streams are dropped, the stream was already closed
+    # on this side.
+    #
+    def dispatch(
+        self,
+        begin,
+    ):
+        cell = decode(self.cells)
+        while cell:
+            stream_id, command, payload = cell
+            if command == constants.CELL_BEGIN:
+                begin(stream_id, payload)
+            elif stream_id in self.streams:
+                if command == constants.CELL_DATA:
+                    self.streams[stream_id].on_data(payload)
+                else:
+                    self.streams[stream_id].on_end()
+            cell = decode(self.cells)
+
+    ## Whether any stream has a full buffer.
+    # @param max_buffer_size (int) max size of buffer.
+    # @returns (bool) True if circuit should stop reading.
+    #
+    def is_full(
+        self,
+        max_buffer_size,
+    ):
+        for stream in self.streams.values():
+            if len(stream.buffer) >= max_buffer_size:
+                return True
+        return False
+
+    ## Mark all streams dirty.
+    # Streams stop reading while buffer of circuit is full, so they are
+    # marked once it is not full anymore.
+    #
+    def mark_streams(self):
+        for stream in self.streams.values():
+            stream.mark_dirty()
+
+    ## Close all streams.
+    def close(self):
+        for stream in self.streams.values():
+            stream.on_close()
+        self.streams.clear()
@@ -0,0 +1,228 @@
+#!/usr/bin/python
+## @package onion_routing.common.utilities.directory_util
+# utilities for the nodes directory sent by the registry.
+## @file directory_util.py
+# Implementation of @ref onion_routing.common.utilities.directory_util
+#
+
+import collections
+import itertools
+import json
+import random
+
+from common import constants
+
+
+## Fields of node record, in order.
+NODE_FIELDS = (
+    "name",
+    "address",
+    "port",
+    "key",
+    "capacity",
+    "load",
+)
+
+## Types of node record fields, in order of @ref NODE_FIELDS.
+NODE_FIELD_TYPES = (
+    basestring,
+    basestring,
+    int,
+    int,
+    int,
+    int,
+)
+
+
+## Create directory state of registry.
+# @returns (dict) directory state.
+#
+# - epoch: random id of this registry run, versions of different runs
+# are not comparable.
+# - version: incremented on every change of registry.
+# - log: (version, node name) of last DIRECTORY_LOG_SIZE changes.
+# - waiters: callables waiting for the next change.
+#
+def create_directory():
+    return {
+        "epoch": random.randint(0, 0x7fffffff),
+        "version": 0,
+        "log": collections.deque(maxlen=constants.DIRECTORY_LOG_SIZE),
+        "waiters": set(),
+    }
+
+
+## Record change of node in registry.
+# @param directory (dict) directory state of @ref create_directory.
+# @param name (str) name of node which was added, changed or removed.
+#
+# Waiters are called once and forgotten.
+#
+def record_change(
+    directory,
+    name,
+):
+    directory["version"] += 1
+    directory["log"].append((directory["version"], name))
+
+    waiters = list(directory["waiters"])
+    directory["waiters"].clear()
+    for waiter in waiters:
+        waiter()
+
+
+## Names of nodes changed since version.
+# @param directory (dict) directory state of @ref create_directory.
+# @param since (int) version client has.
+# @returns (set) names of changed nodes, None if log does not cover all
+# changes since version.
+#
+def changes(
+    directory,
+    since,
+):
+    log = directory["log"]
+    if since > directory["version"] or (log and log[0][0] > since + 1):
+        return None
+    return set(name for version, name in log if version > since)
+
+
+## Encode directory.
+# @param registry (dict) nodes of registry, key - node name, value - node.
+# @param directory (dict) directory state of @ref create_directory.
+# @param names (optional, set) names of changed nodes, None for all nodes.
+# @returns (str) compact json directory.
+#
+# | format | epoch | version | nodes / add, remove |
+# | :----: | :---: | :-----: | :-----------------: |
+# | DIRECTORY_FORMAT | epoch | version | records of @ref NODE_FIELDS |
+#
+# Without names all nodes are sent as nodes, otherwise changed nodes
+# which are in registry are sent as add and the rest by name as remove.
+#
+def encode(
+    registry,
+    directory,
+    names=None,
+):
+    return "".join(iter_encode(registry, directory, names))
+
+
+## Encode directory by pieces.
+# @param registry (dict) nodes of registry, key - node name, value - node.
+# @param directory (dict) directory state of @ref create_directory.
+# @param names (optional, set) names of changed nodes, None for all nodes.
+# @returns (iterator) pieces of compact json directory of @ref encode,
+# DIRECTORY_STREAM_BATCH records each.
+#
+# Version and names of nodes are taken when called. Nodes which are
+# removed while pieces are taken are left out, the change is sent in
+# the next directory.
+#
+def iter_encode(
+    registry,
+    directory,
+    names=None,
+):
+    head = '{"format":%d,"epoch":%d,"version":%d' % (
+        constants.DIRECTORY_FORMAT,
+        directory["epoch"],
+        directory["version"],
+    )
+    if names is None:
+        head += ',"nodes":['
+        names = list(registry)
+    else:
+        head += ',"remove":%s,"add":[' % json.dumps(
+            [name for name in names if name not in registry],
+            separators=(",", ":"),
+        )
+        names = [name for name in names if name in registry]
+    return itertools.chain(
+        (head,),
+        _iter_records(registry, names),
+        ("]}",),
+    )
+
+
+## Encode records of nodes by pieces.
+# @param registry (dict) nodes of registry, key - node name, value - node.
+# @param names (list) names of nodes.
+# @returns (generator) comma separated json records.
+#
+def _iter_records(
+    registry,
+    names,
+):
+    separator = ""
+    for start in range(0, len(names), constants.DIRECTORY_STREAM_BATCH):
+        records = [
+            json.dumps(_record(registry[name]), separators=(",", ":"))
+            for name in names[start:start + constants.DIRECTORY_STREAM_BATCH]
+            if name in registry
+        ]
+        if records:
+            yield separator + ",".join(records)
+            separator = ","
+
+
+## Decode directory.
+# @param content (str) json directory.
+# @param registry (dict) nodes client has, key - node name, value - node.
+# @returns (tuple) epoch, version and nodes.
+#
+# A full directory replaces registry, a diff is applied to registry.
+# Raise RuntimeError if directory is of another format or a record is
+# invalid, registry is changed only if whole directory is valid.
+#
+def decode(
+    content,
+    registry,
+):
+    directory = json.loads(content)
+    if (
+        not isinstance(directory, dict) or
+        directory.get("format") != constants.DIRECTORY_FORMAT
+    ):
+        raise RuntimeError("Unsupported directory format")
+
+    if "nodes" in directory:
+        registry = {}
+        add = [_node(record) for record in directory["nodes"]]
+        remove = []
+    else:
+        add = [_node(record) for record in directory["add"]]
+        remove = directory["remove"]
+        if not all(isinstance(name, basestring) for name in remove):
+            raise RuntimeError("Invalid removed nodes %s" % (remove,))
+
+    for name in remove:
+        registry.pop(name, None)
+    for node in add:
+        registry[node["name"]] = node
+    return directory["epoch"], directory["version"], registry
+
+
+## Node record.
+# @param node (dict) node.
+# @returns (list) values of @ref NODE_FIELDS.
+#
+def _record(node):
+    return [node[field] for field in NODE_FIELDS]
+
+
+## Node of record.
+# @param record (list) values of @ref NODE_FIELDS.
+# @returns (dict) node.
+#
+def _node(record):
+    if (
+        not isinstance(record, list) or
+        len(record) != len(NODE_FIELDS) or
+        not all(
+            isinstance(value, t)
+            for value, t in zip(record, NODE_FIELD_TYPES)
+        )
+    ):
+        raise RuntimeError("Invalid node record %s" % (record,))
+    return dict(zip(NODE_FIELDS, record))
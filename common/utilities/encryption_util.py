@@ -6,6 +6,15 @@
 #
 
 
+## Translation tables for xor encryption.
+# Table at index key maps every byte to byte ^ key, so a whole buffer is
+# translated in one call instead of byte by byte.
+#
+XOR_TABLES = tuple(
+    "".join(chr(i ^ key) for i in range(256)) for key in range(256)
+)
+
+
 ## Encrypt data based on a certain key.
 # @param buffer (str) the future encrypt message.
 # @param key (int) key for encryption.
@@ -17,7 +26,7 @@ def encrypt(
     buffer,
     key,
 ):
-    return "".join(chr(ord(a) ^ key) for a in buffer)
+    return buffer.translate(XOR_TABLES[key])
 
 
 ## Decrypt data based on a certain key.
@@ -31,4 +40,38 @@ def decrypt(
     buffer,
     key,
 ):
-    return "".join(chr(ord(a) ^ key) for a in buffer)
+    return buffer.translate(XOR_TABLES[key])
+
+
+## Encrypt buffer in place based on a certain key.
+# @param buffer (@ref common.utilities.buffer_util.Buffer) buffer to encrypt.
+# @param key (int) key for encryption.
+# @param start (optional, int) offset in buffer to encrypt from.
+#
+# Ecryption is xor based, key 0 leaves data as is.
+#
+def encrypt_buffer(
+    buffer,
+    key,
+    start=0,
+):
+    if not key or start >= len(buffer):
+        return
+    view = buffer.view(start)
+    view[:] = view.tobytes().translate(XOR_TABLES[key])
+    del view
+
+
+## Decrypt buffer in place based on a certain key.
+# @param buffer (@ref common.utilities.buffer_util.Buffer) buffer to decrypt.
+# @param key (int) key for encryption.
+# @param start (optional, int) offset in buffer to decrypt from.
+#
+# Decryption is xor based.
+#
+def decrypt_buffer(
+    buffer,
+    key,
+    start=0,
+):
+    encrypt_buffer(buffer, key, start)
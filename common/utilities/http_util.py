@@ -30,96 +30,374 @@ class HTTPError(RuntimeError):
         self.message = message
 
 
+## Incremental HTTP/1.1 message parser.
+#
+# Parses a message from a @ref common.utilities.buffer_util.Buffer while
+# it arrives, consuming every part once it is parsed, so no byte is
+# scanned twice:
+# - Searching for end of line resumes after the bytes searched before.
+# - Searching for the empty line ending headers resumes after the bytes
+# searched before, complete header lines are parsed once they arrive and
+# accumulated in @ref headers over calls.
+# - Content is framed by Content-Length or chunked Transfer-Encoding.
+#
+# Status line and headers larger than MAX_HEADER_SIZE bytes, or more
+# than MAX_NUMBER_OF_HEADERS headers, raise HTTPError 431.
+# Malformed messages raise HTTPError 400.
+#
+class HttpParser(object):
+
+    ## Constructor.
+    # @param max_header_size (optional, int) max bytes of status line and
+    # headers.
+    # @param max_headers (optional, int) max number of headers.
+    #
+    def __init__(
+        self,
+        max_header_size=constants.MAX_HEADER_SIZE,
+        max_headers=constants.MAX_NUMBER_OF_HEADERS,
+    ):
+        ## Max bytes of status line and headers.
+        self._max_header_size = max_header_size
+
+        ## Max number of headers.
+        self._max_headers = max_headers
+
+        self.reset()
+
+    ## Prepare for next message.
+    def reset(self):
+        ## Current state, one of HTTP_PARSER_STATES.
+        self.state = constants.PARSE_FIRST_LINE
+
+        ## Parts of first line, None until it is parsed.
+        self.first_line = None
+
+        ## Parsed wanted headers.
+        self.headers = {}
+
+        ## Bytes of buffer already searched for end of line.
+        self._scanned = 0
+
+        ## Bytes of status line and headers parsed.
+        self._header_size = 0
+
+        ## Number of headers parsed.
+        self._header_count = 0
+
+        ## Length of content, None if there is none.
+        self._content_length = None
+
+        ## Whether content is chunked.
+        self._chunked = False
+
+        ## Bytes left of content or of current chunk.
+        self._left = 0
+
+    ## Recieve line.
+    # @param buffer (Buffer) buffer of message.
+    # @returns (str) line without CRLF consumed from buffer, None if line
+    # is not complete.
+    #
+    def recv_line(
+        self,
+        buffer,
+    ):
+        n = buffer.find(constants.CRLF_BIN, max(self._scanned - 1, 0))
+        if n == -1:
+            self._scanned = len(buffer)
+            self._check_header_size(len(buffer))
+            return None
+        self._scanned = 0
+        self._check_header_size(n + len(constants.CRLF_BIN))
+        self._header_size += n + len(constants.CRLF_BIN)
+        line = buffer.peek(n)
+        buffer.consume(n + len(constants.CRLF_BIN))
+        return line
+
+    ## Check size of status line and headers.
+    # @param size (int) bytes about to be parsed.
+    #
+    def _check_header_size(
+        self,
+        size,
+    ):
+        if self._header_size + size > self._max_header_size:
+            raise HTTPError(
+                code=431,
+                status="Request Header Fields Too Large",
+                message="headers too large",
+            )
+
+    ## Recieve first line of message.
+    # @param buffer (Buffer) buffer of message.
+    # @returns (list) three parts of first line, None if it is not
+    # complete.
+    #
+    # Empty lines before first line are ignored.
+    #
+    def recv_first_line(
+        self,
+        buffer,
+    ):
+        while self.state == constants.PARSE_FIRST_LINE:
+            line = self.recv_line(buffer)
+            if line is None:
+                return None
+            if not line:
+                continue
+            parts = line.split(" ", 2)
+            if len(parts) != 3:
+                raise HTTPError(
+                    code=400,
+                    status="Bad Request",
+                    message="Incomplete HTTP protocol",
+                )
+            self.first_line = parts
+            self.state = constants.PARSE_HEADERS
+        return self.first_line
+
+    ## Recieve headers of message.
+    # @param buffer (Buffer) buffer of message.
+    # @param wanted (set) names of headers to keep in @ref headers.
+    # @param content (optional, bool) whether message may have content,
+    # False for responses which never do.
+    # @returns (bool) whether all headers were recieved.
+    #
+    # The empty line ending headers is searched forward from the bytes
+    # already searched, and only the header block is split, content or
+    # pipelined messages after it are never scanned or copied.
+    # Until the empty line is recieved, complete header lines are parsed
+    # and consumed, so the header block never has to fit in the buffer at
+    # once.
+    #
+    def recv_headers(
+        self,
+        buffer,
+        wanted,
+        content=True,
+    ):
+        if self.state != constants.PARSE_HEADERS:
+            return True
+        if buffer.peek(len(constants.CRLF_BIN)) == constants.CRLF_BIN:
+            end = 0
+        else:
+            end = buffer.find(
+                constants.CRLF_BIN * 2,
+                max(self._scanned - len(constants.CRLF_BIN * 2) + 1, 0),
+            )
+            if end == -1:
+                self._scanned = len(buffer)
+                self._recv_header_lines(buffer, wanted)
+                return False
+            end += len(constants.CRLF_BIN)
+        self._scanned = 0
+        self._check_header_size(end + len(constants.CRLF_BIN))
+        self._parse_header_lines(buffer, end, wanted)
+        buffer.consume(len(constants.CRLF_BIN))
+        self._header_size += len(constants.CRLF_BIN)
+        self._start_content(content)
+        return True
+
+    ## Recieve complete header lines before end of headers.
+    # @param buffer (Buffer) buffer of message, holding no empty line.
+    # @param wanted (set) names of headers to keep in @ref headers.
+    #
+    # Called when the empty line was not recieved, so all of buffer is
+    # headers and the last end of line is found without reaching content.
+    #
+    def _recv_header_lines(
+        self,
+        buffer,
+        wanted,
+    ):
+        end = buffer.rfind(constants.CRLF_BIN)
+        if end == -1:
+            self._check_header_size(len(buffer))
+            return
+        end += len(constants.CRLF_BIN)
+        self._check_header_size(end)
+        self._parse_header_lines(buffer, end, wanted)
+        self._scanned = len(buffer)
+        self._check_header_size(len(buffer))
+
+    ## Parse and consume header lines.
+    # @param buffer (Buffer) buffer of message.
+    # @param end (int) offset after CRLF of last line.
+    # @param wanted (set) names of headers to keep in @ref headers.
+    #
+    def _parse_header_lines(
+        self,
+        buffer,
+        end,
+        wanted,
+    ):
+        lines = buffer.peek(end).split(constants.CRLF_BIN)[:-1]
+        if self._header_count + len(lines) > self._max_headers:
+            raise HTTPError(
+                code=431,
+                status="Request Header Fields Too Large",
+                message="Exceeded max number of headers",
+            )
+        for line in lines:
+            self._header_count += 1
+            name, value = parse_header(line)
+            lower = name.lower()
+            if lower == "content-length":
+                try:
+                    self._content_length = int(value)
+                except ValueError:
+                    self._content_length = -1
+                if self._content_length < 0:
+                    raise HTTPError(
+                        code=400,
+                        status="Bad Request",
+                        message="Invalid Content-Length",
+                    )
+            elif lower == "transfer-encoding":
+                self._chunked = value.lower().endswith("chunked")
+            if name in wanted:
+                self.headers[name] = value
+        self._header_size += end
+        buffer.consume(end)
+
+    ## Start content after headers.
+    # @param content (bool) whether message may have content.
+    #
+    # Content is chunked if Transfer-Encoding says so, otherwise it is
+    # Content-Length bytes, or there is none.
+    #
+    def _start_content(
+        self,
+        content,
+    ):
+        if not content:
+            self.state = constants.PARSE_DONE
+        elif self._chunked:
+            self.state = constants.PARSE_CHUNK_SIZE
+        elif self._content_length:
+            self._left = self._content_length
+            self.state = constants.PARSE_CONTENT
+        else:
+            self.state = constants.PARSE_DONE
+
+    ## Recieve content of message.
+    # @param buffer (Buffer) buffer of message.
+    # @param max_size (optional, int) max bytes to return, None for all.
+    # @returns (str) content consumed from buffer, without chunk framing.
+    #
+    # Message is complete once @ref state is PARSE_DONE.
+    #
+    def recv_content(
+        self,
+        buffer,
+        max_size=None,
+    ):
+        content = []
+        size = 0
+        while max_size is None or size < max_size:
+            if self.state in (
+                constants.PARSE_CONTENT,
+                constants.PARSE_CHUNK_DATA,
+            ):
+                n = min(self._left, len(buffer))
+                if max_size is not None:
+                    n = min(n, max_size - size)
+                if not n:
+                    break
+                content.append(buffer.peek(n))
+                buffer.consume(n)
+                size += n
+                self._left -= n
+                if not self._left:
+                    self.state = {
+                        constants.PARSE_CONTENT: constants.PARSE_DONE,
+                        constants.PARSE_CHUNK_DATA: constants.PARSE_CHUNK_END,
+                    }[self.state]
+            elif self.state == constants.PARSE_CHUNK_SIZE:
+                self._header_size = 0
+                line = self.recv_line(buffer)
+                if line is None:
+                    break
+                try:
+                    self._left = int(line.split(";", 1)[0].strip(), 16)
+                except ValueError:
+                    self._left = -1
+                if self._left < 0:
+                    raise HTTPError(
+                        code=400,
+                        status="Bad Request",
+                        message="Invalid chunk size",
+                    )
+                if self._left:
+                    self.state = constants.PARSE_CHUNK_DATA
+                else:
+                    self.state = constants.PARSE_TRAILERS
+            elif self.state == constants.PARSE_CHUNK_END:
+                if len(buffer) < len(constants.CRLF_BIN):
+                    break
+                if buffer.peek(len(constants.CRLF_BIN)) != constants.CRLF_BIN:
+                    raise HTTPError(
+                        code=400,
+                        status="Bad Request",
+                        message="Invalid chunk end",
+                    )
+                buffer.consume(len(constants.CRLF_BIN))
+                self.state = constants.PARSE_CHUNK_SIZE
+            elif self.state == constants.PARSE_TRAILERS:
+                line = self.recv_line(buffer)
+                if line is None:
+                    break
+                if not line:
+                    self.state = constants.PARSE_DONE
+            else:
+                break
+        return "".join(content)
+
+
 ## Get first line of HTTP request.
-# @param buffer (str) request buffer.
+# @param parser (HttpParser) parser of request.
+# @param buffer (Buffer) request buffer.
 # @param request_context (dict) request context
 # of @ref onion_routing.registry.pollables.http_socket.
 #
 # @returns (bool) whether first line is HTTP protocol
-# request with supported methods.
+# request with supported methods, False if it is not complete.
 #
 def get_first_line(
+    parser,
     buffer,
     request_context,
 ):
-    req, buffer = recv_line(buffer)
+    req_comps = parser.recv_first_line(buffer)
+    if not req_comps:
+        return False
 
-    if not req:
-        return False, buffer
-
-    req_comps = req.split(" ", 2)
-    if len(req_comps) != 3:
-        raise RuntimeError("Incomplete HTTP protocol")
     if req_comps[2] != constants.HTTP_SIGNATURE:
-        raise RuntimeError("Not HTTP protocol")
+        raise HTTPError(
+            code=505,
+            status="HTTP Version Not Supported",
+            message="Not HTTP protocol",
+        )
 
     method, uri, signature = req_comps
     if method != 'GET':
-        raise RuntimeError(
-            "HTTP unsupported method '%s'" % method
+        raise HTTPError(
+            code=405,
+            status="Method Not Allowed",
+            message="HTTP unsupported method '%s'" % method,
         )
     if not uri or uri[0] != '/':
-        raise RuntimeError("Invalid URI")
+        raise HTTPError(
+            code=400,
+            status="Bad Request",
+            message="Invalid URI",
+        )
 
     request_context["uri"] = uri
     request_context["parse"] = urlparse.urlparse(uri)
 
-    return True, buffer
-
-
-## Get headers of HTTP request.
-# @param buffer (str) request buffer.
-# @param request_context (dict) request context.
-# @param service_class (service) service class for wanted headers.
-# @returns (bool) whether end of headers was read.
-#
-# Goes over buffer and reads lines until buffer is empty.
-# More headers than MAX_NUMBER_OF_HEADERS raises RuntimeError.
-#
-def get_headers(
-    buffer,
-    request_context,
-    service_class,
-):
-    request_context["request_headers"] = {}
-    finished = False
-    for i in range(constants.MAX_NUMBER_OF_HEADERS):
-        line, buffer = recv_line(buffer)
-        if line is None:
-            break
-        if line == "":
-            finished = True
-            break
-        line = parse_header(line)
-        if line[0] in service_class.wanted_headers():
-            request_context["request_headers"][line[0]] = line[1]
-    else:
-        raise RuntimeError("Exceeded max number of headers")
-    return finished, buffer
-
-
-## Get content of HTTP request.
-# @param buffer (str) request buffer.
-# @param request_context (dict) request context.
-# @returns (str) buffer without read content.
-#
-# Goes over buffer and reads all content according to content_length header.
-#
-def get_content(
-    buffer,
-    request_context,
-):
-    if "content_length" in request_context:
-        content = buffer[:min(
-            request_context["content_length"],
-            request_context[
-                "app_context"
-            ]["max_buffer_size"] - len(request_context["content"]),
-        )]
-        request_context["content"] += content
-        request_context["content_length"] -= len(content)
-        buffer = buffer[len(content):]
-    return buffer
+    return True
 
 
 ## Set headers for HTTP response.
@@ -142,22 +420,6 @@ def set_headers(
     return True, buffer
 
 
-## Recv line.
-# @param buffer (str) request buffer.
-#
-# @returns (str, str) buffer until "\r\n", buffer after "\r\n".
-#
-def recv_line(buffer):
-    n = buffer.find(constants.CRLF_BIN)
-
-    if n == -1:
-        return None
-
-    line = buffer[:n].decode("utf-8")
-    buffer = buffer[n + len(constants.CRLF_BIN):]
-    return line, buffer
-
-
 ## Parse HTTP header.
 # @param header (string) original header line from request.
 # @returns (str, str) header title, header content.
@@ -166,7 +428,11 @@ def parse_header(header):
     SEP = ':'
     n = header.find(SEP)
     if n == -1:
-        raise RuntimeError('Invalid header received')
+        raise HTTPError(
+            code=400,
+            status="Bad Request",
+            message="Invalid header received",
+        )
     return header[:n].rstrip(), header[n + len(SEP):].lstrip()
 
 
@@ -0,0 +1,339 @@
+#!/usr/bin/python
+## @package onion_routing.common.utilities.path_util
+# utilities for choosing nodes of circuits.
+## @file path_util.py
+# Implementation of @ref onion_routing.common.utilities.path_util
+#
+
+import random
+
+from common import constants
+
+
+## Fenwick Tree.
+#
+# Binary indexed tree of weights, updating a weight, the total weight and
+# finding the index at a prefix of the total all take O(log n).
+#
+class FenwickTree(object):
+
+    ## Constructor.
+    # @param weights (list) initial weights.
+    #
+    # Built in O(n).
+    #
+    def __init__(
+        self,
+        weights,
+    ):
+        ## Weights by index.
+        self._weights = list(weights)
+
+        ## Tree, index 0 is not used.
+        self._tree = [0.0] + self._weights
+        for i in range(1, len(self._tree)):
+            parent = i + (i & -i)
+            if parent < len(self._tree):
+                self._tree[parent] += self._tree[i]
+
+        ## Largest power of two not above number of weights.
+        self._mask = 1
+        while self._mask * 2 <= len(self._weights):
+            self._mask *= 2
+
+    ## Weight of index.
+    # @param index (int) index.
+    # @returns (float) weight.
+    #
+    def get(
+        self,
+        index,
+    ):
+        return self._weights[index]
+
+    ## Weights by index.
+    @property
+    def weights(self):
+        return list(self._weights)
+
+    ## Set weight of index.
+    # @param index (int) index.
+    # @param weight (float) new weight.
+    #
+    def set(
+        self,
+        index,
+        weight,
+    ):
+        delta = weight - self._weights[index]
+        self._weights[index] = weight
+        i = index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    ## Total weight.
+    # @returns (float) sum of weights.
+    #
+    def total(self):
+        total = 0.0
+        i = len(self._weights)
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    ## Find index at prefix of total weight.
+    # @param value (float) value in [0, total).
+    # @returns (int) smallest index whose prefix sum exceeds value.
+    #
+    def find(
+        self,
+        value,
+    ):
+        index = 0
+        mask = self._mask
+        while mask:
+            i = index + mask
+            if i < len(self._tree) and self._tree[i] <= value:
+                index = i
+                value -= self._tree[i]
+            mask //= 2
+        return min(index, len(self._weights) - 1)
+
+    ## Number of weights.
+    def __len__(self):
+        return len(self._weights)
+
+
+## Path Selector.
+#
+# Chooses nodes of circuits at random, weighted by their spare capacity
+# and by RTT and throughput measured by this node.
+# Weights are kept in a @ref FenwickTree which is rebuilt only when
+# directory version changes, a new measurement updates the weight of its
+# node in place.
+#
+# Weight of node is max(capacity - load, 1) times its score, the score is
+# (PATH_DEFAULT_RTT / rtt) * (throughput / PATH_DEFAULT_THROUGHPUT),
+# bounded to [1 / PATH_WEIGHT_SPREAD, PATH_WEIGHT_SPREAD], a metric which
+# was not measured yet counts as default.
+# Measurements are exponential moving averages, NODE_STATS_ALPHA is the
+# weight of a new sample. RTT is measured while circuits are built and by
+# probes, see @ref entry.pollables.probe_socket.
+#
+class PathSelector(object):
+
+    ## Measured metrics of node.
+    # - rtt: seconds of socks5 greeting round trip.
+    # - throughput: bytes per second of streams.
+    # - handshake: seconds of connect and greeting of probes.
+    #
+    METRICS = (
+        "rtt",
+        "throughput",
+        "handshake",
+    )
+
+    ## Constructor.
+    def __init__(self):
+        ## Directory version of @ref _tree, (epoch, version).
+        self._version = None
+
+        ## Nodes of @ref _tree, by index.
+        self._nodes = []
+
+        ## Index of every node name.
+        self._index = {}
+
+        ## Weights of nodes.
+        self._tree = FenwickTree([])
+
+        ## Measurements.
+        # key - node name, value - dict of @ref METRICS, None until
+        # measured.
+        #
+        self._stats = {}
+
+    ## Rebuild weights if directory changed.
+    # @param registry (dict) nodes, key - node name, value - node.
+    # @param version (tuple) version of registry.
+    #
+    # Measurements of nodes which left directory are dropped.
+    #
+    def update(
+        self,
+        registry,
+        version,
+    ):
+        if version == self._version:
+            return
+        self._version = version
+        self._nodes = registry.values()
+        self._index = dict(
+            (node["name"], i) for i, node in enumerate(self._nodes)
+        )
+        for name in self._stats.keys():
+            if name not in self._index:
+                del self._stats[name]
+        self._tree = FenwickTree([self._weight(n) for n in self._nodes])
+
+    ## Choose nodes.
+    # @param count (int) number of nodes.
+    # @param accept (callable) called with a chosen node, returns the node
+    # to use or None to skip it.
+    # @param exclude (optional, set) names of nodes not to choose.
+    # @returns (list) distinct chosen nodes, fewer than count if not
+    # enough nodes are accepted.
+    #
+    # Chosen and skipped nodes are removed from the tree while choosing, so
+    # every choice is O(log n) and a node is never drawn twice. If rounding
+    # of updates made the tree point at a removed node, the tree is rebuilt
+    # from its weights.
+    #
+    def choose(
+        self,
+        count,
+        accept,
+        exclude=(),
+    ):
+        removed = {}
+        chosen = []
+        try:
+            for name in exclude:
+                self._remove(self._index.get(name), removed)
+            while (
+                len(chosen) < count and
+                len(removed) < len(self._nodes)
+            ):
+                i = self._tree.find(random.random() * self._tree.total())
+                if i in removed:
+                    self._tree = FenwickTree(self._tree.weights)
+                    continue
+                node = accept(self._nodes[i])
+                self._remove(i, removed)
+                if node is not None:
+                    chosen.append(node)
+        finally:
+            for i, weight in removed.items():
+                self._tree.set(i, weight)
+        return chosen
+
+    ## Record round trip time of node.
+    # @param name (str) node name.
+    # @param rtt (float) seconds.
+    #
+    def record_rtt(
+        self,
+        name,
+        rtt,
+    ):
+        self._record(name, "rtt", rtt)
+
+    ## Record throughput of nodes.
+    # @param names (list) names of nodes which carried the data.
+    # @param throughput (float) bytes per second.
+    #
+    def record_throughput(
+        self,
+        names,
+        throughput,
+    ):
+        for name in set(names):
+            self._record(name, "throughput", throughput)
+
+    ## Record probe of node.
+    # @param name (str) node name.
+    # @param handshake (float) seconds of connect and greeting, None if
+    # probe failed.
+    # @param rtt (float) seconds of greeting round trip, None if probe
+    # failed.
+    #
+    # A failed probe counts as a handshake and round trip of
+    # PROBE_TIMEOUT seconds.
+    #
+    def record_probe(
+        self,
+        name,
+        handshake,
+        rtt,
+    ):
+        if handshake is None:
+            handshake = rtt = constants.PROBE_TIMEOUT
+        self._record(name, "handshake", handshake)
+        self._record(name, "rtt", max(rtt, constants.PATH_MIN_RTT))
+
+    ## Measurements of node.
+    # @param name (str) node name.
+    # @returns (dict) @ref METRICS, None if not measured.
+    #
+    def stats(
+        self,
+        name,
+    ):
+        return self._stats.get(name, dict.fromkeys(PathSelector.METRICS))
+
+    ## Measurements of all measured nodes.
+    # @returns (list) node name and its @ref stats, by name.
+    #
+    def measured(self):
+        return sorted(self._stats.items())
+
+    ## Record measurement and update weight of node.
+    # @param name (str) node name.
+    # @param metric (str) one of @ref METRICS.
+    # @param value (float) measured value.
+    #
+    def _record(
+        self,
+        name,
+        metric,
+        value,
+    ):
+        index = self._index.get(name)
+        if index is None:
+            return
+        stats = self._stats.setdefault(
+            name,
+            dict.fromkeys(PathSelector.METRICS),
+        )
+        if stats[metric] is None:
+            stats[metric] = value
+        else:
+            stats[metric] += constants.NODE_STATS_ALPHA * (
+                value - stats[metric]
+            )
+        self._tree.set(index, self._weight(self._nodes[index]))
+
+    ## Remove node from tree while choosing.
+    # @param index (int) index of node, ignored if None or removed.
+    # @param removed (dict) weights of removed nodes by index.
+    #
+    def _remove(
+        self,
+        index,
+        removed,
+    ):
+        if index is not None and index not in removed:
+            removed[index] = self._tree.get(index)
+            self._tree.set(index, 0.0)
+
+    ## Weight of node.
+    # @param node (dict) node.
+    # @returns (float) weight.
+    #
+    def _weight(
+        self,
+        node,
+    ):
+        stats = self._stats.get(node["name"], {})
+        score = 1.0
+        if stats.get("rtt"):
+            score *= constants.PATH_DEFAULT_RTT / stats["rtt"]
+        if stats.get("throughput"):
+            score *= stats["throughput"] / constants.PATH_DEFAULT_THROUGHPUT
+        score = min(
+            max(score, 1.0 / constants.PATH_WEIGHT_SPREAD),
+            constants.PATH_WEIGHT_SPREAD,
+        )
+        return max(node["capacity"] - node["load"], 1) * score
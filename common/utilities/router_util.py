@@ -0,0 +1,82 @@
+#!/usr/bin/python
+## @package onion_routing.common.utilities.router_util
+# utilities for routing HTTP requests to services.
+## @file router_util.py
+# Implementation of @ref onion_routing.common.utilities.router_util
+#
+
+import importlib
+import re
+
+
+## Router.
+#
+# Maps request paths to services, built once and shared by all sockets.
+# Every service serves the path NAME, or every path starting with NAME if
+# its PREFIX is set.
+# Exact paths are looked up in a dict, prefixes are compiled to a single
+# regular expression which tries the longest prefix first.
+#
+class Router(object):
+
+    ## Constructor.
+    # @param services (list) service classes.
+    #
+    # Raises RuntimeError if two services serve the same path.
+    #
+    def __init__(
+        self,
+        services,
+    ):
+        ## Services of exact paths.
+        self._exact = {}
+
+        ## Services of prefixes.
+        self._prefixes = {}
+
+        for service in services:
+            routes = self._prefixes if service.PREFIX else self._exact
+            if service.NAME in routes:
+                raise RuntimeError(
+                    "%s and %s both serve %s" % (
+                        routes[service.NAME].__name__,
+                        service.__name__,
+                        service.NAME,
+                    )
+                )
+            routes[service.NAME] = service
+
+        ## Regular expression matching longest prefix of path.
+        self._prefix_re = re.compile(
+            "|".join(
+                re.escape(prefix) for prefix in sorted(
+                    self._prefixes,
+                    key=len,
+                    reverse=True,
+                )
+            ) or "(?!)"
+        )
+
+    ## Route path.
+    # @param path (str) path of request.
+    # @returns (type) service class of path, None if no service serves it.
+    #
+    def route(
+        self,
+        path,
+    ):
+        service = self._exact.get(path)
+        if service is None:
+            match = self._prefix_re.match(path)
+            if match:
+                service = self._prefixes[match.group(0)]
+        return service
+
+
+## Load class.
+# @param path (str) full path of class, module and class name.
+# @returns (type) the class.
+#
+def load(path):
+    module, name = path.rsplit(".", 1)
+    return getattr(importlib.import_module(module), name)
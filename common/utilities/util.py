@@ -5,10 +5,15 @@
 # Implementation of @ref onion_routing.common.utilities.util
 #
 
+import ctypes
+import ctypes.util
 import errno
+import logging
 import os
 import signal
 import socket
+import sys
+import time
 
 from common import constants
 
@@ -21,53 +26,128 @@ class DisconnectError(RuntimeError):
 
 ## Recieve message from socket.
 # @param sock (socket) the socket to recieve data from.
+# @param buffer (@ref common.utilities.buffer_util.Buffer) buffer to
+# recieve data into.
 # @param max_buffer_size (int) max size of bytes to read.
-# @returns (str) recieved data.
+# @returns (int) number of bytes recieved.
 #
 # Reads as much as possible from socket until maximum size is reached.
 #
 def recieve_buffer(
     sock,
+    buffer,
     max_buffer_size,
 ):
-    buffer = ""
+    recieved = 0
     try:
-        while len(buffer) < max_buffer_size:
-            data = sock.recv(
-                max_buffer_size,
+        while recieved < max_buffer_size:
+            n = buffer.recv_into(
+                sock,
+                max_buffer_size - recieved,
             )
-            if not data:
+            if not n:
                 raise DisconnectError()
-            buffer += data
+            recieved += n
     except socket.error as e:
         if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
             raise
-    return buffer
+    return recieved
 
 
 ## Sending message to socket.
 # @param sock (socket) the socket to send data to.
-# @param buffer (str) buffer to send.
-# @returns (str) the remaining buffer.
+# @param buffer (@ref common.utilities.buffer_util.Buffer) buffer to send.
+# @returns (int) number of bytes sent.
 #
-# Sends to socket as much as possible.
+# Sends to socket as much as possible, sent data is consumed from buffer.
 #
 def send_buffer(
     sock,
     buffer,
 ):
+    sent = 0
     try:
         while buffer:
-            buffer = buffer[
-                sock.send(
-                    buffer
-                ):
-            ]
+            sent += buffer.send(sock)
     except socket.error as e:
-        if e.errno != errno.EPIPE:
+        if e.errno == errno.EPIPE:
+            buffer.clear()
+        elif e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+            raise
+    return sent
+
+
+## Find sendfile of system.
+# @returns (callable) sendfile(out_fd, in_fd, offset, count) returning
+# number of bytes sent, None if system does not support it.
+#
+# os.sendfile if python has it, otherwise sendfile64 of libc on Linux.
+#
+def _find_sendfile():
+    if hasattr(os, "sendfile"):
+        return os.sendfile
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        c_sendfile = libc.sendfile64
+    except (OSError, AttributeError):
+        return None
+    c_sendfile.argtypes = (
+        ctypes.c_int,
+        ctypes.c_int,
+        ctypes.POINTER(ctypes.c_int64),
+        ctypes.c_size_t,
+    )
+    c_sendfile.restype = ctypes.c_ssize_t
+
+    def sendfile(
+        out_fd,
+        in_fd,
+        offset,
+        count,
+    ):
+        c_offset = ctypes.c_int64(offset)
+        sent = c_sendfile(out_fd, in_fd, ctypes.byref(c_offset), count)
+        if sent < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        return sent
+    return sendfile
+
+
+## sendfile of system, see @ref _find_sendfile.
+SENDFILE = _find_sendfile()
+
+
+## Sending file to socket without copying it to a buffer.
+# @param sock (socket) the socket to send data to.
+# @param fd (int) file descriptor of file.
+# @param offset (int) offset in file to send from.
+# @param count (int) number of bytes to send.
+# @returns (int) number of bytes sent.
+#
+# Sends to socket as much as possible using @ref SENDFILE, which must be
+# supported.
+# File which ends before count bytes raises RuntimeError.
+#
+def send_file(
+    sock,
+    fd,
+    offset,
+    count,
+):
+    sent = 0
+    try:
+        while sent < count:
+            n = SENDFILE(sock.fileno(), fd, offset + sent, count - sent)
+            if not n:
+                raise RuntimeError("Unexpected end of file")
+            sent += n
+    except (OSError, socket.error) as e:
+        if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
             raise
-        return ""
-    return buffer
+    return sent
 
 
 ## Reading data from file.
@@ -122,6 +202,26 @@ def connect(
             raise
 
 
+## Send data written to socket without delay.
+# @param sock (socket) the socket.
+#
+# Disables Nagle algorithm, which holds small writes until previous ones
+# are acknowledged. Only TCP sockets have the option, other sockets, like
+# unix socket pairs, are left as they are.
+#
+def set_nodelay(sock):
+    if (
+        sock.family not in (socket.AF_INET, socket.AF_INET6) or
+        sock.type != socket.SOCK_STREAM
+    ):
+        return
+    sock.setsockopt(
+        socket.IPPROTO_TCP,
+        socket.TCP_NODELAY,
+        1,
+    )
+
+
 ## Damonize process.
 #
 # 1. Forking process and closing parent.
@@ -155,3 +255,79 @@ def daemonize():
     child = os.fork()
     if child != 0:
         os._exit(0)
+
+
+## Fork worker processes.
+# @param workers (int) number of worker processes.
+# @param on_exit (optional, callable) called with index of worker which
+# died, before it is forked again.
+# @returns (int) index of worker in worker processes, None in parent once
+# all workers exited.
+#
+# Parent forwards SIGINT and SIGTERM to the workers and waits for them.
+# A worker which was killed or failed is forked again, at most once every
+# WORKER_RESPAWN_DELAY seconds. A worker which exits cleanly without a
+# signal of parent stopped on its own, like a node whose registration
+# failed, so all workers are stopped.
+#
+def fork_workers(
+    workers,
+    on_exit=None,
+):
+    if os.name == "nt":
+        raise RuntimeError("Workers not available on Windows...")
+
+    children = {}
+    stopping = []
+
+    def fork(index):
+        child = os.fork()
+        if child == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            return True
+        children[child] = (index, time.time())
+        return False
+
+    def stop(signum):
+        stopping.append(signum)
+        for child in children:
+            try:
+                os.kill(child, signum)
+            except OSError as e:
+                if e.errno != errno.ESRCH:
+                    raise
+
+    def exit_handler(signum, frame):
+        stop(signum)
+
+    signal.signal(signal.SIGINT, exit_handler)
+    signal.signal(signal.SIGTERM, exit_handler)
+
+    for index in range(workers):
+        if fork(index):
+            return index
+
+    while children:
+        try:
+            child, status = os.wait()
+        except OSError as e:
+            if e.errno != errno.EINTR:
+                raise
+            continue
+        index, started = children.pop(child)
+        if stopping:
+            continue
+        if os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0:
+            logging.info("worker %d stopped, stopping workers" % index)
+            stop(signal.SIGTERM)
+            continue
+
+        logging.error("worker %d died, forking it again" % index)
+        if on_exit:
+            on_exit(index)
+        time.sleep(
+            max(started + constants.WORKER_RESPAWN_DELAY - time.time(), 0)
+        )
+        if not stopping and fork(index):
+            return index
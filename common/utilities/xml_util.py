@@ -7,6 +7,7 @@
 
 import logging
 import os
+import time
 import traceback
 
 from common import constants
@@ -23,6 +24,9 @@ class XmlHandler(object):
     # @param path (str) path for the xml file.
     # @param data (dict) dict with all data to store in xml.
     # @param type
+    # @param selector (optional,
+    # @ref common.utilities.path_util.PathSelector) measurements of nodes
+    # shown along with connections.
     #
     # Creates new xml file.
     #
@@ -31,11 +35,13 @@ class XmlHandler(object):
         path,
         data,
         type,
+        selector=None,
     ):
         self._path = path
         self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
         self._data = data
         self._type = type
+        self._selector = selector
 
     ## Close xml file.
     # deletes the existing file.
@@ -57,6 +63,10 @@ class XmlHandler(object):
             raise RuntimeError("type not supprted, something wrong with xml.")
 
     ## Connections XML update.
+    # Connections show time to first byte in milliseconds, measured nodes
+    # show handshake and RTT in milliseconds and throughput in KiB per
+    # second, "-" if not measured.
+    #
     def _connections(self):
         os.lseek(self._fd, 0, os.SEEK_SET)
         util.write_file(
@@ -74,13 +84,25 @@ class XmlHandler(object):
                     self._data[c]["in"]["bytes"],
                     self._data[c]["out"]["fd"],
                     self._data[c]["out"]["bytes"],
+                    _scaled(self._data[c]["ttfb"], 1),
                 )
         except Exception:
             logging.error(traceback.format_exc())
 
+        latencies = ""
+        if self._selector is not None:
+            for name, stats in self._selector.measured():
+                latencies += constants.XML_LATENCY_BLOCK_LAYOUT % (
+                    name,
+                    _scaled(stats["handshake"], 1000),
+                    _scaled(stats["rtt"], 1000),
+                    _scaled(stats["throughput"], 1.0 / 1024),
+                )
+
         xml = constants.XML_CONNECTION_LAYOUT % (
             len(self._data),
             connections,
+            latencies,
         )
 
         util.write_file(
@@ -89,6 +111,9 @@ class XmlHandler(object):
         )
 
     ## Nodes XML update.
+    # Every node shows seconds until it expires unless it sends a
+    # heartbeat.
+    #
     def _nodes(self):
         os.lseek(self._fd, 0, os.SEEK_SET)
         util.write_file(
@@ -98,11 +123,13 @@ class XmlHandler(object):
         os.lseek(self._fd, 0, os.SEEK_SET)
 
         nodes = ""
+        now = time.time()
         try:
-            for port in self._data:
+            for node in self._data.values():
                 nodes += constants.XML_NODES_BLOCK_LAYOUT % (
-                    self._data[port],
-                    port,
+                    node["address"],
+                    node["port"],
+                    max(0, int(node["expires"] - now)),
                 )
         except Exception:
             logging.error(traceback.format_exc())
@@ -116,3 +143,17 @@ class XmlHandler(object):
             self._fd,
             xml,
         )
+
+
+## Scaled measurement.
+# @param value (float) measurement, None if not measured.
+# @param scale (float) factor of unit.
+# @returns (str) value times scale rounded, "-" if not measured.
+#
+def _scaled(
+    value,
+    scale,
+):
+    if value is None:
+        return "-"
+    return str(int(round(value * scale)))
@@ -13,6 +13,8 @@ import signal
 from common import constants
 from common.async import async_server
 from common.async import event_object
+from common.pollables import dns_resolver
+from common.utilities import path_util
 from common.utilities import util
 from common.utilities import xml_util
 from entry.pollables import entry_node
@@ -55,7 +57,7 @@ def parse_args():
         "--timeout",
         default=constants.DEFAULT_TIMEOUT,
         type=int,
-        help="timeout, default: %(default)s",
+        help="poll timeout in ms, negative blocks, default: %(default)s",
     )
     parser.add_argument(
         "--max-connections",
@@ -69,6 +71,42 @@ def parse_args():
         type=int,
         help="Max size of reading buffer, default: %(default)s",
     )
+    parser.add_argument(
+        "--circuit-pool-size",
+        default=constants.DEFAULT_CIRCUIT_POOL_SIZE,
+        type=int,
+        help="Number of prebuilt circuits, 0 disables, default: %(default)s",
+    )
+    parser.add_argument(
+        "--hops",
+        default=constants.OPTIMAL_NODES_IN_PATH,
+        type=int,
+        choices=range(1, constants.MAX_NODES_IN_PATH + 1),
+        metavar="{1..%d}" % constants.MAX_NODES_IN_PATH,
+        help=(
+            "Number of nodes in path, 1 for low latency trusted traffic, "
+            "default: %(default)s"
+        ),
+    )
+    parser.add_argument(
+        "--allow-short-paths",
+        default=False,
+        action="store_true",
+        help=(
+            "Build circuits of less than --hops nodes when registry does "
+            "not have enough nodes, default: %(default)s"
+        ),
+    )
+    parser.add_argument(
+        "--optimistic-data",
+        default=False,
+        action="store_true",
+        help=(
+            "Answer browser success before destination is connected, so "
+            "its first data follows the BEGIN cell. Browser sees a failed "
+            "connection as a closed connection, default: %(default)s"
+        ),
+    )
     parser.add_argument(
         "--log-level",
         default="INFO",
@@ -103,9 +141,15 @@ def __main__():
         "timeout": args.timeout,
         "max_connections": args.max_connections,
         "max_buffer_size": args.max_buffer_size,
+        "circuit_pool_size": args.circuit_pool_size,
+        "hops": args.hops,
+        "allow_short_paths": args.allow_short_paths,
+        "optimistic_data": args.optimistic_data,
         "base": args.base,
 
         "registry": {},
+        "registry_version": None,
+        "path_selector": path_util.PathSelector(),
         "connections": {},
         "http_address": config.get("Registry", "bind.address"),
         "http_port": config.getint("Registry", "bind.port"),
@@ -115,24 +159,31 @@ def __main__():
         config.get("xmlFile", "path"),
         application_context["connections"],
         type=constants.XML_CONNECTIONS,
+        selector=application_context["path_selector"],
     )
 
     def exit_handler(signal, frame):
         server.close_server()
+        xml_timer.cancel()
         xml.close()
 
-    def alarm_handler(signum, frame):
-        xml.update()
-        signal.alarm(constants.XML_TIME_UPDATE)
-
     signal.signal(signal.SIGINT, exit_handler)
     signal.signal(signal.SIGTERM, exit_handler)
-    signal.signal(signal.SIGALRM, alarm_handler)
 
     server = async_server.AsyncServer(
         application_context,
     )
 
+    xml_timer = server.add_timer(
+        constants.XML_TIME_UPDATE,
+        xml.update,
+        interval=constants.XML_TIME_UPDATE,
+    )
+
+    resolver = dns_resolver.DnsResolver(application_context)
+    application_context["resolver"] = resolver
+    server.add_socket(resolver)
+
     node = server.add_listener(
         entry_node.EntryNode,
         config.get("EntryNode", "bind.address"),
@@ -142,7 +193,6 @@ def __main__():
 
     logging.info("Starting the async server...")
 
-    signal.alarm(constants.XML_TIME_UPDATE)
     server.run()
 
     logging.info(
@@ -5,16 +5,19 @@
 # Implementation of @ref onion_routing.entry.pollables.entry_node
 #
 
+import collections
 import logging
 import random
 import socket
+import time
 import traceback
 
 from common import constants
-from common.pollables import proxy_socket
 from common.pollables import listener_socket
 from common.pollables import http_client
+from entry.pollables import probe_socket
 from entry.pollables import socks5_client
+from entry.pollables import socks5_stream
 
 
 ## Entry Node.
@@ -30,7 +33,11 @@ class EntryNode(listener_socket.Listener):
     # @param listener_type (optional,
     # @ref onion_routing.common.pollables.tcp_socket) not used.
     #
-    # Gets Nodes from the Regsitry.
+    # Gets Nodes from the Regsitry, and starts a timer which refreshes
+    # them every DIRECTORY_REFRESH_INTERVAL seconds.
+    # Starts a timer which keeps a pool of prebuilt circuits, unless
+    # circuit_pool_size in app_context is 0.
+    # Starts a timer which probes every node each PROBE_INTERVAL seconds.
     #
     def __init__(
         self,
@@ -66,107 +73,375 @@ class EntryNode(listener_socket.Listener):
         )
         self.http_client.get_nodes()
 
+        ## Timer refreshing nodes from the registry.
+        self._directory_timer = app_context["timers"].add(
+            constants.DIRECTORY_REFRESH_INTERVAL,
+            self.http_client.get_nodes,
+            interval=constants.DIRECTORY_REFRESH_INTERVAL,
+        )
+
+        ## Circuits, oldest first.
+        # Circuits which are still establishing socks5 are included.
+        #
+        self._circuits = []
+
+        ## Times of recent browser connections, for sizing @ref _circuits.
+        self._connection_times = collections.deque()
+
+        ## Browser connections waiting for a circuit, oldest first.
+        # Tuples of accepted socket and time of accept.
+        #
+        self._pending = collections.deque()
+
+        ## Timer retrying @ref _pending, None while nothing is pending.
+        self._pending_timer = None
+
+        ## Timer refilling @ref _circuits.
+        self._pool_timer = None
+        if app_context["circuit_pool_size"] > 0:
+            self._pool_timer = app_context["timers"].add(
+                constants.CIRCUIT_POOL_REFILL_INTERVAL,
+                self._refill_circuits,
+                interval=constants.CIRCUIT_POOL_REFILL_INTERVAL,
+            )
+
+        ## Names of nodes waiting to be probed.
+        self._probe_queue = collections.deque()
+
+        ## Running probes.
+        # key - node name, value -
+        # @ref entry.pollables.probe_socket.ProbeSocket.
+        #
+        self._probes = {}
+
+        ## Time in which last round of probes was queued.
+        self._probe_round = 0
+
+        ## Timer starting queued probes.
+        self._probe_timer = app_context["timers"].add(
+            constants.PROBE_TICK,
+            self._probe_nodes,
+            interval=constants.PROBE_TICK,
+        )
+
     ## On read event.
-    # - Gets connected nodes from registry.
-    # - Accept new connection.
-    # - Create new @ref common.pollables.proxy_socket from the accepted socket
-    # as browser socket.
-    # - Create new @ref entry.pollables.socks5_client for establishing
-    # socks5 with other nodes as socks5_c.
-    # - Get Nodes from registry and choose a random path for anonymization.
-    # - Set browser_socket partner to socks5_c.
-    # - Add socks5_c to @ref common.async.async_server.AsyncServer._socket_data.
+    # - Accept new connection and queue it in @ref _pending.
+    # - Serve pending connections, see @ref _serve_pending().
+    # - Refill circuit pool for the next browser connection.
     #
     def on_read(self):
-        self.http_client.get_nodes()
         try:
-            browser_socket = None
-            socks5_c = None
-
             client, addr = self._socket.accept()
+        except Exception:
+            logging.error(traceback.format_exc())
+            return
+        now = time.time()
+        self._connection_times.append(now)
+        self._pending.append((client, now))
+        self._serve_pending()
+        self._refill_circuits()
 
-            browser_socket = proxy_socket.ProxySocket(
-                socket=client,
-                state=constants.ACTIVE,
-                app_context=self._app_context,
+    ## Serve browser connections waiting for a circuit.
+    # - Close connections which waited CIRCUIT_PENDING_TIMEOUT seconds.
+    # - Take a circuit for every connection, a new
+    # @ref entry.pollables.socks5_client is created with a random path for
+    # anonymization if no circuit can take another stream.
+    # - Create new @ref entry.pollables.socks5_stream from the accepted
+    # socket as a stream of the circuit.
+    # - Add stream to @ref common.async.async_server.AsyncServer.
+    #
+    # If no circuit can be created, because registry does not have enough
+    # nodes for a path, connections stay pending and are retried every
+    # CIRCUIT_PENDING_RETRY_INTERVAL seconds while nodes are requested
+    # from registry.
+    #
+    def _serve_pending(self):
+        if self._pending_timer:
+            self._pending_timer.cancel()
+            self._pending_timer = None
+        now = time.time()
+        while self._pending:
+            client, accept_time = self._pending[0]
+            if accept_time < now - constants.CIRCUIT_PENDING_TIMEOUT:
+                logging.error(
+                    "no circuit for connection in %s seconds" % (
+                        constants.CIRCUIT_PENDING_TIMEOUT,
+                    )
+                )
+                client.close()
+                self._pending.popleft()
+                continue
+            try:
+                circuit = self._take_circuit()
+            except Exception:
+                logging.debug("connection pending: %s" % (
+                    traceback.format_exc(),
+                ))
+                break
+            self._pending.popleft()
+            try:
+                stream = socks5_stream.Socks5Stream(
+                    socket=client,
+                    state=constants.ACTIVE,
+                    app_context=self._app_context,
+                    circuit=circuit,
+                )
+                self._app_context["add_socket"](stream)
+            except Exception:
+                logging.error(traceback.format_exc())
+                client.close()
+
+        if self._pending and self._state == constants.LISTEN:
+            self._pending_timer = self._app_context["timers"].add(
+                constants.CIRCUIT_PENDING_RETRY_INTERVAL,
+                self._serve_pending,
             )
 
-            socks5_c = socks5_client.Socks5Client(
-                socket=socket.socket(socket.AF_INET, socket.SOCK_STREAM),
-                state=constants.ACTIVE,
-                app_context=self._app_context,
-                browser_socket=browser_socket,
-                path=self._create_path(),
+    ## Add new circuit.
+    # @returns (@ref entry.pollables.socks5_client.Socks5Client) circuit
+    # which is establishing socks5 with a new random path.
+    #
+    def _add_circuit(self):
+        socks5_c = socks5_client.Socks5Client(
+            socket=socket.socket(socket.AF_INET, socket.SOCK_STREAM),
+            state=constants.ACTIVE,
+            app_context=self._app_context,
+            path=self._create_path(),
+        )
+        self._app_context["add_socket"](socks5_c)
+        self._circuits.append(socks5_c)
+        return socks5_c
+
+    ## Whether circuit can take another stream.
+    # @param circuit (@ref entry.pollables.socks5_client.Socks5Client)
+    # the circuit.
+    # @returns (bool) True if circuit is open, not expired and has less than
+    # CIRCUIT_MAX_STREAMS streams.
+    #
+    def _is_usable(
+        self,
+        circuit,
+    ):
+        return (
+            circuit.state == constants.ACTIVE and
+            not circuit.is_expired() and
+            circuit.stream_count < constants.CIRCUIT_MAX_STREAMS
+        )
+
+    ## Take a circuit for a new stream.
+    # @returns (@ref entry.pollables.socks5_client.Socks5Client) established
+    # circuit with the least streams, a circuit which is still establishing
+    # if there is none, or a new circuit.
+    #
+    def _take_circuit(self):
+        usable = [c for c in self._circuits if self._is_usable(c)]
+        if not usable:
+            return self._add_circuit()
+        return min(
+            usable,
+            key=lambda c: (not c.is_ready(), c.stream_count),
+        )
+
+    ## Refill circuit pool.
+    # - Forget closed circuits and close expired circuits without streams,
+    # so paths keep changing.
+    # - Pool size is the number of circuits needed for the browser
+    # connections of the last CIRCUIT_POOL_DEMAND_WINDOW seconds,
+    # CIRCUIT_MAX_STREAMS connections per circuit, at least one and at most
+    # circuit_pool_size in app_context.
+    # - Create circuits until pool is full.
+    #
+    def _refill_circuits(self):
+        now = time.time()
+        while (
+            self._connection_times and
+            self._connection_times[0] < (
+                now - constants.CIRCUIT_POOL_DEMAND_WINDOW
             )
+        ):
+            self._connection_times.popleft()
 
-            browser_socket.partner = socks5_c
+        for circuit in self._circuits[:]:
+            if circuit.state == constants.CLOSING:
+                self._circuits.remove(circuit)
+            elif circuit.is_expired() and not circuit.stream_count:
+                circuit.on_close()
+                self._circuits.remove(circuit)
 
-            self._app_context["socket_data"][
-                socks5_c.fileno()
-            ] = socks5_c
+        size = min(
+            self._app_context["circuit_pool_size"],
+            max(
+                1,
+                (
+                    len(self._connection_times) +
+                    constants.CIRCUIT_MAX_STREAMS - 1
+                ) // constants.CIRCUIT_MAX_STREAMS,
+            ),
+        )
+        try:
+            while len(
+                [c for c in self._circuits if self._is_usable(c)]
+            ) < size:
+                self._add_circuit()
         except Exception:
-            logging.error(traceback.format_exc())
-            if browser_socket:
-                browser_socket.close()
-            if socks5_c:
-                socks5_c.close()
+            logging.debug("circuit pool not filled: %s" % (
+                traceback.format_exc(),
+            ))
 
     ## Create path.
-    # @returns (dict) Three random nodes from registry.
-    # Chooses three random nodes from registry unless there aren't enough
-    # nodes. In that case some nodes might repeat, or if there are no nodes
-    # an error is raised.
+    # @returns (dict) distinct nodes from registry.
+    # Chooses hops in app_context distinct nodes from registry. If there
+    # aren't enough nodes an error is raised, and nodes are requested from
+    # registry without waiting for the next refresh. With
+    # allow_short_paths in app_context the path is shorter instead, as long
+    # as there is a node.
+    #
+    # Nodes are chosen at random by the path selector in app_context,
+    # weighted by their spare capacity and measured RTT and throughput, see
+    # @ref common.utilities.path_util.PathSelector.
+    #
+    # Only nodes whose address was already resolved by the resolver in
+    # app_context are used, path holds copies of them with the resolved
+    # address so creating a path never waits for name resolution.
     #
     def _create_path(self):
-        available_nodes = []
-        for name in self._app_context["registry"]:
-            if self._app_context[
-                "registry"
-            ][name]["name"] != str(self.bind_port):
-                available_nodes.append(self._app_context["registry"][name])
-
-        if not available_nodes:
-            raise RuntimeError(
-                "Not Enough nodes registered, at least one more is required",
-            )
+        selector = self._app_context["path_selector"]
+        selector.update(
+            self._app_context["registry"],
+            self._app_context["registry_version"],
+        )
 
-        if len(available_nodes) >= constants.OPTIMAL_NODES_IN_PATH:
-            chosen_nodes = random.sample(
-                available_nodes,
-                constants.OPTIMAL_NODES_IN_PATH,
-            )
+        def resolved(node):
+            address = self._app_context["resolver"].lookup(node["address"])
+            if address:
+                return dict(node, address=address)
 
-        else:
-            chosen_nodes = random.sample(
-                available_nodes,
-                len(available_nodes),
-            )
+        chosen_nodes = selector.choose(
+            self._app_context["hops"],
+            resolved,
+            exclude=("%s:%s" % (self.bind_address, self.bind_port),),
+        )
 
-            while len(chosen_nodes) < constants.OPTIMAL_NODES_IN_PATH:
-                chosen_nodes += random.sample(
-                    available_nodes,
-                    min(
-                        len(available_nodes),
-                        constants.OPTIMAL_NODES_IN_PATH - len(chosen_nodes),
-                    ),
+        if not chosen_nodes:
+            self.http_client.get_nodes()
+            raise RuntimeError(
+                "Not Enough nodes registered, at least one more is required",
+            )
+        if len(chosen_nodes) < self._app_context["hops"]:
+            if not self._app_context["allow_short_paths"]:
+                self.http_client.get_nodes()
+                raise RuntimeError(
+                    "Not Enough nodes registered, %d of %d nodes in path" % (
+                        len(chosen_nodes),
+                        self._app_context["hops"],
+                    )
                 )
+            logging.warning(
+                "only %d of %d nodes in path" % (
+                    len(chosen_nodes),
+                    self._app_context["hops"],
+                )
+            )
 
         path = {}
         for i in range(len(chosen_nodes)):
             path[str(i + 1)] = chosen_nodes[i]
-            
-        for x in path.values():
-            x["address"] = socket.gethostbyname(x["address"])
         return path
 
+    ## Probe nodes.
+    # - Fail probes which run longer than PROBE_TIMEOUT seconds.
+    # - Queue all nodes once every PROBE_INTERVAL seconds.
+    # - Start queued probes while less than PROBE_MAX_CONCURRENT run, nodes
+    # which left registry, are being probed or whose address is not
+    # resolved yet are skipped.
+    # Probes run on the event loop like any other socket, their results
+    # are recorded by the path selector in app_context.
+    #
+    def _probe_nodes(self):
+        now = time.time()
+        for probe in self._probes.values():
+            if probe.started < now - constants.PROBE_TIMEOUT:
+                probe.on_close()
+
+        registry = self._app_context["registry"]
+        self._app_context["path_selector"].update(
+            registry,
+            self._app_context["registry_version"],
+        )
+        if (
+            not self._probe_queue and
+            registry and
+            self._probe_round < now - constants.PROBE_INTERVAL
+        ):
+            self._probe_round = now
+            self._probe_queue.extend(registry)
+
+        try:
+            while (
+                self._probe_queue and
+                len(self._probes) < constants.PROBE_MAX_CONCURRENT
+            ):
+                node = registry.get(self._probe_queue.popleft())
+                if node is None or node["name"] in self._probes:
+                    continue
+                address = self._app_context["resolver"].lookup(
+                    node["address"],
+                )
+                if not address:
+                    continue
+                probe = probe_socket.ProbeSocket(
+                    socket=socket.socket(socket.AF_INET, socket.SOCK_STREAM),
+                    state=constants.ACTIVE,
+                    app_context=self._app_context,
+                    node=dict(node, address=address),
+                    callback=self._on_probe,
+                )
+                self._app_context["add_socket"](probe)
+                self._probes[node["name"]] = probe
+        except Exception:
+            logging.warning("probe not started: %s" % (
+                traceback.format_exc(),
+            ))
+
+    ## Probe finished.
+    # @param node (dict) probed node.
+    # @param handshake (float) seconds of connect and greeting, None if
+    # probe failed.
+    # @param rtt (float) seconds of greeting round trip, None if probe
+    # failed.
+    #
+    def _on_probe(
+        self,
+        node,
+        handshake,
+        rtt,
+    ):
+        self._probes.pop(node["name"], None)
+        self._app_context["path_selector"].record_probe(
+            node["name"],
+            handshake,
+            rtt,
+        )
+
     ## Close Node.
     # Closing @ref onion_routing.
     # common.pollables.listener_socket.Listener._socket.
     # Entering unregister state in @ref http_client.
+    # Stop refreshing nodes, refilling circuit pool and probing nodes.
+    # Close browser connections which wait for a circuit.
     #
     def close(self):
         self._socket.close()
+        self._directory_timer.cancel()
+        if self._pending_timer:
+            self._pending_timer.cancel()
+        while self._pending:
+            self._pending.popleft()[0].close()
+        self._probe_timer.cancel()
+        if self._pool_timer:
+            self._pool_timer.cancel()
         self.http_client._machine_state = constants.UNREGISTERED
+        self.http_client.mark_dirty()
 
     ## Retrive @ref _key.
     @property
@@ -0,0 +1,167 @@
+#!/usr/bin/python
+## @package onion_routing.entry.pollables.probe_socket
+# Socket measuring handshake RTT of an onion node.
+## @file probe_socket.py
+# Implementation of @ref onion_routing.entry.pollables.probe_socket
+#
+
+import time
+
+from common import constants
+from common.async import event_object
+from common.pollables import tcp_socket
+from common.utilities import buffer_util
+from common.utilities import encryption_util
+from common.utilities import socks5_util
+from common.utilities import util
+
+
+## Probe Socket.
+#
+# Connects to an onion node, sends a socks5 greeting encrypted with the
+# secret key of node and closes once the greeting response is recieved.
+# The probe never gets past the greeting, so node does not connect
+# anywhere on its behalf.
+# Measures the whole handshake, connect and greeting, and the round trip
+# of the greeting alone.
+#
+class ProbeSocket(tcp_socket.TCPSocket):
+
+    ## Size of greeting response.
+    GREETING_RESPONSE_SIZE = 2
+
+    ## Constructor.
+    # @param socket (socket) the wrapped socket.
+    # @param state (int) state of ProbeSocket.
+    # @param app_context (dict) application context.
+    # @param node (dict) node to probe, its address already resolved.
+    # @param callback (callable) called once with node, handshake seconds
+    # and greeting round trip seconds, or with node, None and None if probe
+    # failed.
+    #
+    def __init__(
+        self,
+        socket,
+        state,
+        app_context,
+        node,
+        callback,
+    ):
+        super(ProbeSocket, self).__init__(
+            socket,
+            state,
+            app_context,
+        )
+
+        ## Node which is probed.
+        self._node = node
+
+        ## Function called with result.
+        self._callback = callback
+
+        ## Time in which probe started.
+        self.started = time.time()
+
+        ## Time in which greeting was sent, None until connected.
+        self._greeting_time = None
+
+        ## Buffer of greeting response.
+        self._read_buffer = buffer_util.Buffer()
+
+        methods = list(constants.SUPPORTED_METHODS)
+        self._buffer.append(
+            encryption_util.encrypt(
+                socks5_util.GreetingRequest.encode(
+                    {
+                        "version": constants.SOCKS5_VERSION,
+                        "number_methods": len(methods),
+                        "methods": methods,
+                    },
+                ),
+                node["key"],
+            )
+        )
+
+        util.connect(
+            self._socket,
+            node["address"],
+            node["port"],
+        )
+
+    ## On read event.
+    # Read greeting response, once complete report result and close.
+    #
+    def on_read(self):
+        util.recieve_buffer(
+            self._socket,
+            self._read_buffer,
+            ProbeSocket.GREETING_RESPONSE_SIZE - len(self._read_buffer),
+        )
+        if len(self._read_buffer) < ProbeSocket.GREETING_RESPONSE_SIZE:
+            return
+
+        now = time.time()
+        response = socks5_util.GreetingResponse.decode(
+            encryption_util.decrypt(
+                str(self._read_buffer),
+                self._node["key"],
+            ),
+        )
+        if (
+            response["version"] != constants.SOCKS5_VERSION or
+            response["method"] == constants.NO_ACCEPTABLE_METHODS
+        ):
+            self.on_close()
+            return
+        self._report(now - self.started, now - self._greeting_time)
+        self.on_close()
+
+    ## On write event.
+    # Send greeting once connected.
+    #
+    def on_write(self):
+        if self._greeting_time is None:
+            self._greeting_time = time.time()
+        super(ProbeSocket, self).on_write()
+
+    ## On close event.
+    # A probe which closes before it is reported failed.
+    #
+    def on_close(self):
+        super(ProbeSocket, self).on_close()
+        self._report(None, None)
+
+    ## Report result once.
+    # @param handshake (float) seconds of connect and greeting.
+    # @param rtt (float) seconds of greeting round trip.
+    #
+    def _report(
+        self,
+        handshake,
+        rtt,
+    ):
+        if self._callback:
+            callback, self._callback = self._callback, None
+            callback(self._node, handshake, rtt)
+
+    ## Get events for poller.
+    # @returns (int) events to register for poller.
+    #
+    # - POLLIN when @ref _state is ACTIVE and greeting was sent.
+    # - POLLOUT while greeting is not sent.
+    #
+    def get_events(self):
+        event = event_object.BaseEvent.POLLERR
+        if self._state == constants.ACTIVE:
+            if self._buffer:
+                event |= event_object.BaseEvent.POLLOUT
+            else:
+                event |= event_object.BaseEvent.POLLIN
+        return event
+
+    ## String representation.
+    def __repr__(self):
+        return "ProbeSocket object %s. node %s." % (
+            self.fileno(),
+            self._node["name"],
+        )
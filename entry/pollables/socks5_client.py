@@ -1,17 +1,18 @@
 #!/usr/bin/python
 ## @package onion_routing.entry.pollables.socks5_client
 # Socks5 client socket, responsible for establishing connections to all other
-# nodes, and later serves as proxy for encrypting all communication with
+# nodes, and later serves as circuit which carries encrypted streams of
 # the browser.
 ## @file socks5_client.py
 # Implementation of @ref onion_routing.entry.pollables.socks5_client
 #
 
-import socket
+import time
 
 from common import constants
 from common.async import event_object
 from common.pollables import tcp_socket
+from common.utilities import cell_util
 from common.utilities import encryption_util
 from common.utilities import util
 from common.utilities import socks5_util
@@ -19,14 +20,22 @@ from common.utilities import socks5_util
 
 ## Socks 5 Client.
 #
-# Created for routing a message from a the client (browser) to destination.
+# Created for routing messages from the client (browser) to destinations.
 # Uses rfc 1928 - https://www.ietf.org/rfc/rfc1928.txt.
 # Establishes Socks5 with all other nodes in order to redirect the
 # messages from the browser to the last node which will finally
-# redirect it to the destination.
+# redirect them to the destinations.
+# Once established, many browser streams share the circuit using cells,
+# see @ref common.utilities.cell_util.
 #
 class Socks5Client(tcp_socket.TCPSocket):
 
+    ## Size of greeting response.
+    GREETING_RESPONSE_SIZE = 2
+
+    ## Size of connection response with an IPv4 address.
+    IP_4_RESPONSE_SIZE = 10
+
     ## Request context.
     _request_context = {}
 
@@ -37,11 +46,8 @@ class Socks5Client(tcp_socket.TCPSocket):
     # @param socket (socket) the wrapped socket.
     # @param state (int) state of Socks5Server.
     # @param app_context (dict) application context.
-    # @param browser_socket (socket) @ref common.pollables.tcp_socket object
-    #   for redirecting from the client to @ref 
-    #   common.pollables.tcp_socket.TCPSocket._partner after socks5
-    #   is established.
-    # @param path (dict) the nodes and their order.
+    # @param path (dict) the nodes and their order, key - position from
+    # "1", value - node. Last node of path carries the streams.
     #
     # Creates a wrapper for the given
     # @ref common.pollables.tcp_socket.TCPSocket._socket to be able to
@@ -54,7 +60,6 @@ class Socks5Client(tcp_socket.TCPSocket):
         socket,
         state,
         app_context,
-        browser_socket,
         path,
     ):
         super(Socks5Client, self).__init__(
@@ -63,9 +68,6 @@ class Socks5Client(tcp_socket.TCPSocket):
             app_context,
         )
 
-        ## Broser socket - the client.
-        self._browser_socket = browser_socket
-
         ## Path - nodes and the order in which connection to them is done.
         self._path = path
 
@@ -75,7 +77,29 @@ class Socks5Client(tcp_socket.TCPSocket):
         ## Machine current state.
         self._machine_current_state = constants.CLIENT_SEND_GREETING
 
-        self._start_byte_counter()
+        ## Number of bytes at the beginning of
+        # @ref common.pollables.tcp_socket.TCPSocket._buffer which are
+        # already encrypted.
+        #
+        self._encrypted = 0
+
+        ## Time in which circuit was created.
+        self.created = time.time()
+
+        ## Time in which greeting of current node was sent.
+        self._greeting_time = None
+
+        ## Seconds of greeting round trip to previous node.
+        self._path_rtt = 0
+
+        ## Streams of the circuit.
+        self._multiplexer = cell_util.Multiplexer(self._buffer)
+
+        ## Cells of streams waiting for circuit to be established.
+        # key - stream id, value - list of command and payload of cells,
+        # BEGIN cell first.
+        #
+        self._pending_streams = {}
 
         util.connect(
             self._socket,
@@ -94,19 +118,15 @@ class Socks5Client(tcp_socket.TCPSocket):
             },
             constants.CLIENT_RECV_GREETING: {
                 "method": self._client_recv_greeting,
-                "next": constants.CLIENT_SEND_CONNECTION_REQUEST,
-            },
-            constants.CLIENT_SEND_CONNECTION_REQUEST: {
-                "method": self._client_send_connection_request,
                 "next": constants.CLIENT_RECV_CONNECTION_REQUEST,
             },
             constants.CLIENT_RECV_CONNECTION_REQUEST: {
                 "method": self._client_recv_connection_request,
                 "next": constants.CLIENT_SEND_GREETING,
             },
-            constants.PARTNER_STATE: {
-                "method": self._partner_state,
-                "next": constants.PARTNER_STATE,
+            constants.CIRCUIT_STATE: {
+                "method": self._circuit_state,
+                "next": constants.CIRCUIT_STATE,
             },
         }
 
@@ -114,21 +134,36 @@ class Socks5Client(tcp_socket.TCPSocket):
     # @returns (bool) whether state is finished.
     #
     # Build a request with all supported method.
-    # When establishing socks with the last node, add MY_SOCKS_SIGNATURE,
-    #   to inform the node its the last.
+    # When establishing socks with a regular node, add MY_SOCKS_SIGNATURE,
+    #   to inform the node its not the last.
+    # When establishing socks with the last node, add MY_CELL_SIGNATURE,
+    #   to request cells of streams instead of a single connection.
+    # Only methods without authentication are offered, so the connection
+    # request of a regular node is sent right after the greeting, without
+    # waiting for the greeting response.
+    # Time of greeting is kept for measuring RTT of node.
     #
     def _client_send_greeting(self):
         try:
             methods = list(constants.SUPPORTED_METHODS)
-            if not self._connected_nodes == constants.OPTIMAL_NODES_IN_PATH:
+            if not self._connected_nodes == len(self._path):
                 methods.append(constants.MY_SOCKS_SIGNATURE)
-            self._buffer = socks5_util.GreetingRequest.encode(
-                {
-                    "version": constants.SOCKS5_VERSION,
-                    "number_methods": len(methods),
-                    "methods": methods,
-                },
+            else:
+                methods.append(constants.MY_CELL_SIGNATURE)
+            self._buffer.clear()
+            self._encrypted = 0
+            self._buffer.append(
+                socks5_util.GreetingRequest.encode(
+                    {
+                        "version": constants.SOCKS5_VERSION,
+                        "number_methods": len(methods),
+                        "methods": methods,
+                    },
+                )
             )
+            if not self._connected_nodes == len(self._path):
+                self._buffer.append(self._connection_request())
+            self._greeting_time = time.time()
             return True
         except Exception:
             self.on_close()
@@ -139,59 +174,77 @@ class Socks5Client(tcp_socket.TCPSocket):
     #
     # Decodes the buffer to for content of response.
     # Continue when response is positive and supported.
+    # The last node must accept MY_CELL_SIGNATURE, afterwards the circuit
+    # is established and next state is CIRCUIT_STATE.
+    # RTT of node, round trip of greeting less round trip to previous node,
+    # is recorded by the path selector in app_context.
+    # Response is consumed from the buffer, connection response may follow
+    # it.
     #
     def _client_recv_greeting(self):
-        response = socks5_util.GreetingResponse.decode(self._buffer)
+        if len(self._buffer) < Socks5Client.GREETING_RESPONSE_SIZE:
+            return False
+        response = socks5_util.GreetingResponse.decode(
+            self._buffer.peek(Socks5Client.GREETING_RESPONSE_SIZE),
+        )
+        self._buffer.consume(Socks5Client.GREETING_RESPONSE_SIZE)
+        last = self._connected_nodes == len(self._path)
         if (
             response["version"] != constants.SOCKS5_VERSION or
-            response["method"] == constants.NO_ACCEPTABLE_METHODS
+            response["method"] == constants.NO_ACCEPTABLE_METHODS or
+            (last and response["method"] != constants.MY_CELL_SIGNATURE)
         ):
             self.on_close()
             return False
         else:
+            self._record_rtt()
+            if last:
+                self._state_machine[
+                    self._machine_current_state
+                ]["next"] = constants.CIRCUIT_STATE
             return True
 
-    ## Send connection request state.
-    # @returns (bool) whether state is finished.
-    #
-    # Encodes a connection request with the address and port of the next node.
+    ## Record RTT of current node.
+    def _record_rtt(self):
+        rtt = time.time() - self._greeting_time
+        self._request_context["app_context"]["path_selector"].record_rtt(
+            self._path[str(self._connected_nodes)]["name"],
+            max(rtt - self._path_rtt, constants.PATH_MIN_RTT),
+        )
+        self._path_rtt = rtt
+
+    ## Connection request.
+    # @returns (str) connection request with the address and port of the
+    # next node.
     #
-    def _client_send_connection_request(self):
-        try:
-            address = self._path[str(self._connected_nodes + 1)]["address"]
-            port = self._path[str(self._connected_nodes + 1)]["port"]
-
-            self._buffer = socks5_util.Socks5Request.encode(
-                {
-                    "version": constants.SOCKS5_VERSION,
-                    "command": constants.CONNECT,
-                    "reserved": constants.SOCKS5_RESERVED,
-                    "address_type": constants.IP_4,
-                    "address": socket.gethostbyname(address),
-                    "port": port,
-                },
-            )
-            return True
-        except Exception:
-            self.on_close()
-            return False
+    def _connection_request(self):
+        return socks5_util.Socks5Request.encode(
+            {
+                "version": constants.SOCKS5_VERSION,
+                "command": constants.CONNECT,
+                "reserved": constants.SOCKS5_RESERVED,
+                "address_type": constants.IP_4,
+                "address": self._path[
+                    str(self._connected_nodes + 1)
+                ]["address"],
+                "port": self._path[str(self._connected_nodes + 1)]["port"],
+            },
+        )
 
     ## Recieve connection response state.
     # @returns (bool) whether state is finished.
     #
     # Decodes the buffer to for content of response.
     # When response is positive update @ref _connected_nodes to the next node.
-    # Before establishing connection with the last node:
-    # - make @ref common.pollables.tcp_socket.TCPSocket._partner
-    # to @ref _browser_socket in order to
-    # create a proxy between the last node and browser.
-    # Next state:
-    # - SEND_GREETING: establishing new connection with regular nodes.
-    # - PARTNER_STATE: become a proxy - last node connection.
     # Continue when response is positive and supported.
     #
     def _client_recv_connection_request(self):
-        response = socks5_util.Socks5Response.decode(self._buffer)
+        if len(self._buffer) < Socks5Client.IP_4_RESPONSE_SIZE:
+            return False
+        response = socks5_util.Socks5Response.decode(
+            self._buffer.peek(Socks5Client.IP_4_RESPONSE_SIZE),
+        )
+        self._buffer.consume(Socks5Client.IP_4_RESPONSE_SIZE)
         if not (
             response["version"] == constants.SOCKS5_VERSION and
             response["reply"] == constants.SUCCESS and
@@ -202,157 +255,256 @@ class Socks5Client(tcp_socket.TCPSocket):
             return False
         else:
             self._connected_nodes += 1
-            if self._connected_nodes == constants.OPTIMAL_NODES_IN_PATH:
-                self._state_machine[
-                    self._machine_current_state
-                ]["next"] = constants.PARTNER_STATE
-                self._partner = self._browser_socket
-
-                self._request_context["app_context"]["socket_data"][
-                    self._browser_socket.fileno()
-                ] = self._browser_socket
-
-                self._request_context["app_context"]["connections"][
-                    self
-                ]["in"] = {
-                    "bytes": 0,
-                    "fd": self._partner.fileno(),
-                }
             return True
 
-    ## Partner state.
+    ## Circuit state.
     # @returns (bool) True.
-    # Client is used as a proxy between browser and last connected node.
+    # Client carries cells of streams between browser and last node.
     #
-    def _partner_state(self):
+    def _circuit_state(self):
         return True
 
-    ## Start byte counter.
-    # Fill connection dict with new connection to
-    # save bytes recieved and sent for statistics.
+    ## Add stream to circuit.
+    # @param stream (@ref common.pollables.stream_socket.StreamSocket)
+    # the stream.
+    # @param stream_id (optional, int) not used, ids are given by circuit.
+    # @returns (int) id of stream.
     #
-    def _start_byte_counter(self):
-        self._request_context["app_context"]["connections"][self] = {
-            "in": {
-                "bytes": None,
-                "fd": None,
-            },
-            "out": {
-                "bytes": 0,
-                "fd": self.fileno(),
-            },
-        }
+    def add_stream(
+        self,
+        stream,
+        stream_id=None,
+    ):
+        return self._multiplexer.add_stream(stream)
+
+    ## Remove stream from circuit.
+    # @param stream_id (int) id of stream.
+    #
+    # Expired circuit is closed with its last stream.
+    #
+    def remove_stream(
+        self,
+        stream_id,
+    ):
+        self._multiplexer.remove_stream(stream_id)
+        self._pending_streams.pop(stream_id, None)
+        if (
+            self._state == constants.ACTIVE and
+            not self._multiplexer.streams and
+            self.is_expired()
+        ):
+            self.on_close()
 
-    ## Update byte counter.
-    # @param bytes (int) number of bytes sent.
-    # According to the type of connection now (in/out) - update bytes.
+    ## Send cell.
+    # @param stream_id (int) id of stream.
+    # @param command (int) cell command.
+    # @param payload (optional, str) content of cell.
+    #
+    # Cells of stream which waits for circuit are kept until its BEGIN
+    # cell is sent, END cell drops the stream before it began.
+    # Streams send cells on their events, so circuit is marked dirty.
     #
-    def _update_byte_counter(
+    def send_cell(
         self,
-        bytes,
+        stream_id,
+        command,
+        payload="",
     ):
-        type = "out"
-        if self._partner != self:
-            type = "in"
+        if stream_id not in self._pending_streams:
+            self._multiplexer.send(stream_id, command, payload)
+            self.mark_dirty()
+        elif command == constants.CELL_END:
+            del self._pending_streams[stream_id]
+        else:
+            self._pending_streams[stream_id].append((command, payload))
 
-        self._request_context[
-            "app_context"
-        ]["connections"][self][type]["bytes"] += bytes
+    ## Connect stream to destination.
+    # @param stream_id (int) id of stream.
+    # @param address (str) destination address.
+    # @param port (int) destination port.
+    #
+    # BEGIN cell is sent once circuit is established, data of stream may
+    # follow it right away.
+    #
+    def begin(
+        self,
+        stream_id,
+        address,
+        port,
+    ):
+        payload = "%s:%s" % (address, port)
+        if self._machine_current_state == constants.CIRCUIT_STATE:
+            self.send_cell(stream_id, constants.CELL_BEGIN, payload)
+        else:
+            self._pending_streams[stream_id] = [
+                (constants.CELL_BEGIN, payload),
+            ]
+
+    ## Send cells of streams which waited for circuit, BEGIN cell first.
+    def _begin_pending_streams(self):
+        for stream_id, cells in self._pending_streams.items():
+            for command, payload in cells:
+                self._multiplexer.send(stream_id, command, payload)
+        self._pending_streams.clear()
+
+    ## BEGIN cell recieved.
+    # @param stream_id (int) id of stream.
+    # @param payload (str) socks5 reply of last node.
+    #
+    def _on_begin(
+        self,
+        stream_id,
+        payload,
+    ):
+        stream = self._multiplexer.streams.get(stream_id)
+        if stream:
+            stream.on_begin(
+                ord(payload[0]) if payload
+                else constants.GENERAL_SERVER_FAILURE
+            )
+
+    ## Whether circuit is established.
+    # @returns (bool) True if streams are sent right away.
+    #
+    def is_ready(self):
+        return (
+            self._state == constants.ACTIVE and
+            self._machine_current_state == constants.CIRCUIT_STATE
+        )
+
+    ## Whether circuit is too old for new streams.
+    # @returns (bool) True if expired.
+    #
+    def is_expired(self):
+        return self.created < time.time() - constants.CIRCUIT_POOL_MAX_AGE
+
+    ## Names of nodes in path, in order.
+    @property
+    def nodes(self):
+        return [
+            self._path[str(i + 1)]["name"] for i in range(len(self._path))
+        ]
+
+    ## Number of streams in circuit.
+    @property
+    def stream_count(self):
+        return len(self._multiplexer.streams)
+
+    ## Write encrypted message.
+    # Encrypt only bytes that were added since last write with secret key of
+    # current node, send as much as possible and keep the unsent remainder
+    # encrypted.
+    #
+    def _write_encrypted(self):
+        encryption_util.encrypt_buffer(
+            self._buffer,
+            self._path[str(self._connected_nodes)]["key"],
+            self._encrypted,
+        )
+        util.send_buffer(
+            self._socket,
+            self._buffer,
+        )
+        self._encrypted = len(self._buffer)
+
+    ## Read cells.
+    # Read from socket, decrypt with secret key of last node and pass
+    # complete cells to their streams.
+    #
+    def _read_cells(self):
+        cells = self._multiplexer.cells
+        recieved = util.recieve_buffer(
+            self._socket,
+            cells,
+            self._request_context["app_context"]["max_buffer_size"],
+        )
+        encryption_util.decrypt_buffer(
+            cells,
+            self._path[str(self._connected_nodes)]["key"],
+            len(cells) - recieved,
+        )
+        self._multiplexer.dispatch(self._on_begin)
 
     ## On read event.
-    # Read from @ref common.pollables.tcp_socket.TCPSocket._partner
-    # until maximum size of @ref common.pollables.tcp_socket.TCPSocket._buffer
-    # is recived.
+    # In CIRCUIT_STATE read cells.
+    # Otherwise read until maximum size of
+    # @ref common.pollables.tcp_socket.TCPSocket._buffer is recived.
     # Decrypt content with secret key of current node.
     #
-    # Update statistics.
-    # Run the current state.
-    # Update state.
+    # Run states while buffer holds complete responses, greeting and
+    # connection responses may arrive together.
+    # Update state, once circuit is established send BEGIN cells of
+    # waiting streams.
     #
     def on_read(self):
-        data = encryption_util.decrypt(
-            util.recieve_buffer(
-                self._socket,
-                self._request_context["app_context"][
-                    "max_buffer_size"
-                ] - len(self._partner.buffer),
-            ),
+        if self._machine_current_state == constants.CIRCUIT_STATE:
+            self._read_cells()
+            return
+
+        recieved = util.recieve_buffer(
+            self._socket,
+            self._buffer,
+            self._request_context[
+                "app_context"
+            ]["max_buffer_size"] - len(self._buffer),
+        )
+        encryption_util.decrypt_buffer(
+            self._buffer,
             self._path[str(self._connected_nodes)]["key"],
+            len(self._buffer) - recieved,
         )
 
-        self._partner.buffer += data
-        self._update_byte_counter(len(data))
+        while self._machine_current_state in (
+            constants.CLIENT_RECV_GREETING,
+            constants.CLIENT_RECV_CONNECTION_REQUEST,
+        ) and self._state_machine[self._machine_current_state]["method"]():
+            self._machine_current_state = self._state_machine[
+                self._machine_current_state
+            ]["next"]
 
-        try:
-            if self._machine_current_state in (
-                constants.CLIENT_RECV_GREETING,
-                constants.CLIENT_RECV_CONNECTION_REQUEST,
-                constants.PARTNER_STATE,
-            ):
-                if self._state_machine[
-                    self._machine_current_state
-                ]["method"]():
-                    self._buffer = ""
-
-                    self._machine_current_state = self._state_machine[
-                        self._machine_current_state
-                    ]["next"]
-        except socks5_util.Socks5Error as e:
-            raise e
+            if self._machine_current_state == constants.CIRCUIT_STATE:
+                self._begin_pending_streams()
 
     ## On write event.
     # Run the current state.
     #
     # Encrypt content with secret key of current node.
-    # Update state.
+    # Update state once buffer was sent completely. Until then the state is
+    # not run again and the encrypted remainder is sent, so requests are
+    # not lost when the socket accepts only part of them.
+    # Streams stop reading while buffer is full, they are marked dirty once
+    # it is not full anymore.
     #
     def on_write(self):
+        max_buffer_size = self._request_context[
+            "app_context"
+        ]["max_buffer_size"]
+        full = len(self._buffer) >= max_buffer_size
         if self._machine_current_state in (
             constants.CLIENT_SEND_GREETING,
-            constants.CLIENT_SEND_CONNECTION_REQUEST,
-            constants.PARTNER_STATE,
+            constants.CIRCUIT_STATE,
+        ) and (
+            self._encrypted or
+            self._state_machine[self._machine_current_state]["method"]()
         ):
-            if self._state_machine[self._machine_current_state]["method"]():
-                self._buffer = encryption_util.decrypt(
-                    util.send_buffer(
-                        self._socket,
-                        encryption_util.encrypt(
-                            self._buffer,
-                            self._path[str(self._connected_nodes)]["key"],
-                        ),
-                    ),
-                    self._path[str(self._connected_nodes)]["key"],
-                )
+            self._write_encrypted()
 
+            if not self._buffer:
                 self._machine_current_state = self._state_machine[
                     self._machine_current_state
                 ]["next"]
+        if full and len(self._buffer) < max_buffer_size:
+            self._multiplexer.mark_streams()
 
     ## On close event.
     # Change @ref common.pollables.tcp_socket.TCPSocket._state
     # of socket to CLOSING and empty @ref
     # common.pollables.tcp_socket.TCPSocket._buffer.
-    # If serves as proxy run on_close on @ref
-    # common.pollables.tcp_socket.TCPSocket._partner.
-    # If browser was not closed, change it state to CLOSING
+    # Close all streams of circuit.
     #
     def on_close(self):
         super(Socks5Client, self).on_close()
-
-        if self._partner != self._browser_socket:
-            self._browser_socket.state = constants.CLOSING
-
-    ## Close Socks5Client.
-    # Closing @ref common.pollables.tcp_socket.TCPSocket._socket.
-    # Remove this connection from statistics.
-    # If browser was not closed, close it.
-    #
-    def close(self):
-        del self._request_context["app_context"]["connections"][self]
-        super(Socks5Client, self).close()
-
-        if self._partner != self._browser_socket:
-            self._browser_socket.close()
+        self._multiplexer.close()
 
     ## Get events for poller.
     # @returns (int) events to register for poller.
@@ -360,32 +512,32 @@ class Socks5Client(tcp_socket.TCPSocket):
     # On appropriate state:
     # - POLLIN when @ref common.pollables.tcp_socket.TCPSocket._state
     # is ACTIVE and @ref common.pollables.tcp_socket.TCPSocket._buffer
-    # is not full.
+    # is not full, in CIRCUIT_STATE when no stream has a full buffer.
     # - POLLOUT when @ref common.pollables.tcp_socket.TCPSocket._buffer
     # is not empty.
     #
     def get_events(self):
         event = event_object.BaseEvent.POLLERR
-        if (
-            self._state == constants.ACTIVE and
-            not len(self._buffer) >= self._request_context[
-                "app_context"
-            ]["max_buffer_size"] and
-            self._machine_current_state in (
-                constants.CLIENT_RECV_GREETING,
-                constants.CLIENT_RECV_CONNECTION_REQUEST,
-                constants.PARTNER_STATE,
+        max_buffer_size = self._request_context[
+            "app_context"
+        ]["max_buffer_size"]
+        if self._state == constants.ACTIVE and (
+            (
+                len(self._buffer) < max_buffer_size and
+                self._machine_current_state in (
+                    constants.CLIENT_RECV_GREETING,
+                    constants.CLIENT_RECV_CONNECTION_REQUEST,
+                )
+            ) or (
+                self._machine_current_state == constants.CIRCUIT_STATE and
+                not self._multiplexer.is_full(max_buffer_size)
             )
         ):
             event |= event_object.BaseEvent.POLLIN
         if (
-            self._machine_current_state in
-            (
-                constants.CLIENT_SEND_GREETING,
-                constants.CLIENT_SEND_CONNECTION_REQUEST,
-            ) or (
+            self._machine_current_state == constants.CLIENT_SEND_GREETING or (
                 self._buffer and
-                self._machine_current_state == constants.PARTNER_STATE
+                self._machine_current_state == constants.CIRCUIT_STATE
             )
         ):
             event |= event_object.BaseEvent.POLLOUT
@@ -0,0 +1,336 @@
+#!/usr/bin/python
+## @package onion_routing.entry.pollables.socks5_stream
+# Browser connection, served as socks5 proxy and carried as a stream over
+# a circuit.
+## @file socks5_stream.py
+# Implementation of @ref onion_routing.entry.pollables.socks5_stream
+#
+
+import logging
+import time
+
+from common import constants
+from common.async import event_object
+from common.pollables import stream_socket
+from common.utilities import socks5_util
+from common.utilities import util
+
+
+## Socks5 Stream.
+#
+# Serves the browser as socks5 server, rfc 1928.
+# The connection request is not performed locally, it is passed as BEGIN
+# cell to the last node of the circuit, which connects to the destination
+# and sends the socks5 reply back.
+# Afterwards data is carried as cells of
+# @ref common.pollables.stream_socket.StreamSocket.
+# With optimistic_data in app_context the browser is answered success
+# right away, so its first data follows the BEGIN cell instead of waiting
+# a round trip of the circuit. Up to max_buffer_size bytes are sent before
+# the reply of the last node, if connecting failed the stream is closed.
+#
+class Socks5Stream(stream_socket.StreamSocket):
+
+    ## Size of socks5 connection request with an IPv4 address.
+    IP_4_REQUEST_SIZE = 10
+
+    ## Constructor.
+    # @param socket (socket) the wrapped socket.
+    # @param state (int) state of Socks5Stream.
+    # @param app_context (dict) application context.
+    # @param circuit (@ref entry.pollables.socks5_client.Socks5Client)
+    # circuit which carries the stream.
+    #
+    def __init__(
+        self,
+        socket,
+        state,
+        app_context,
+        circuit,
+    ):
+        super(Socks5Stream, self).__init__(
+            socket,
+            state,
+            app_context,
+            circuit,
+        )
+
+        ## The state machine of the socket.
+        self._state_machine = self._create_state_machine()
+
+        ## Machine current state.
+        self._machine_current_state = constants.RECV_GREETING
+
+        ## Decode dict.
+        self._decode = {}
+
+        ## Time in which browser connected, for time to first byte.
+        self._accept_time = time.time()
+
+        ## Times of first and last data recieved, for throughput.
+        self._data_times = None
+
+        ## Whether last node replied to BEGIN cell.
+        self._begun = False
+
+        self._request_context["app_context"]["connections"][self] = {
+            "in": {
+                "bytes": 0,
+                "fd": self.fileno(),
+            },
+            "out": {
+                "bytes": 0,
+                "fd": circuit.fileno(),
+            },
+            "ttfb": None,
+        }
+
+    ## Create the state machine for socket.
+    # @returns (dict) states to the thier methods.
+    #
+    def _create_state_machine(self):
+        return {
+            constants.RECV_GREETING: {
+                "method": self._recv_greeting,
+                "next": constants.RECV_CONNECTION_REQUEST,
+            },
+            constants.RECV_CONNECTION_REQUEST: {
+                "method": self._recv_connection_request,
+                "next": (
+                    constants.PARTNER_STATE
+                    if self._request_context["app_context"]["optimistic_data"]
+                    else constants.STREAM_BEGIN
+                ),
+            },
+        }
+
+    ## Recv greeting state.
+    # @returns (bool) whether ready to next state.
+    #
+    # Choose no authentication if browser supports it and put the greeting
+    # response in @ref common.pollables.tcp_socket.TCPSocket._buffer.
+    #
+    def _recv_greeting(self):
+        data = self._read_buffer.peek(2)
+        if len(data) < 2:
+            return False
+        length = 2 + ord(data[1])
+        self._decode = socks5_util.GreetingRequest.decode(
+            self._read_buffer.peek(length),
+        )
+        if not self._decode:
+            return False
+        self._read_buffer.consume(length)
+
+        self._decode["method"] = constants.NO_ACCEPTABLE_METHODS
+        if constants.NO_AUTH in self._decode["methods"]:
+            self._decode["method"] = constants.NO_AUTH
+        else:
+            self._state = constants.CLOSING
+
+        self._buffer.append(
+            socks5_util.GreetingResponse.encode(
+                self._decode,
+            )
+        )
+        return True
+
+    ## Recv connection request state.
+    # @returns (bool) whether ready to next state.
+    #
+    # Ask circuit to connect stream to requested destination.
+    # With optimistic data answer browser success without waiting.
+    #
+    def _recv_connection_request(self):
+        self._decode = socks5_util.Socks5Request.decode(
+            self._read_buffer.peek(Socks5Stream.IP_4_REQUEST_SIZE),
+        )
+        if not self._decode:
+            return False
+        self._read_buffer.consume(Socks5Stream.IP_4_REQUEST_SIZE)
+
+        self._circuit.begin(
+            self._stream_id,
+            self._decode["address"],
+            self._decode["port"],
+        )
+        if self._request_context["app_context"]["optimistic_data"]:
+            self._reply(constants.SUCCESS)
+        return True
+
+    ## BEGIN cell recieved from circuit.
+    # @param reply (int) socks5 reply of last node.
+    #
+    # Put socks5 response in
+    # @ref common.pollables.tcp_socket.TCPSocket._buffer.
+    # On success start carrying data, and send data which browser sent
+    # before the response.
+    # Otherwise close once response is sent.
+    # With optimistic data browser was answered already, stream is closed
+    # on failure.
+    #
+    def on_begin(
+        self,
+        reply,
+    ):
+        self._record_first_byte()
+        self._begun = True
+        self.mark_dirty()
+
+        if self._machine_current_state == constants.PARTNER_STATE:
+            if reply != constants.SUCCESS:
+                self._state = constants.CLOSING
+            return
+
+        self._reply(reply)
+        if reply == constants.SUCCESS:
+            self._machine_current_state = constants.PARTNER_STATE
+            self._send_data()
+        else:
+            self._state = constants.CLOSING
+
+    ## Put socks5 response in
+    # @ref common.pollables.tcp_socket.TCPSocket._buffer.
+    # @param reply (int) socks5 reply.
+    #
+    def _reply(
+        self,
+        reply,
+    ):
+        self._decode["reply"] = reply
+        self._buffer.append(
+            socks5_util.Socks5Response.encode(
+                self._decode,
+            )
+        )
+
+    ## Record time to first byte.
+    # Milliseconds from browser connection until first response is
+    # recieved from the circuit.
+    #
+    def _record_first_byte(self):
+        ttfb = int((time.time() - self._accept_time) * 1000)
+        self._request_context["app_context"]["connections"][
+            self
+        ]["ttfb"] = ttfb
+        logging.debug("time to first byte %d ms: %s" % (ttfb, self))
+
+    ## Send data read from socket as DATA cells.
+    # @returns (int) number of bytes sent.
+    #
+    # Update statistics.
+    #
+    def _send_data(self):
+        length = super(Socks5Stream, self)._send_data()
+        self._request_context["app_context"]["connections"][
+            self
+        ]["in"]["bytes"] += length
+        return length
+
+    ## Data recieved from circuit.
+    # @param data (str) content of DATA cell.
+    #
+    # Update statistics.
+    #
+    def on_data(
+        self,
+        data,
+    ):
+        super(Socks5Stream, self).on_data(data)
+        now = time.time()
+        self._data_times = (
+            self._data_times[0] if self._data_times else now,
+            now,
+        )
+        self._request_context["app_context"]["connections"][
+            self
+        ]["out"]["bytes"] += len(data)
+
+    ## On read event.
+    # In PARTNER_STATE carry data as cells.
+    # Otherwise read socks5 requests of browser and run the current state
+    # while there are complete requests, data which follows the requests
+    # is sent once in PARTNER_STATE.
+    #
+    def on_read(self):
+        if self._machine_current_state == constants.PARTNER_STATE:
+            super(Socks5Stream, self).on_read()
+            return
+
+        util.recieve_buffer(
+            self._socket,
+            self._read_buffer,
+            self._request_context[
+                "app_context"
+            ]["max_buffer_size"] - len(self._read_buffer),
+        )
+        while (
+            self._machine_current_state in self._state_machine and
+            self._state == constants.ACTIVE and
+            self._state_machine[self._machine_current_state]["method"]()
+        ):
+            self._machine_current_state = self._state_machine[
+                self._machine_current_state
+            ]["next"]
+        if self._machine_current_state == constants.PARTNER_STATE:
+            self._send_data()
+
+    ## Close Socks5Stream.
+    # Remove this connection from statistics and close socket.
+    #
+    # Throughput of stream which recieved at least PATH_MIN_STREAM_BYTES
+    # is recorded for the nodes of its circuit by the path selector in
+    # app_context.
+    #
+    def close(self):
+        app_context = self._request_context["app_context"]
+        received = app_context["connections"].pop(self)["out"]["bytes"]
+        if (
+            received >= constants.PATH_MIN_STREAM_BYTES and
+            self._data_times[1] > self._data_times[0]
+        ):
+            app_context["path_selector"].record_throughput(
+                self._circuit.nodes,
+                received / (self._data_times[1] - self._data_times[0]),
+            )
+        super(Socks5Stream, self).close()
+
+    ## Get events for poller.
+    # @returns (int) events to register for poller.
+    #
+    # - In PARTNER_STATE like @ref
+    # common.pollables.stream_socket.StreamSocket.get_events(), without
+    # POLLIN once max_buffer_size bytes were sent before last node
+    # replied.
+    # - POLLIN while reading socks5 requests.
+    # - POLLOUT when @ref common.pollables.tcp_socket.TCPSocket._buffer
+    # is not empty.
+    #
+    def get_events(self):
+        if self._machine_current_state == constants.PARTNER_STATE:
+            event = super(Socks5Stream, self).get_events()
+            app_context = self._request_context["app_context"]
+            if (
+                not self._begun and
+                app_context["connections"][self]["in"]["bytes"] >=
+                app_context["max_buffer_size"]
+            ):
+                event &= ~event_object.BaseEvent.POLLIN
+            return event
+
+        event = event_object.BaseEvent.POLLERR
+        if (
+            self._state == constants.ACTIVE and
+            self._machine_current_state in self._state_machine
+        ):
+            event |= event_object.BaseEvent.POLLIN
+        if self._buffer:
+            event |= event_object.BaseEvent.POLLOUT
+        return event
+
+    ## String representation.
+    def __repr__(self):
+        return "Socks5Stream object. stream %s. fileno: %d." % (
+            self._stream_id,
+            self.fileno(),
+        )
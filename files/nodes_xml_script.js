@@ -25,9 +25,12 @@ function parseXML(xml) {
     nodes = ''
     var x = xmlDoc.getElementsByTagName("node");
     for (i = 0; i < x.length; i++) {
+        var address = x[i].getElementsByTagName("address")[0].childNodes[0].nodeValue;
+        var port = x[i].getElementsByTagName("port")[0].childNodes[0].nodeValue;
+        var expires = x[i].getElementsByTagName("expires")[0].childNodes[0].nodeValue;
         nodes += 
-            '<a href="/unregister?' + x[i].getElementsByTagName("port")[0].childNodes[0].nodeValue + '" class="animated-button unregister">' +
-                x[i].getElementsByTagName("address")[0].childNodes[0].nodeValue + ' : ' + x[i].getElementsByTagName("port")[0].childNodes[0].nodeValue + 
+            '<a href="/unregister?address=' + address + '&port=' + port + '" class="animated-button unregister">' +
+                address + ' : ' + port + ' (expires in ' + expires + 's)' +
             '</a>'
         ;
     }
@@ -28,6 +28,7 @@ function parseXML(xml) {
                 '<th> Socket Type </th>' +
                 '<th> Socket File Descriptor </th>' +
                 '<th> Bytes </th>' +
+                '<th> First Byte (ms) </th>' +
             '</tr>' +
         '</thead>' +
         '<tbody>'
@@ -41,6 +42,7 @@ function parseXML(xml) {
                 '<td> server </td>' +
                 '<td>' + x[i].getElementsByTagName("server")[0].childNodes[0].nodeValue + '</td>' +
                 '<td>' + x[i].getElementsByTagName("in")[0].childNodes[0].nodeValue + '</td>' +
+                '<td class="center" rowspan="2">' + x[i].getElementsByTagName("ttfb")[0].childNodes[0].nodeValue + '</td>' +
             '</tr>' +
             '<tr>' +
                 '<td> partner </td>' +
@@ -51,4 +53,30 @@ function parseXML(xml) {
     }
     table += '</tbody>'
     document.getElementById("demo").innerHTML += table;
+
+    latency =
+        '<thead>' +
+            '<tr>' +
+                '<th> Node </th>' +
+                '<th> Handshake (ms) </th>' +
+                '<th> RTT (ms) </th>' +
+                '<th> Throughput (KiB/s) </th>' +
+            '</tr>' +
+        '</thead>' +
+        '<tbody>'
+    ;
+
+    var y = xmlDoc.getElementsByTagName("latency");
+    for (i = 0; i < y.length; i++) {
+        latency +=
+            '<tr>' +
+                '<td>' + y[i].getElementsByTagName("name")[0].childNodes[0].nodeValue + '</td>' +
+                '<td>' + y[i].getElementsByTagName("handshake")[0].childNodes[0].nodeValue + '</td>' +
+                '<td>' + y[i].getElementsByTagName("rtt")[0].childNodes[0].nodeValue + '</td>' +
+                '<td>' + y[i].getElementsByTagName("throughput")[0].childNodes[0].nodeValue + '</td>' +
+            '</tr>'
+        ;
+    }
+    latency += '</tbody>'
+    document.getElementById("latency").innerHTML = latency;
 }
\ No newline at end of file
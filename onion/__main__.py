@@ -8,6 +8,8 @@
 import argparse
 import ConfigParser
 import logging
+import multiprocessing
+import random
 import signal
 
 from common import constants
@@ -65,7 +67,7 @@ def parse_args():
         "--timeout",
         default=constants.DEFAULT_TIMEOUT,
         type=int,
-        help="timeout, default: %(default)s",
+        help="poll timeout in ms, negative blocks, default: %(default)s",
     )
     parser.add_argument(
         "--max-connections",
@@ -79,6 +81,12 @@ def parse_args():
         type=int,
         help="Max size of reading buffer, default: %(default)s",
     )
+    parser.add_argument(
+        "--workers",
+        default=1,
+        type=int,
+        help="Number of worker processes, default: %(default)s",
+    )
     parser.add_argument(
         "--log-level",
         default="INFO",
@@ -90,6 +98,81 @@ def parse_args():
     return args
 
 
+## Run node.
+# @param app_context (dict) application context.
+# @param bind_address (str) bind address of node.
+# @param bind_port (int) bind port of node.
+#
+# Runs async server with @ref onion.pollables.onion_node until terminated.
+#
+def run_node(
+    app_context,
+    bind_address,
+    bind_port,
+):
+    def exit_handler(signal, frame):
+        server.close_server()
+
+    signal.signal(signal.SIGINT, exit_handler)
+    signal.signal(signal.SIGTERM, exit_handler)
+
+    server = async_server.AsyncServer(
+        app_context,
+    )
+
+    node = server.add_listener(
+        onion_node.OnionNode,
+        bind_address,
+        bind_port,
+    )
+    if node.http_client:
+        server.add_socket(node.http_client)
+
+    logging.info("Starting the async server...")
+
+    server.run()
+
+    logging.info(
+        "Thank you for using Onion Routing project!"
+    )
+
+
+## Run registrar of node.
+# @param app_context (dict) application context.
+# @param bind_address (str) bind address of node.
+# @param bind_port (int) bind port of node.
+#
+# Runs async server with @ref onion.pollables.onion_node.Registrar, which
+# registers the node and sends heartbeats until terminated.
+#
+def run_registrar(
+    app_context,
+    bind_address,
+    bind_port,
+):
+    def exit_handler(signal, frame):
+        registrar.close()
+        server.close_server()
+
+    signal.signal(signal.SIGINT, exit_handler)
+    signal.signal(signal.SIGTERM, exit_handler)
+
+    server = async_server.AsyncServer(
+        app_context,
+    )
+
+    registrar = onion_node.Registrar(
+        bind_address,
+        bind_port,
+        app_context,
+    )
+    server.add_socket(registrar.http_client)
+
+    logging.info("Starting the registrar...")
+
+    server.run()
+
+
 ## Main implementation.
 def __main__():
     args = parse_args()
@@ -106,12 +189,6 @@ def __main__():
     if args.daemon:
         util.daemonize()
 
-    def exit_handler(signal, frame):
-        server.close_server()
-
-    signal.signal(signal.SIGINT, exit_handler)
-    signal.signal(signal.SIGTERM, exit_handler)
-
     app_context = {
         "log_file": args.log_file,
         "poll_object": args.poll_object,
@@ -120,28 +197,46 @@ def __main__():
         "max_buffer_size": args.max_buffer_size,
         "base": args.base,
 
+        "key": random.randint(0, 255),
+        "capacity": args.max_connections * args.workers,
+        "loads": multiprocessing.RawArray("l", args.workers),
+        "worker": 0,
+        "workers": args.workers,
+        "register": True,
+        "reuse_port": args.workers > 1,
         "http_address": config.get("Registry", "bind.address"),
         "http_port": config.getint("Registry", "bind.port"),
     }
 
-    server = async_server.AsyncServer(
+    if args.workers > 1:
+        def worker_exited(worker):
+            if worker < args.workers:
+                app_context["loads"][worker] = 0
+
+        worker = util.fork_workers(
+            args.workers + 1,
+            on_exit=worker_exited,
+        )
+        if worker is None:
+            logging.info(
+                "Thank you for using Onion Routing project!"
+            )
+            return
+        if worker == args.workers:
+            run_registrar(
+                app_context,
+                args.bind_address,
+                args.bind_port,
+            )
+            return
+        app_context["register"] = False
+        app_context["worker"] = worker
+
+    run_node(
         app_context,
-    )
-
-    node = server.add_listener(
-        onion_node.OnionNode,
         args.bind_address,
         args.bind_port,
     )
-    server.add_socket(node.http_client)
-
-    logging.info("Starting the async server...")
-
-    server.run()
-
-    logging.info(
-        "Thank you for using Onion Routing project!"
-    )
 
 
 if __name__ == '__main__':
@@ -6,7 +6,6 @@
 #
 
 import logging
-import random
 import socket
 import traceback
 
@@ -29,6 +28,11 @@ class OnionNode(listener_socket.Listener):
     # @param app_context (dict) application context.
     # @param listener_type (optional, @ref common.pollables.tcp_socket) not used.
     #
+    # Secret key is taken from app_context so all worker processes of the
+    # same node share it.
+    # Only a node with app_context register set registers to the registry,
+    # workers of a node are registered by a @ref Registrar.
+    #
     def __init__(
         self,
         bind_address,
@@ -50,23 +54,25 @@ class OnionNode(listener_socket.Listener):
         self.bind_port = bind_port
 
         ## Secret key for encryption.
-        self._key = random.randint(0, 255)
+        self._key = app_context["key"]
 
         ## http client, for registering and unregistring to the registry.
-        self.http_client = http_client.HttpClient(
-            socket=socket.socket(socket.AF_INET, socket.SOCK_STREAM),
-            state=constants.ACTIVE,
-            app_context=app_context,
-            connect_address=app_context["http_address"],
-            connect_port=app_context["http_port"],
-            node=self,
-        )
+        self.http_client = None
+        if app_context["register"]:
+            self.http_client = http_client.HttpClient(
+                socket=socket.socket(socket.AF_INET, socket.SOCK_STREAM),
+                state=constants.ACTIVE,
+                app_context=app_context,
+                connect_address=app_context["http_address"],
+                connect_port=app_context["http_port"],
+                node=self,
+            )
 
     ## On read event.
     # Accept new connection.
     # Create a new @ref onion.pollables.socks5_server with
     # the secret key of this node.
-    # Add socket to socket_data of @ref common.async.async_server.
+    # Add socket to @ref common.async.async_server.
     #
     def on_read(self):
         try:
@@ -81,9 +87,7 @@ class OnionNode(listener_socket.Listener):
                 self._key,
             )
 
-            self._app_context["socket_data"][
-                server.fileno()
-            ] = server
+            self._app_context["add_socket"](server)
 
         except Exception:
             logging.error(traceback.format_exc())
@@ -96,7 +100,8 @@ class OnionNode(listener_socket.Listener):
     #
     def close(self):
         self._socket.close()
-        self.http_client.unregister()
+        if self.http_client:
+            self.http_client.unregister()
 
     ## Retrive @ref _key.
     @property
@@ -110,3 +115,70 @@ class OnionNode(listener_socket.Listener):
             self.bind_port,
             self.fileno(),
         )
+
+
+## Registrar of a node whose workers accept connections.
+# With several worker processes a dedicated process registers the node
+# and sends its heartbeats, so registration does not depend on a worker
+# which may die. It stands for the node in its
+# @ref common.pollables.http_client.HttpClient and does not accept
+# connections.
+#
+class Registrar(object):
+
+    ## Constructor.
+    # @param bind_address (str) bind address of the node.
+    # @param bind_port (int) bind port of the node.
+    # @param app_context (dict) application context.
+    #
+    def __init__(
+        self,
+        bind_address,
+        bind_port,
+        app_context,
+    ):
+        ## Bind address of node.
+        self.bind_address = bind_address
+
+        ## Bind port of node.
+        self.bind_port = bind_port
+
+        ## Secret key of node, shared with the workers.
+        self._key = app_context["key"]
+
+        ## State of registration, CLOSING once registration failed.
+        self.state = constants.ACTIVE
+
+        ## http client, for registering and unregistring to the registry.
+        self.http_client = http_client.HttpClient(
+            socket=socket.socket(socket.AF_INET, socket.SOCK_STREAM),
+            state=constants.ACTIVE,
+            app_context=app_context,
+            connect_address=app_context["http_address"],
+            connect_port=app_context["http_port"],
+            node=self,
+        )
+
+    ## On close event.
+    # Registry disconnected, @ref http_client closes itself.
+    #
+    def on_close(self):
+        pass
+
+    ## Close Registrar.
+    # Entering unregister state in @ref http_client.
+    #
+    def close(self):
+        self.http_client.unregister()
+
+    ## Retrive @ref _key.
+    @property
+    def key(self):
+        return self._key
+
+    ## String representation.
+    def __repr__(self):
+        return "Registrar object. address %s, port %s." % (
+            self.bind_address,
+            self.bind_port,
+        )
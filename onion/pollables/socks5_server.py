@@ -11,11 +11,13 @@ import traceback
 
 from common import constants
 from common.async import event_object
+from common.utilities import cell_util
 from common.utilities import encryption_util
 from common.utilities import socks5_util
 from common.utilities import util
 from common.pollables import tcp_socket
 from common.pollables import proxy_socket
+from common.pollables import stream_socket
 
 
 ## Socks5 Server.
@@ -24,6 +26,9 @@ from common.pollables import proxy_socket
 # Uses rfc 1928 - https://www.ietf.org/rfc/rfc1928.txt.
 # Supports only part of the options available in the protocol which are
 # used for the purpose of the project.
+# When last node is greeted with MY_CELL_SIGNATURE the connection carries
+# cells of many streams instead of a single connection, see
+# @ref common.utilities.cell_util.
 #
 class Socks5Server(tcp_socket.TCPSocket):
 
@@ -38,6 +43,8 @@ class Socks5Server(tcp_socket.TCPSocket):
     # common.pollables.tcp_socket.TCPSocket._socket to be able to
     # read and write from it asynchronously using the right procedure for
     # socks5 protocol.
+    # Counted in load of this worker in app_context once it carries
+    # traffic, see @ref _count_load().
     #
     def __init__(
         self,
@@ -72,6 +79,25 @@ class Socks5Server(tcp_socket.TCPSocket):
         #
         self._last_node = True
 
+        ## Number of bytes at the beginning of
+        # @ref common.pollables.tcp_socket.TCPSocket._buffer which are
+        # already encrypted.
+        # Bytes are encrypted once when first sent, unsent bytes stay
+        # encrypted until next write.
+        #
+        self._encrypted = 0
+
+        ## Streams carried by the connection in CIRCUIT_STATE.
+        self._multiplexer = cell_util.Multiplexer(self._buffer)
+
+        ## Bytes recieved after the greeting, a connection request which
+        # client sent without waiting for greeting response.
+        #
+        self._pipelined = ""
+
+        ## Whether connection is counted in load of worker.
+        self._counted = False
+
     ## Create the state machine for socket.
     # @returns (dict) states to the thier methods.
     #
@@ -97,6 +123,10 @@ class Socks5Server(tcp_socket.TCPSocket):
                 "method": self._partner_state,
                 "next": constants.PARTNER_STATE,
             },
+            constants.CIRCUIT_STATE: {
+                "method": self._circuit_state,
+                "next": constants.CIRCUIT_STATE,
+            },
         }
 
     ## Create command map.
@@ -110,16 +140,26 @@ class Socks5Server(tcp_socket.TCPSocket):
     ## Recv greeting state.
     # @returns (bool) whether ready to next state.
     #
-    # - Validate that recieved content is a socks5 greeting.
+    # - Validate that recieved content is a socks5 greeting, a greeting
+    # without methods is rejected with socks5_util.Socks5Error.
     # - Check whether special method is inside - special method is used for all
     # regular nodes, while in the greeting for the last one it is missing.
     # - Choose the right method from the recieved ones.
+    # - Last node greeted with MY_CELL_SIGNATURE chooses it and continues
+    # to CIRCUIT_STATE after greeting.
+    # - Bytes after the greeting are kept in @ref _pipelined.
     #
     def _recv_greeting(self):
         if not self._decode:
+            data = str(self._buffer)
+            if len(data) < 2 or len(data) < 2 + ord(data[1]):
+                return False
+            if ord(data[1]) == 0:
+                raise socks5_util.Socks5Error()
             self._decode = socks5_util.GreetingRequest.decode(
-                self._buffer,
+                data[:2 + ord(data[1])],
             )
+            self._pipelined = data[2 + ord(data[1]):]
 
         if constants.MY_SOCKS_SIGNATURE in self._decode["methods"]:
             self._last_node = False
@@ -127,6 +167,17 @@ class Socks5Server(tcp_socket.TCPSocket):
                 constants.MY_SOCKS_SIGNATURE,
             )
 
+        if constants.MY_CELL_SIGNATURE in self._decode["methods"]:
+            self._decode["methods"].remove(
+                constants.MY_CELL_SIGNATURE,
+            )
+            if self._last_node:
+                self._decode["method"] = constants.MY_CELL_SIGNATURE
+                self._state_machine[
+                    constants.SEND_GREETING
+                ]["next"] = constants.CIRCUIT_STATE
+                return True
+
         self._decode["method"] = constants.NO_ACCEPTABLE_METHODS
         for m in self._decode["methods"]:
             if m in constants.SUPPORTED_METHODS:
@@ -140,8 +191,12 @@ class Socks5Server(tcp_socket.TCPSocket):
     # - Build a greeting response to send back to the client.
     #
     def _send_greeting(self):
-        self._buffer = socks5_util.GreetingResponse.encode(
-            self._decode,
+        self._buffer.clear()
+        self._encrypted = 0
+        self._buffer.append(
+            socks5_util.GreetingResponse.encode(
+                self._decode,
+            )
         )
         return True
 
@@ -154,8 +209,10 @@ class Socks5Server(tcp_socket.TCPSocket):
     def _recv_connection_request(self):
         if not self._decode:
             self._decode = socks5_util.Socks5Request.decode(
-                self._buffer,
+                str(self._buffer),
             )
+            if not self._decode:
+                return False
 
         self._decode["reply"] = self._command_map[
             self._decode["command"]
@@ -168,8 +225,12 @@ class Socks5Server(tcp_socket.TCPSocket):
     # Build a connection response to send back to the client.
     #
     def _send_connection_request(self):
-        self._buffer = socks5_util.Socks5Response.encode(
-            self._decode,
+        self._buffer.clear()
+        self._encrypted = 0
+        self._buffer.append(
+            socks5_util.Socks5Response.encode(
+                self._decode,
+            )
         )
         return True
 
@@ -181,6 +242,140 @@ class Socks5Server(tcp_socket.TCPSocket):
     def _partner_state(self):
         return True
 
+    ## Circuit state.
+    # Server carries cells of streams between client and destinations.
+    #
+    def _circuit_state(self):
+        return True
+
+    ## Count connection in load of worker.
+    #
+    # Called once the connection reaches PARTNER_STATE or CIRCUIT_STATE.
+    # Connections which close during the handshake, such as probes of
+    # entry nodes which send a greeting only, are never counted.
+    #
+    def _count_load(self):
+        if not self._counted and self._machine_current_state in (
+            constants.PARTNER_STATE,
+            constants.CIRCUIT_STATE,
+        ):
+            app_context = self._request_context["app_context"]
+            app_context["loads"][app_context["worker"]] += 1
+            self._counted = True
+
+    ## Add stream.
+    # @param stream (@ref common.pollables.stream_socket.StreamSocket)
+    # the stream.
+    # @param stream_id (int) id of stream given by client.
+    # @returns (int) id of stream.
+    #
+    def add_stream(
+        self,
+        stream,
+        stream_id,
+    ):
+        return self._multiplexer.add_stream(stream, stream_id)
+
+    ## Remove stream.
+    # @param stream_id (int) id of stream.
+    #
+    def remove_stream(
+        self,
+        stream_id,
+    ):
+        self._multiplexer.remove_stream(stream_id)
+
+    ## Send cell.
+    # @param stream_id (int) id of stream.
+    # @param command (int) cell command.
+    # @param payload (optional, str) content of cell.
+    #
+    # Streams send cells on their events, so connection is marked dirty.
+    #
+    def send_cell(
+        self,
+        stream_id,
+        command,
+        payload="",
+    ):
+        self._multiplexer.send(stream_id, command, payload)
+        self.mark_dirty()
+
+    ## BEGIN cell recieved.
+    # @param stream_id (int) id of new stream.
+    # @param payload (str) destination as address:port.
+    #
+    # Connect a new @ref common.pollables.stream_socket.StreamSocket to
+    # destination and send back a BEGIN cell with the reply:
+    # - Successful connection - reply is SUCCESS.
+    # - Unsuccessful connection - reply is GENERAL_SERVER_FAILURE.
+    # Connecting does not block, DATA cells which follow the BEGIN cell
+    # are kept by the stream and written once it is connected. If it fails
+    # to connect the stream is closed and an END cell is sent.
+    #
+    def _begin_stream(
+        self,
+        stream_id,
+        payload,
+    ):
+        reply = constants.SUCCESS
+        stream = None
+        try:
+            address, port = payload.rsplit(":", 1)
+            logging.info(
+                "connecting stream %s to: %s %s" %
+                (
+                    stream_id,
+                    address,
+                    port,
+                ),
+            )
+
+            stream = stream_socket.StreamSocket(
+                socket.socket(socket.AF_INET, socket.SOCK_STREAM),
+                constants.ACTIVE,
+                self._request_context["app_context"],
+                self,
+                stream_id,
+            )
+
+            util.connect(
+                stream.socket,
+                address,
+                int(port),
+            )
+
+            self._request_context["app_context"]["add_socket"](stream)
+        except Exception:
+            logging.error(traceback.format_exc())
+            reply = constants.GENERAL_SERVER_FAILURE
+            if stream:
+                self.remove_stream(stream_id)
+                stream.socket.close()
+
+        self.send_cell(
+            stream_id,
+            constants.CELL_BEGIN,
+            chr(reply),
+        )
+
+    ## Read cells.
+    # Read from socket, decrypt and pass complete cells to their streams.
+    #
+    def _read_cells(self):
+        cells = self._multiplexer.cells
+        recieved = util.recieve_buffer(
+            self._socket,
+            cells,
+            self._request_context["app_context"]["max_buffer_size"],
+        )
+        encryption_util.decrypt_buffer(
+            cells,
+            self._key,
+            len(cells) - recieved,
+        )
+        self._multiplexer.dispatch(self._begin_stream)
+
     ## Connect command.
     # @returns (int) reply - status of command.
     #
@@ -242,26 +437,27 @@ class Socks5Server(tcp_socket.TCPSocket):
 
             self._partner = partner
             partner.partner = self
-            self._request_context["app_context"][
-                "socket_data"
-            ][partner.fileno()] = partner
+            self._request_context["app_context"]["add_socket"](partner)
         except Exception:
             if partner:
                 partner.socket.close()
             raise
 
     ## Write write encrypted message.
+    # Encrypt only bytes that were added since last write, send as much as
+    # possible and keep the unsent remainder encrypted.
+    #
     def _write_encrypted(self):
-        self._buffer = encryption_util.decrypt(
-            util.send_buffer(
-                self._socket,
-                encryption_util.encrypt(
-                    self._buffer,
-                    self._key,
-                ),
-            ),
+        encryption_util.encrypt_buffer(
+            self._buffer,
             self._key,
+            self._encrypted,
         )
+        util.send_buffer(
+            self._socket,
+            self._buffer,
+        )
+        self._encrypted = len(self._buffer)
 
     ## On read event.
     # Read from @ref _partner until maximum size of @ref _buffer is recived.
@@ -271,22 +467,34 @@ class Socks5Server(tcp_socket.TCPSocket):
     # state is PARTNER_STATE.
     # @ref _last_node == True -> decrypt content with key at all times.
     #
+    # In CIRCUIT_STATE read cells.
+    # @ref _partner has data to write, so it is marked dirty.
+    #
     def on_read(self):
-        data = util.recieve_buffer(
+        if self._machine_current_state == constants.CIRCUIT_STATE:
+            self._read_cells()
+            return
+
+        buffer = self._partner.buffer
+        recieved = util.recieve_buffer(
             self._socket,
+            buffer,
             self._request_context[
                 "app_context"
-            ]["max_buffer_size"] - len(self._partner.buffer),
+            ]["max_buffer_size"] - len(buffer),
         )
         if(
             self._machine_current_state != constants.PARTNER_STATE or
             self._last_node
         ):
-            data = encryption_util.decrypt(
-                data,
+            encryption_util.decrypt_buffer(
+                buffer,
                 self._key,
+                len(buffer) - recieved,
             )
-        self._partner.buffer += data
+
+        if self._partner is not self:
+            self._partner.mark_dirty()
 
         if self._state_machine[self._machine_current_state]["method"]():
             self._machine_current_state = self._state_machine[
@@ -300,8 +508,25 @@ class Socks5Server(tcp_socket.TCPSocket):
     # state is PARTNER_STATE.
     # @ref _last_node == True -> encrypt content with key at all times.
     #
+    # State is updated once @ref _buffer was sent completely. Until then
+    # the state is not run again and the encrypted remainder is sent, so
+    # responses are not lost when the socket accepts only part of them.
+    # Afterwards a connection request in @ref _pipelined is handled, see
+    # @ref _recv_pipelined().
+    # Connection is counted in load of worker once the handshake is sent.
+    #
+    # In CIRCUIT_STATE streams stop reading while @ref _buffer is full,
+    # they are marked dirty once it is not full anymore.
+    #
     def on_write(self):
-        if self._state_machine[self._machine_current_state]["method"]():
+        max_buffer_size = self._request_context[
+            "app_context"
+        ]["max_buffer_size"]
+        full = len(self._buffer) >= max_buffer_size
+        if (
+            self._encrypted or
+            self._state_machine[self._machine_current_state]["method"]()
+        ):
             if(
                 self._machine_current_state != constants.PARTNER_STATE or
                 self._last_node
@@ -310,30 +535,76 @@ class Socks5Server(tcp_socket.TCPSocket):
             else:
                 super(Socks5Server, self).on_write()
 
-            self._decode = {}
-            self._machine_current_state = self._state_machine[
-                self._machine_current_state
-            ]["next"]
+            if not self._buffer:
+                self._decode = {}
+                self._machine_current_state = self._state_machine[
+                    self._machine_current_state
+                ]["next"]
+                self._count_load()
+                self._recv_pipelined()
+
+        if full and len(self._buffer) < max_buffer_size:
+            self._multiplexer.mark_streams()
+
+    ## Handle pipelined connection request.
+    # Once greeting response is sent, a connection request in
+    # @ref _pipelined is handled as if it was just recieved.
+    # A partial request is completed by next reads.
+    #
+    def _recv_pipelined(self):
+        if (
+            self._pipelined and
+            self._machine_current_state == constants.RECV_CONNECTION_REQUEST
+        ):
+            self._buffer.append(self._pipelined)
+            self._pipelined = ""
+            if self._recv_connection_request():
+                self._machine_current_state = (
+                    constants.SEND_CONNECTION_REQUEST
+                )
+
+    ## On close event.
+    # Change @ref _state of socket to CLOSING and empty @ref _buffer.
+    # Close all streams carried by the connection.
+    #
+    def on_close(self):
+        super(Socks5Server, self).on_close()
+        self._multiplexer.close()
+
+    ## Close Socks5Server.
+    # Remove connection from load of worker if counted and close socket.
+    #
+    def close(self):
+        if self._counted:
+            app_context = self._request_context["app_context"]
+            app_context["loads"][app_context["worker"]] -= 1
+            self._counted = False
+        super(Socks5Server, self).close()
 
     ## Get events for poller.
     # @returns (int) events to register for poller.
     #
     # On appropriate state:
-    # - POLLIN when @ref _state is ACTIVE and @ref _buffer is not full.
+    # - POLLIN when @ref _state is ACTIVE and @ref _buffer is not full,
+    # in CIRCUIT_STATE when no stream has a full buffer.
     # - POLLOUT when @ref _buffer is not empty.
     #
     def get_events(self):
         event = event_object.BaseEvent.POLLERR
-        if (
+        max_buffer_size = self._request_context[
+            "app_context"
+        ]["max_buffer_size"]
+        if self._state == constants.ACTIVE and (
             (
-                self._state == constants.ACTIVE and
-                not len(self._buffer) >= self._request_context[
-                    "app_context"
-                ]["max_buffer_size"]
-            ) and self._machine_current_state in (
-                constants.PARTNER_STATE,
-                constants.RECV_CONNECTION_REQUEST,
-                constants.RECV_GREETING,
+                not len(self._buffer) >= max_buffer_size and
+                self._machine_current_state in (
+                    constants.PARTNER_STATE,
+                    constants.RECV_CONNECTION_REQUEST,
+                    constants.RECV_GREETING,
+                )
+            ) or (
+                self._machine_current_state == constants.CIRCUIT_STATE and
+                not self._multiplexer.is_full(max_buffer_size)
             )
         ):
             event |= event_object.BaseEvent.POLLIN
@@ -342,6 +613,7 @@ class Socks5Server(tcp_socket.TCPSocket):
                 constants.PARTNER_STATE,
                 constants.SEND_CONNECTION_REQUEST,
                 constants.SEND_GREETING,
+                constants.CIRCUIT_STATE,
             )
         ):
             event |= event_object.BaseEvent.POLLOUT
@@ -13,10 +13,15 @@ import signal
 from common import constants
 from common.async import async_server
 from common.async import event_object
+from common.async import timer_wheel
 from common.pollables import listener_socket
+from common.utilities import cache_util
+from common.utilities import directory_util
+from common.utilities import router_util
 from common.utilities import util
 from common.utilities import xml_util
 from registry.pollables import http_socket
+from registry.services import unregister_service
 
 
 ## Poll events dict.
@@ -56,7 +61,7 @@ def parse_args():
         "--timeout",
         default=constants.DEFAULT_TIMEOUT,
         type=int,
-        help="timeout, default: %(default)s",
+        help="poll timeout in ms, negative blocks, default: %(default)s",
     )
     parser.add_argument(
         "--max-connections",
@@ -70,6 +75,12 @@ def parse_args():
         type=int,
         help="Max size of reading buffer, default: %(default)s",
     )
+    parser.add_argument(
+        "--asset-cache-size",
+        default=constants.ASSET_CACHE_SIZE,
+        type=int,
+        help="Max bytes of cached static files, default: %(default)s",
+    )
     parser.add_argument(
         "--log-level",
         default="INFO",
@@ -108,6 +119,11 @@ def __main__():
         "base": args.base,
 
         "registry": {},
+        "directory": directory_util.create_directory(),
+        "assets": cache_util.AssetCache(args.asset_cache_size),
+        "router": router_util.Router(
+            [router_util.load(s) for s in constants.SERVICES],
+        ),
         "nodes": {},
     }
 
@@ -118,8 +134,20 @@ def __main__():
     )
     application_context["xml"] = xml
 
+    def expire_node(name):
+        logging.info("node %s sent no heartbeat, expired" % name)
+        unregister_service.unregister(application_context, name)
+
+    application_context["expiry"] = timer_wheel.TimerWheel(
+        constants.NODE_EXPIRY_TICK,
+        constants.NODE_EXPIRY_TIMEOUT,
+        expire_node,
+    )
+
     def exit_handler(signal, frame):
         server.close_server()
+        expiry_timer.cancel()
+        xml_timer.cancel()
 
     signal.signal(signal.SIGINT, exit_handler)
     signal.signal(signal.SIGTERM, exit_handler)
@@ -128,6 +156,18 @@ def __main__():
         application_context,
     )
 
+    expiry_timer = server.add_timer(
+        constants.NODE_EXPIRY_TICK,
+        application_context["expiry"].advance,
+        interval=constants.NODE_EXPIRY_TICK,
+    )
+
+    xml_timer = server.add_timer(
+        constants.XML_TIME_UPDATE,
+        xml.update,
+        interval=constants.XML_TIME_UPDATE,
+    )
+
     server.add_listener(
         listener_socket.Listener,
         config.get("HttpSocket", "bind.address"),
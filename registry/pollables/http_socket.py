@@ -7,22 +7,37 @@
 #
 
 import logging
-import importlib
+import time
 
 from common import constants
 from common.async import event_object
 from common.pollables import tcp_socket
+from common.utilities import buffer_util
 from common.utilities import http_util
+from common.utilities import util
 from registry.services import base_service
-from registry.services import file_service
 
 
 ## Http Socket.
+#
+# Persistent HTTP/1.1 connection.
+# Requests are read to @ref _read_buffer and handled one after the other,
+# so pipelined requests are answered in order. Responses are queued in
+# @ref common.pollables.tcp_socket.TCPSocket._buffer.
+# Connection is closed when client asks for it, after a request which
+# could not be read, or after HTTP_IDLE_TIMEOUT seconds without requests
+# unless a node registered through it.
+#
 class HttpSocket(tcp_socket.TCPSocket):
 
     ## Request context.
     _request_context = {}
 
+    ## Codes of errors after which the end of request can not be found,
+    # raised by the parser or for requests which are too large.
+    #
+    FRAMING_ERRORS = (400, 413, 431, 505)
+
     ## Constructor.
     # @param socket (socket) the wrapped socket.
     # @param state (int) state of HttpSocket.
@@ -53,13 +68,29 @@ class HttpSocket(tcp_socket.TCPSocket):
         ## Service class of the current request.
         self._service_class = None
 
-        for service in constants.SERVICES:
-            importlib.import_module(service)
+        ## Recieved requests which were not handled yet.
+        self._read_buffer = buffer_util.Buffer()
 
-        ## SERVICES dict for all supported services.
-        self.SERVICES = {
-            s.NAME: s for s in base_service.BaseService.__subclasses__()
-        }
+        ## Parser of current request.
+        self._parser = http_util.HttpParser()
+
+        ## Iterator of current response, None until content is sent.
+        self._response = None
+
+        ## Whether to close connection once current response is sent.
+        self._close_after_response = False
+
+        ## Whether connection is kept open regardless of idle time.
+        self._persistent = False
+
+        ## Time of last activity, for idle timeout.
+        self._last_activity = time.time()
+
+        ## Timer closing connection when idle.
+        self._idle_timer = app_context["timers"].add(
+            constants.HTTP_IDLE_TIMEOUT,
+            self._check_idle,
+        )
 
         self._reset()
 
@@ -99,106 +130,165 @@ class HttpSocket(tcp_socket.TCPSocket):
     ## Recv status state.
     # returns (bool) whether state is finished.
     #
-    # - If request is HTTP, try to open requested service.
-    # - If no request is supported, try to use
-    # @ref registry.services.file_service.
+    # - If request is HTTP, open service of its path by router in
+    # app_context, see @ref common.utilities.router_util.
     # - Call @ref registry.services.base_service.BaseService.before_request_headers().
     #
     # In case of error raise HTTPError.
     #
+    # Next request is not read while
+    # @ref common.pollables.tcp_socket.TCPSocket._buffer is full, so
+    # responses of pipelined requests do not grow it further.
+    #
     def _recv_status(self):
-        status, self._buffer = http_util.get_first_line(
-            self._buffer,
+        if len(self._buffer) >= self._request_context[
+            "app_context"
+        ]["max_buffer_size"]:
+            return False
+        if not http_util.get_first_line(
+            self._parser,
+            self._read_buffer,
             self._request_context,
-        )
-        if not status:
+        ):
+            self._check_request_size()
             return False
+        self._last_activity = time.time()
 
-        try:
-            self._service_class = self.SERVICES.get(
-                self._request_context["parse"].path,
-                file_service.FileService,
-            )(
-                self._request_context,
-            )
-            logging.debug("service %s requested" % (self._service_class.NAME))
-        except KeyError:
+        service = self._request_context["app_context"]["router"].route(
+            self._request_context["parse"].path,
+        )
+        if service is None:
             raise http_util.HTTPError(
-                code=500,
-                status="Internal Error",
+                code=404,
+                status="Not Found",
                 message="service not supported",
             )
+        self._service_class = service(self._request_context)
+        logging.debug("service %s requested" % (self._service_class.NAME))
         self._service_class.before_request_headers()
         return True
 
     ## Recieve headers state.
     # returns (bool) whether state is finished.
     #
-    # Get all headers from request.
-    # Call @ref registry.services.base_service.BaseService.before_response_content().
+    # Get all headers from request, once all of them were recieved.
+    # Call @ref registry.services.base_service.BaseService.before_request_content().
+    # Close connection after response if client asks for it.
     #
     def _recv_headers(self):
-        status, self._buffer = http_util.get_headers(
-            self._buffer,
-            self._request_context,
-            self._service_class,
-        )
-        if status:
-            self._service_class.before_response_content()
-            return True
-        else:
-            self._service_class.before_response_content()
+        if not self._parser.recv_headers(
+            self._read_buffer,
+            self._service_class.wanted_headers(),
+        ):
+            self._check_request_size()
             return False
+        self._request_context["request_headers"] = self._parser.headers
+        if self._request_context["request_headers"].get(
+            constants.CONNECTION,
+            "",
+        ).lower() == "close":
+            self._close_after_response = True
+        self._service_class.before_request_content()
+        return True
 
     ## Recieve content state.
     # returns (bool) whether state is finished.
     #
-    # Get content from request.
+    # Get content from request, up to max_buffer_size bytes which were not
+    # handled yet.
     # - Call @ref registry.services.base_service.BaseService.handle_content().
     # - After handle_content:
     # Call @ref registry.services.base_service.BaseService.before_response_status().
     #
     def _recv_content(self):
-        http_util.get_content(
-            self._buffer,
-            self._request_context,
+        self._request_context["content"] += self._parser.recv_content(
+            self._read_buffer,
+            self._request_context[
+                "app_context"
+            ]["max_buffer_size"] - len(self._request_context["content"]),
         )
         while self._service_class.handle_content():
             pass
-        if "content_length" not in self._request_context:
-            self._service_class.before_response_status()
-            return True
-        elif not self._buffer:
+        if self._parser.state != constants.PARSE_DONE:
+            if len(self._request_context["content"]) >= self._request_context[
+                "app_context"
+            ]["max_buffer_size"]:
+                raise http_util.HTTPError(
+                    code=413,
+                    status="Payload Too Large",
+                    message="content too large",
+                )
+            self._check_request_size()
             return False
+        self._service_class.before_response_status()
+        return True
+
+    ## Check size of request which is not complete.
+    # Raise HTTPError if a line of it fills @ref _read_buffer, it can not
+    # be read.
+    #
+    def _check_request_size(self):
+        if len(self._read_buffer) >= self._request_context[
+            "app_context"
+        ]["max_buffer_size"]:
+            raise http_util.HTTPError(
+                code=431,
+                status="Request Header Fields Too Large",
+                message="request too large",
+            )
 
     ## Send status state.
     # returns (bool) whether state is finished.
     #
+    # - Wait until
+    # @ref registry.services.base_service.BaseService.response_ready().
+    # - Call @ref registry.services.base_service.BaseService.before_response_headers(),
+    # before anything of response is queued so it may still raise HTTPError.
     # - Update @ref _buffer to appropriate HTTP status.
-    # - Call @ref registry.services.base_service.BaseService.before_response_headers().
     #
     def _send_status(self):
-        self._buffer = (
-            "%s %s %s\r\n"
-        ) % (
-            constants.HTTP_SIGNATURE,
-            self._request_context["code"],
-            self._request_context["status"]
-        )
+        if not self._service_class.response_ready():
+            return False
         self._service_class.before_response_headers()
+        self._buffer.append(
+            (
+                "%s %s %s\r\n"
+            ) % (
+                constants.HTTP_SIGNATURE,
+                self._request_context["code"],
+                self._request_context["status"]
+            )
+        )
         return True
 
     ## Send headers state.
     # returns (bool) whether state is finished.
     #
     # - Set headers for HTTP response according to _service_class.
+    # - Send response chunked if service did not set its Content-Length.
+    # - Tell client if connection is closed after response.
     # - Call @ref registry.services.base_service.BaseService.before_response_content().
     #
     def _send_headers(self):
-        status, self._buffer = http_util.set_headers(
-            self._buffer,
+        if (
+            constants.CONTENT_LENGTH not in self._request_context[
+                "response_headers"
+            ] and
+            self._request_context["code"] not in (204, 304)
+        ):
+            self._request_context["chunked"] = True
+            self._request_context[
+                "response_headers"
+            ][constants.TRANSFER_ENCODING] = "chunked"
+        if self._close_after_response:
+            self._request_context[
+                "response_headers"
+            ][constants.CONNECTION] = "close"
+        status, headers = http_util.set_headers(
+            "",
             self._request_context,
         )
+        self._buffer.append(headers)
         if status:
             self._service_class.before_response_content()
             return True
@@ -209,31 +299,92 @@ class HttpSocket(tcp_socket.TCPSocket):
     ## Send content state.
     # returns (bool) whether state is finished.
     #
-    # Add content from _service_class.response() to _buffer and
-    # send the whole HTTP response it to client.
-    # On end of content: @ref registry.services.base_service.BaseService.before_terminate().
+    # Send file of _service_class.response_file() with
+    # @ref _send_file() if system supports sendfile, otherwise queue
+    # content of _service_class.response() with @ref _queue_content().
+    # On end of content: @ref registry.services.base_service.BaseService.before_terminate(),
+    # and close connection if needed.
     #
     def _send_content(self):
-        content = None
-        content = self._service_class.response()
-        if content is None:
-            self._service_class.before_terminate()
-            self._reset()
-            return True
+        fd = self._service_class.response_file()
+        if fd is not None and util.SENDFILE:
+            finished = self._send_file(fd)
         else:
-            self._buffer += content
-            super(HttpSocket, self).on_write()
+            finished = self._queue_content()
+        if not finished:
             return False
 
+        self._service_class.before_terminate()
+        if self._request_context.get("persistent"):
+            self._persistent = True
+        if self._close_after_response:
+            self._state = constants.CLOSING
+        self._last_activity = time.time()
+        self._reset()
+        return True
+
+    ## Queue content of response.
+    # returns (bool) whether all content was queued.
+    #
+    # Add pieces of _service_class.response() to _buffer while it is not
+    # full, as chunks if response is chunked.
+    #
+    def _queue_content(self):
+        if self._response is None:
+            self._response = iter(self._service_class.response())
+        while len(self._buffer) < self._request_context[
+            "app_context"
+        ]["max_buffer_size"]:
+            content = next(self._response, None)
+            if content is None:
+                if self._request_context.get("chunked"):
+                    self._buffer.append("0\r\n\r\n")
+                return True
+            if not content:
+                continue
+            if self._request_context.get("chunked"):
+                self._buffer.append("%x\r\n" % len(content))
+                self._buffer.append(content)
+                self._buffer.append(constants.CRLF_BIN)
+            else:
+                self._buffer.append(content)
+        return False
+
+    ## Send file of response.
+    # @param fd (int) file descriptor of file.
+    # returns (bool) whether whole file was sent.
+    #
+    # Once @ref common.pollables.tcp_socket.TCPSocket._buffer with
+    # previous responses, status and headers is sent, send Content-Length
+    # bytes of file straight to socket, as much as socket takes on every
+    # write event.
+    #
+    def _send_file(
+        self,
+        fd,
+    ):
+        util.send_buffer(self._socket, self._buffer)
+        if self._buffer:
+            return False
+        length = int(
+            self._request_context["response_headers"][constants.CONTENT_LENGTH]
+        )
+        offset = self._request_context.get("file_offset", 0)
+        offset += util.send_file(self._socket, fd, offset, length - offset)
+        self._request_context["file_offset"] = offset
+        return offset >= length
+
     ## Reset _request_context.
     # Empty all request fields of previous request.
-    # Empty _buffer.
-    # Empty _service_class.
+    # Empty _service_class and @ref _response, reset @ref _parser.
+    # Services which respond later mark socket of request context dirty
+    # once their response is ready.
     #
     def _reset(self):
         a = self._request_context["app_context"]
         self._request_context = {
             "app_context": a,
+            "socket": self,
             "uri": "",
             "parse": "",
             "code": 200,
@@ -243,14 +394,32 @@ class HttpSocket(tcp_socket.TCPSocket):
             "response": "",
             "content": "",
         }
-        self._buffer = ""
         self._service_class = None
+        self._response = None
+        self._parser.reset()
 
     ## HTTP error handler.
     # @param e (HTTPError) the HTTPError which was caught.
+    # Terminates service of failed request.
     # Fills @ref _request_context with error response status, headers, content.
+    # If request was not read completely:
+    # - After an error in @ref FRAMING_ERRORS the rest of it can not be
+    # told apart from the next request, so connection is closed after
+    # response.
+    # - Otherwise the rest of it is read by
+    # @ref registry.services.base_service.ErrorService before the response
+    # is sent, and connection is kept open.
     #
     def _http_error(self, e):
+        if self._service_class:
+            self._service_class.before_terminate()
+        next_state = constants.SEND_STATUS
+        if self._machine_state <= constants.RECV_CONTENT:
+            if e.code in HttpSocket.FRAMING_ERRORS:
+                self._read_buffer.clear()
+                self._close_after_response = True
+            else:
+                next_state = max(self._machine_state, constants.RECV_HEADERS)
         self._request_context["code"] = e.code
         self._request_context["status"] = e.status
         self._request_context["response"] = e.message
@@ -260,73 +429,113 @@ class HttpSocket(tcp_socket.TCPSocket):
         self._request_context[
             "response_headers"
         ]["Content-Type"] = "text/plain"
-        self._service_class = base_service.BaseService(
+        self._service_class = base_service.ErrorService(
             self._request_context,
         )
-        self._machine_state = constants.SEND_STATUS
+        self._machine_state = next_state
 
-    ## On read event.
-    # Read from @ref common.pollables.tcp_socket.TCPSocket._partner until maximum size of @ref _buffer is recived.
-    #
-    # Enter the appropriate state in _state_machine.
-    # Once state is finished, go to the next state.
+    ## Run states of _state_machine.
+    # Once state is finished, go to the next state, until a state can not
+    # finish.
     # On HTTPError: call @ref _http_error().
     #
+    def _run_states(self):
+        while self._state == constants.ACTIVE:
+            try:
+                if not self._state_machine[self._machine_state]["method"]():
+                    break
+                self._machine_state = self._state_machine[
+                    self._machine_state
+                ]["next"]
+            except http_util.HTTPError as e:
+                self._http_error(e)
+
+    ## On read event.
+    # Read requests to @ref _read_buffer until it is full and run states.
+    #
     def on_read(self):
-        super(HttpSocket, self).on_read()
-        try:
-            while self._machine_state <= constants.RECV_CONTENT:
-                if self._state_machine[self._machine_state]["method"]():
-                    self._machine_state = self._state_machine[
-                        self._machine_state
-                    ]["next"]
-        except http_util.HTTPError as e:
-            self._http_error(e)
+        util.recieve_buffer(
+            self._socket,
+            self._read_buffer,
+            self._request_context[
+                "app_context"
+            ]["max_buffer_size"] - len(self._read_buffer),
+        )
+        self._last_activity = time.time()
+        self._run_states()
 
     ## On write event.
-    # Write everything stored and @ref _buffer.
-    #
-    # Enter the appropriate state in _state_machine.
-    # Once state is finished, go to the next state.
-    # On HTTPError: call @ref _http_error().
+    # Run states, which queue responses in
+    # @ref common.pollables.tcp_socket.TCPSocket._buffer, and write it.
     #
     def on_write(self):
-        try:
-            while(
-                self._machine_state >= constants.SEND_STATUS and
-                self._machine_state <= constants.SEND_CONTENT
-            ):
-                if self._state_machine[self._machine_state]["method"]():
-                    self._machine_state = self._state_machine[
-                        self._machine_state
-                    ]["next"]
-        except http_util.HTTPError as e:
-            self._http_error(e)
+        self._run_states()
+        super(HttpSocket, self).on_write()
+
+    ## Idle timer event.
+    # Close connection if no request was handled for HTTP_IDLE_TIMEOUT
+    # seconds, otherwise check again when it might be.
+    # Connections through which a node registered are kept open.
+    #
+    def _check_idle(self):
+        idle = time.time() - self._last_activity
+        if (
+            self._persistent or
+            self._state != constants.ACTIVE or
+            self._machine_state != constants.RECV_STATUS or
+            self._read_buffer or
+            self._buffer
+        ):
+            idle = 0
+        if idle >= constants.HTTP_IDLE_TIMEOUT:
+            logging.debug("closing idle connection %s" % self)
+            self._state = constants.CLOSING
+            self.mark_dirty()
+            return
+        if not self._persistent:
+            self._idle_timer = self._request_context[
+                "app_context"
+            ]["timers"].add(
+                constants.HTTP_IDLE_TIMEOUT - idle,
+                self._check_idle,
+            )
+
+    ## Close HttpSocket.
+    # Stop idle timer.
+    # Call @ref registry.services.base_service.BaseService.before_terminate()
+    # if socket is closed during request.
+    #
+    def close(self):
+        self._idle_timer.cancel()
+        if self._service_class:
+            self._service_class.before_terminate()
+            self._service_class = None
+        super(HttpSocket, self).close()
 
     ## Get events for poller.
     # @returns (int) events to register for poller.
     #
     # POLLIN when:
     # - @ref common.pollables.tcp_socket.TCPSocket._state is ACTIVE.
-    # - @ref common.pollables.tcp_socket.TCPSocket._buffer is not full.
-    # - @ref _machine_state is less then RECV_CONTENT.
+    # - @ref _read_buffer is not full.
     # POLLOUT when:
     # - @ref common.pollables.tcp_socket.TCPSocket._buffer is not empty.
-    # - SEND_STATUS <= @ref _machine_state <= SEND_CONTENT
+    # - Or SEND_STATUS <= @ref _machine_state <= SEND_CONTENT and service
+    # is ready to respond.
     #
     def get_events(self):
         event = event_object.BaseEvent.POLLERR
         if (
             self._state == constants.ACTIVE and
-            not len(self._buffer) >= self._request_context[
+            len(self._read_buffer) < self._request_context[
                 "app_context"
-            ]["max_buffer_size"] and
-            self._machine_state <= constants.RECV_CONTENT
+            ]["max_buffer_size"]
         ):
             event |= event_object.BaseEvent.POLLIN
-        if(
+        if self._buffer or (
             self._machine_state >= constants.SEND_STATUS and
-            self._machine_state <= constants.SEND_CONTENT
+            self._machine_state <= constants.SEND_CONTENT and
+            self._service_class.response_ready()
         ):
             event |= event_object.BaseEvent.POLLOUT
         return event
@@ -16,6 +16,9 @@ class BaseService(object):
     ## Service name
     NAME = "/base"
 
+    ## Whether service serves every path starting with @ref NAME.
+    PREFIX = False
+
     ## Constructor.
     # @param request_context (dict) request context.
     #
@@ -31,12 +34,7 @@ class BaseService(object):
 
     ## Function called before receiving HTTP content.
     def before_request_content(self):
-        self._request_context["content_length"] = int(
-            self._request_context["request_headers"].get(
-                constants.CONTENT_LENGTH,
-                "0",
-            )
-        )
+        pass
 
     ## Function called during receiving HTTP content.
     def handle_content(self):
@@ -47,6 +45,9 @@ class BaseService(object):
         pass
 
     ## Function called before sending HTTP headers.
+    # Set Content-Length of response, services which stream their response
+    # leave it unset and it is sent chunked.
+    #
     def before_response_headers(self):
         if constants.CONTENT_LENGTH not in self._request_context[
             "response_headers"
@@ -61,16 +62,30 @@ class BaseService(object):
     def before_response_content(self):
         pass
 
-    ## Function called during sending HTTP content.
-    # @returns (str) HTTP response by service.
+    ## Whether response can be sent.
+    # @returns (bool) False while service waits before responding.
+    #
+    def response_ready(self):
+        return True
+
+    ## Function called once before sending HTTP content.
+    # @returns (iterable) pieces of HTTP response by service, usually a
+    # generator, which is iterated as the socket takes them.
     #
     def response(self):
-        result = self._request_context.get("response")
-        if result is not None:
-            del self._request_context["response"]
-        return result
+        yield self._request_context["response"]
+
+    ## File of response.
+    # @returns (int) file descriptor whose content is the response, which
+    # is sent without copying it when system supports it, None to send
+    # @ref response() instead.
+    #
+    def response_file(self):
+        return None
 
     ## Function called before termination.
+    # Also called if socket is closed during request.
+    #
     def before_terminate(self):
         pass
 
@@ -80,4 +95,23 @@ class BaseService(object):
     def wanted_headers(self):
         return {
             constants.CONTENT_LENGTH,
+            constants.CONNECTION,
         }
+
+
+## Error Service.
+# Responds with the error of a request which failed before it was read
+# completely. The rest of the request is read and its content is
+# discarded, so the connection can serve the next request.
+#
+class ErrorService(BaseService):
+
+    ## Service name
+    NAME = "/error"
+
+    ## Discard content recieved so far.
+    # @returns (bool) False, content is never handled.
+    #
+    def handle_content(self):
+        self._request_context["content"] = ""
+        return False
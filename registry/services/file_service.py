@@ -8,6 +8,7 @@
 import os
 
 from common import constants
+from common.utilities import cache_util
 from common.utilities import http_util
 from registry.services import base_service
 
@@ -21,17 +22,33 @@ class FileService(base_service.BaseService):
     ## Service name
     NAME = "/"
 
+    ## Serves every path which no other service serves.
+    PREFIX = True
+
+    ## Constructor.
+    # @param request_context (dict) request context.
+    #
+    def __init__(
+        self,
+        request_context,
+    ):
+        super(FileService, self).__init__(request_context)
+
+        ## Cached asset of file, None if file is sent from disk.
+        self._asset = None
+
     ## Function called before receiving HTTP headers.
-    # Opens requested file and add needed headers.
+    # Get cached asset of requested file, open it instead if it is too
+    # large to cache, and add needed headers.
     #
     def before_request_headers(self):
         try:
-            file_name = os.path.normpath(
-                '%s%s' % (
-                    self._request_context["app_context"]["base"],
-                    os.path.normpath(self._request_context["uri"]),
-                )
-            )
+            file_name = self._file_name()
+            self._asset = self._request_context[
+                "app_context"
+            ]["assets"].get(file_name)
+            if self._asset is not None:
+                return
             fd = os.open(file_name, os.O_RDONLY)
             self._request_context[
                 "response_headers"
@@ -52,16 +69,62 @@ class FileService(base_service.BaseService):
                 message=str(e),
             )
 
-    ## Function called during sending HTTP content.
-    # @returns (str) Content of file.
+    ## Requested file.
+    # @returns (str) path of file under base directory.
     #
-    def response(self):
-        data = os.read(
-            self._request_context["fd"],
-            self._request_context[
-                "app_context"
-            ]["max_buffer_size"] - len(self._request_context["response"]),
+    def _file_name(self):
+        return os.path.normpath(
+            '%s%s' % (
+                self._request_context["app_context"]["base"],
+                os.path.normpath(self._request_context["uri"]),
+            )
         )
-        if not data:
-            return None
-        return data
+
+    ## Function called before sending HTTP status.
+    # Set response of cached asset, see
+    # @ref common.utilities.cache_util.set_response().
+    #
+    def before_response_status(self):
+        if self._asset is not None:
+            cache_util.set_response(self._request_context, self._asset)
+
+    ## Function called once before sending HTTP content.
+    # @returns (generator) content of cached asset, or of file by
+    # max_buffer_size pieces.
+    #
+    def response(self):
+        if self._asset is not None:
+            for content in super(FileService, self).response():
+                yield content
+            return
+        while True:
+            data = os.read(
+                self._request_context["fd"],
+                self._request_context["app_context"]["max_buffer_size"],
+            )
+            if not data:
+                return
+            yield data
+
+    ## File of response.
+    # @returns (int) file descriptor of opened file, None if cached.
+    #
+    def response_file(self):
+        return self._request_context.get("fd")
+
+    ## Function called before termination.
+    # Close opened file.
+    #
+    def before_terminate(self):
+        fd = self._request_context.pop("fd", None)
+        if fd is not None:
+            os.close(fd)
+
+    ## Wanted headers dictionary.
+    # @returns (dict) dictionary of wanted headers to parse.
+    #
+    def wanted_headers(self):
+        return super(FileService, self).wanted_headers() | {
+            constants.IF_NONE_MATCH,
+            constants.ACCEPT_ENCODING,
+        }
@@ -0,0 +1,88 @@
+#!/usr/bin/python
+## @package onion_routing.registry.services.heartbeat_service
+# Service for keeping registered nodes alive.
+## @file heartbeat_service.py
+# Implementation of @ref onion_routing.registry.services.heartbeat_service
+#
+
+import time
+import urlparse
+
+from common import constants
+from common.utilities import directory_util
+from common.utilities import http_util
+from registry.services import base_service
+
+
+## Heartbeat Service.
+# Registered nodes send a heartbeat every NODE_HEARTBEAT_INTERVAL seconds.
+# A node which sends no heartbeat for NODE_EXPIRY_TIMEOUT seconds, because
+# it crashed or lost its connection, is removed from registry by the
+# expiry wheel in app_context.
+# Heartbeats carry the load of node, the number of connections it serves,
+# which is published in the directory once it moved by a step, see
+# @ref publish_load().
+#
+class HeartbeatService(base_service.BaseService):
+
+    ## Service name
+    NAME = "/heartbeat"
+
+    ## Function called before sending HTTP headers.
+    # Postpone expiry of node and publish its load.
+    # If node is not registered, it expired or registry was restarted,
+    # respond 404 so node registers again.
+    #
+    def before_response_headers(self):
+        app_context = self._request_context["app_context"]
+        try:
+            qs = urlparse.parse_qs(self._request_context["parse"].query)
+            name = "%s:%s" % (qs["address"][0], int(qs["port"][0]))
+            load = int(qs.get("load", [0])[0])
+        except Exception as e:
+            raise http_util.HTTPError(
+                code=500,
+                status="Internal Error",
+                message="fail: " + str(e),
+            )
+        if name not in app_context["registry"]:
+            raise http_util.HTTPError(
+                code=404,
+                status="Not Found",
+                message="node not registered",
+            )
+
+        app_context["expiry"].add(name, constants.NODE_EXPIRY_TIMEOUT)
+        app_context["nodes"][name]["expires"] = (
+            time.time() + constants.NODE_EXPIRY_TIMEOUT
+        )
+        publish_load(app_context, name, load)
+        self._request_context["response"] = "alive"
+
+        super(HeartbeatService, self).before_response_headers()
+
+
+## Publish load of node.
+# @param app_context (dict) application context.
+# @param name (str) name of registered node.
+# @param load (int) load of node.
+#
+# Every change of directory wakes all /nodes requests which wait for
+# changes and takes a place in the log of directory diffs, so load is
+# recorded only once it differs from the published load by a step,
+# capacity / NODE_LOAD_STEPS connections and at least one. Published
+# load is never more than a step away from the load of node.
+#
+def publish_load(
+    app_context,
+    name,
+    load,
+):
+    node = app_context["registry"][name]
+    step = max(node["capacity"] // constants.NODE_LOAD_STEPS, 1)
+    if abs(load - node["load"]) >= step:
+        node["load"] = load
+        directory_util.record_change(
+            app_context["directory"],
+            name,
+        )
@@ -5,6 +5,10 @@
 # Implementation of @ref onion_routing.registry.services.nodes_service
 #
 
+import urlparse
+
+from common import constants
+from common.utilities import directory_util
 from common.utilities import http_util
 from registry.services import base_service
 
@@ -17,14 +21,45 @@ class NodesService(base_service.BaseService):
     ## Service name.
     NAME = "/nodes"
 
-    ## Function called before sending HTTP headers.
-    # Send string representation of registry.
+    ## Constructor.
+    # @param request_context (dict) request context.
     #
-    def before_response_headers(self):
+    def __init__(
+        self,
+        request_context,
+    ):
+        super(NodesService, self).__init__(request_context)
+
+        ## Version of directory client has, None if it has none.
+        self._since = None
+
+        ## Timer ending wait for changes, None if not waiting.
+        self._timer = None
+
+        ## Pieces of directory, None if response has no content.
+        self._content = None
+
+    ## Function called before sending HTTP status.
+    # Send registry as json directory of
+    # @ref common.utilities.directory_util.
+    # If client sends the epoch and version of the directory it has:
+    # - Same version: send 304 without content.
+    # - Changes since version are in log: send only the changes.
+    # - Otherwise: send all nodes.
+    #
+    # If client has the current version and asks to wait, the response is
+    # held until registry changes or DIRECTORY_WAIT_TIMEOUT passes.
+    #
+    def before_response_status(self):
+        app_context = self._request_context["app_context"]
+        directory = app_context["directory"]
         try:
-            self._request_context["response"] = str(
-                self._request_context["app_context"]["registry"],
-            )
+            qs = urlparse.parse_qs(self._request_context["parse"].query)
+            if (
+                "since" in qs and
+                int(qs["epoch"][0]) == directory["epoch"]
+            ):
+                self._since = int(qs["since"][0])
         except Exception as e:
             raise http_util.HTTPError(
                 code=500,
@@ -32,4 +67,80 @@ class NodesService(base_service.BaseService):
                 message="fail: " + str(e),
             )
 
-        super(NodesService, self).before_response_headers()
+        if self._since == directory["version"] and "wait" in qs:
+            directory["waiters"].add(self._wake)
+            self._timer = app_context["timers"].add(
+                constants.DIRECTORY_WAIT_TIMEOUT,
+                self._wake,
+            )
+        else:
+            self._respond()
+
+        super(NodesService, self).before_response_status()
+
+    ## Put directory in response.
+    # Directory is streamed by pieces of
+    # @ref common.utilities.directory_util.iter_encode().
+    #
+    def _respond(self):
+        directory = self._request_context["app_context"]["directory"]
+        if self._since == directory["version"]:
+            self._request_context["code"] = 304
+            self._request_context["status"] = "Not Modified"
+            self._request_context["response"] = ""
+        else:
+            self._content = directory_util.iter_encode(
+                self._request_context["app_context"]["registry"],
+                directory,
+                None if self._since is None else directory_util.changes(
+                    directory,
+                    self._since,
+                ),
+            )
+            self._request_context["response_headers"][
+                constants.CONTENT_TYPE
+            ] = "application/json"
+
+    ## Function called before sending HTTP headers.
+    # Content-Length is set only for response without content, directory
+    # is sent chunked.
+    #
+    def before_response_headers(self):
+        if self._content is None:
+            super(NodesService, self).before_response_headers()
+
+    ## Function called once before sending HTTP content.
+    # @returns (iterable) pieces of directory.
+    #
+    def response(self):
+        if self._content is None:
+            return super(NodesService, self).response()
+        return self._content
+
+    ## Stop waiting for changes.
+    def _stop_waiting(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        self._request_context["app_context"]["directory"][
+            "waiters"
+        ].discard(self._wake)
+
+    ## Registry changed or wait timed out, respond.
+    def _wake(self):
+        self._stop_waiting()
+        self._respond()
+        self._request_context["socket"].mark_dirty()
+
+    ## Whether response can be sent.
+    # @returns (bool) False while waiting for changes.
+    #
+    def response_ready(self):
+        return self._timer is None
+
+    ## Function called before termination.
+    # Stop waiting if client disconnected.
+    #
+    def before_terminate(self):
+        self._stop_waiting()
+        super(NodesService, self).before_terminate()
@@ -6,8 +6,11 @@
 #
 
 import logging
+import time
 import urlparse
 
+from common import constants
+from common.utilities import directory_util
 from common.utilities import http_util
 from registry.services import base_service
 
@@ -33,9 +36,14 @@ class RegisterService(base_service.BaseService):
                 qs["address"][0],
                 qs["port"][0],
                 int(qs["key"][0]),
+                int(qs.get(
+                    "capacity",
+                    [constants.DEFAULT_CONNECTIONS_NUMBER],
+                )[0]),
             )
 
             self._request_context["response"] = "success"
+            self._request_context["persistent"] = True
         except Exception as e:
             raise http_util.HTTPError(
                 code=500,
@@ -46,34 +54,50 @@ class RegisterService(base_service.BaseService):
         super(RegisterService, self).before_response_headers()
 
     ## Register node.
-    # If node with the same port exists -> return fail message.
-    # Add the address, port and key of node to registry.
+    # Add the address, port, key and capacity of node to registry, by
+    # name "address:port". A node which registers again, after it was
+    # restarted or after registry forgot it, replaces its old entry.
+    # Load, the number of connections node serves, is 0 until its first
+    # heartbeat.
+    # Capacity is the number of connections node accepts, default
+    # DEFAULT_CONNECTIONS_NUMBER for nodes which do not send it.
+    # Record the change for directory diffs.
+    # Node expires unless it sends heartbeats, see
+    # @ref registry.services.heartbeat_service.
     #
     def _register(
         self,
         address,
         port,
         key,
+        capacity,
     ):
-        if port in self._request_context["app_context"]["registry"]:
-            logging.info(
-                "failed to add node %s:%s" % (
-                    address,
-                    port,
-                )
-            )
-            raise RuntimeError("Node with the same address already registered.")
-        self._request_context["app_context"]["registry"][address] = {
-            "name": address,
+        app_context = self._request_context["app_context"]
+        name = "%s:%s" % (address, int(port))
+        if name in app_context["registry"]:
+            logging.info("node %s registered again" % name)
+        app_context["registry"][name] = {
+            "name": name,
             "address": address,
             "port": int(port),
             "key": key,
+            "capacity": capacity,
+            "load": 0,
         }
+        directory_util.record_change(
+            app_context["directory"],
+            name,
+        )
         logging.info(
             "New node added: address %s, port %s" % (
                 address,
                 port,
             )
         )
-        self._request_context["app_context"]["nodes"][address] = port
-        self._request_context["app_context"]["xml"].update()
+        app_context["expiry"].add(name, constants.NODE_EXPIRY_TIMEOUT)
+        app_context["nodes"][name] = {
+            "address": address,
+            "port": int(port),
+            "expires": time.time() + constants.NODE_EXPIRY_TIMEOUT,
+        }
+        app_context["xml"].update()
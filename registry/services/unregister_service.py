@@ -8,6 +8,7 @@
 import logging
 import urlparse
 
+from common.utilities import directory_util
 from registry.services import base_service
 
 
@@ -32,8 +33,9 @@ class UnregisterService(base_service.BaseService):
     def before_response_headers(self):
         qs = urlparse.parse_qs(self._request_context["parse"].query)
 
-        self._unregister(
-            qs["port"][0],
+        unregister(
+            self._request_context["app_context"],
+            "%s:%s" % (qs["address"][0], qs["port"][0]),
         )
         self._request_context["response"] = "unregistered"
 
@@ -46,22 +48,33 @@ class UnregisterService(base_service.BaseService):
 
         super(UnregisterService, self).before_response_headers()
 
-    ## Unregister node.
-    # Check whether node is in the registry and remove it if it is.
-    #
-    def _unregister(
-        self,
-        name,
-    ):
-        logging.info(
-            "unregistring %s" % (
-                name,
-            )
+
+## Unregister node.
+# @param app_context (dict) application context of registry.
+# @param name (str) name of node, "address:port".
+#
+# Check whether node is in the registry and remove it if it is.
+# Record the change for directory diffs.
+# Used both for unregister requests and for nodes which expired.
+#
+def unregister(
+    app_context,
+    name,
+):
+    logging.info(
+        "unregistring %s" % (
+            name,
+        )
+    )
+    app_context["expiry"].remove(name)
+    if name in app_context["registry"]:
+        del app_context["registry"][name]
+        directory_util.record_change(
+            app_context["directory"],
+            name,
         )
-        if name in self._request_context["app_context"]["registry"]:
-            del self._request_context["app_context"]["registry"][name]
 
-            del self._request_context["app_context"]["nodes"][name]
-            self._request_context["app_context"]["xml"].update()
-        else:
-            logging.info("node was not in registry...")
+        del app_context["nodes"][name]
+        app_context["xml"].update()
+    else:
+        logging.info("node was not in registry...")
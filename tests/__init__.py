@@ -0,0 +1,3 @@
+## @package onion_routing.tests Tests.
+# Run with python -m unittest discover -s tests.
+#
@@ -0,0 +1,233 @@
+#!/usr/bin/python
+## @package onion_routing.tests.test_async_server
+# Tests of poller registrations kept by the async server.
+## @file test_async_server.py
+# Implementation of @ref onion_routing.tests.test_async_server
+#
+
+import select
+import socket
+import threading
+import unittest
+
+from common import constants
+from common.async import async_server
+from common.async import event_object
+from common.pollables import listener_socket
+from common.pollables import tcp_socket
+from common.utilities import path_util
+from common.utilities import socks5_util
+from entry.pollables import socks5_client
+from entry.pollables import socks5_stream
+from onion.pollables import onion_node
+
+
+## Number of onion nodes in path.
+HOPS = 3
+
+## Browser connections relayed.
+CONNECTIONS = 4
+
+## Bytes echoed on every connection.
+DATA_SIZE = 256 * 1024
+
+## Bytes sent at once by browser, before their echo is read.
+CHUNK_SIZE = 16 * 1024
+
+## Secret key of nodes.
+KEY = 7
+
+
+## Server which checks its poller after every update.
+#
+# Registration of every socket must be what a full recompute of all
+# sockets would register, so no socket changed without being marked
+# dirty.
+#
+class CheckedServer(async_server.AsyncServer):
+
+    ## Constructor.
+    # @param app_context (dict) application_context.
+    #
+    def __init__(
+        self,
+        app_context,
+    ):
+        super(CheckedServer, self).__init__(app_context)
+
+        ## Sockets whose registration differed from full recompute.
+        self.mismatches = []
+
+    ## Update poller and compare it with full recompute.
+    def _update_poller(self):
+        super(CheckedServer, self)._update_poller()
+        for entry in self._socket_data.values():
+            if entry.is_closing():
+                self.mismatches.append("%s not removed" % entry)
+            elif entry.get_events() != self._registered_events.get(entry):
+                self.mismatches.append(
+                    "%s registered %s, events %s" % (
+                        entry,
+                        self._registered_events.get(entry),
+                        entry.get_events(),
+                    )
+                )
+
+
+## Entry of tests.
+#
+# Builds a new circuit through the path in app_context for every browser
+# connection and carries the connection as its stream.
+#
+class Entry(listener_socket.Listener):
+
+    ## On read event.
+    # Accept browser connection, create circuit and stream.
+    #
+    def on_read(self):
+        client, addr = self._socket.accept()
+        circuit = socks5_client.Socks5Client(
+            socket=socket.socket(socket.AF_INET, socket.SOCK_STREAM),
+            state=constants.ACTIVE,
+            app_context=self._app_context,
+            path=self._app_context["path"],
+        )
+        self._app_context["add_socket"](circuit)
+        self._app_context["add_socket"](
+            socks5_stream.Socks5Stream(
+                socket=client,
+                state=constants.ACTIVE,
+                app_context=self._app_context,
+                circuit=circuit,
+            )
+        )
+
+
+## Recieve exactly size bytes.
+# @param s (socket) socket.
+# @param size (int) number of bytes.
+# @returns (str) data.
+#
+def recv_all(
+    s,
+    size,
+):
+    data = ""
+    while len(data) < size:
+        chunk = s.recv(size - len(data))
+        if not chunk:
+            raise RuntimeError("connection closed")
+        data += chunk
+    return data
+
+
+## Async Server poller tests.
+@unittest.skipUnless(hasattr(select, "epoll"), "epoll is not supported")
+class AsyncServerPollerTest(unittest.TestCase):
+
+    ## Entry, onion nodes and an echo destination in one server.
+    def setUp(self):
+        self.app_context = {
+            "poll_object": event_object.EpollEvent,
+            "timeout": 100,
+            "max_connections": 16,
+            "max_buffer_size": 4096,
+            "key": KEY,
+            "loads": [0],
+            "worker": 0,
+            "register": False,
+            "optimistic_data": False,
+            "connections": {},
+            "path_selector": path_util.PathSelector(),
+            "path": {},
+        }
+        self.server = CheckedServer(self.app_context)
+        for i in range(HOPS):
+            node = self.server.add_listener(
+                onion_node.OnionNode,
+                "127.0.0.1",
+                0,
+            )
+            port = node.socket.getsockname()[1]
+            self.app_context["path"][str(i + 1)] = {
+                "name": "127.0.0.1:%d" % port,
+                "address": "127.0.0.1",
+                "port": port,
+                "key": KEY,
+            }
+        self.destination = self.server.add_listener(
+            listener_socket.Listener,
+            "127.0.0.1",
+            0,
+            listener_type=tcp_socket.TCPSocket,
+        ).socket.getsockname()
+        self.entry = self.server.add_listener(
+            Entry,
+            "127.0.0.1",
+            0,
+        ).socket.getsockname()
+        self.thread = threading.Thread(target=self.server.run)
+        self.thread.start()
+
+    ## Stop server.
+    def tearDown(self):
+        self.server.close_server()
+        self.thread.join()
+
+    ## Connect browser to destination through the path.
+    # @returns (socket) connection of browser.
+    #
+    def connect(self):
+        s = socket.create_connection(self.entry)
+        s.settimeout(5)
+        s.sendall(
+            socks5_util.GreetingRequest.encode(
+                {
+                    "version": constants.SOCKS5_VERSION,
+                    "number_methods": 1,
+                    "methods": [constants.NO_AUTH],
+                },
+            ) + socks5_util.Socks5Request.encode(
+                {
+                    "version": constants.SOCKS5_VERSION,
+                    "command": constants.CONNECT,
+                    "reserved": constants.SOCKS5_RESERVED,
+                    "address_type": constants.IP_4,
+                    "address": self.destination[0],
+                    "port": self.destination[1],
+                },
+            )
+        )
+        recv_all(s, 2)
+        self.assertEqual(
+            socks5_util.Socks5Response.decode(recv_all(s, 10))["reply"],
+            constants.SUCCESS,
+        )
+        return s
+
+    ## Registrations match full recompute while data is relayed with full
+    # buffers and connections are closed by either side.
+    #
+    def test_relay_matches_full_recompute(self):
+        clients = [self.connect() for i in range(CONNECTIONS)]
+        for i in range(DATA_SIZE // CHUNK_SIZE):
+            data = chr(ord("a") + i % 26) * CHUNK_SIZE
+            for s in clients:
+                s.sendall(data)
+                self.assertEqual(recv_all(s, CHUNK_SIZE), data)
+        for s in clients:
+            s.close()
+
+        s = self.connect()
+        s.sendall("x" * CHUNK_SIZE)
+        recv_all(s, CHUNK_SIZE)
+        self.server.close_server()
+        self.assertEqual(s.recv(1), "")
+        s.close()
+        self.thread.join()
+
+        self.assertEqual(self.server.mismatches, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/python
+## @package onion_routing.tests.test_dns_resolver
+# Tests of closing the resolver while threads resolve.
+## @file test_dns_resolver.py
+# Implementation of @ref onion_routing.tests.test_dns_resolver
+#
+
+import os
+import threading
+import unittest
+
+from common.pollables import dns_resolver
+
+
+## Dns Resolver close tests.
+class DnsResolverCloseTest(unittest.TestCase):
+
+    ## Replace name resolution with one that waits for @ref release.
+    def setUp(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.gethostbyname = dns_resolver.socket.gethostbyname
+
+        def gethostbyname(name):
+            self.started.set()
+            self.release.wait()
+            return "127.0.0.1"
+
+        dns_resolver.socket.gethostbyname = gethostbyname
+
+    ## Restore name resolution.
+    def tearDown(self):
+        self.release.set()
+        dns_resolver.socket.gethostbyname = self.gethostbyname
+
+    ## Create resolver.
+    # @returns (tuple) resolver and its threads.
+    #
+    def create(
+        self,
+        threads,
+    ):
+        before = set(threading.enumerate())
+        resolver = dns_resolver.DnsResolver(
+            {"dirty_sockets": set()},
+            threads=threads,
+        )
+        return resolver, set(threading.enumerate()) - before
+
+    ## Thread which resolves while resolver closes does not write to pipe.
+    def test_close_while_resolving(self):
+        resolver, threads = self.create(1)
+        resolver.resolve("example.com", lambda address: None)
+        self.assertTrue(self.started.wait(5))
+        resolver.close()
+
+        # A new pipe gets the fds of the closed one.
+        read_fd, write_fd = os.pipe()
+        try:
+            self.release.set()
+            for thread in threads:
+                thread.join(5)
+                self.assertFalse(thread.is_alive())
+            os.close(write_fd)
+            self.assertEqual(os.read(read_fd, 1), "")
+        finally:
+            os.close(read_fd)
+
+    ## Idle threads exit once resolver closes.
+    def test_close_idle(self):
+        resolver, threads = self.create(4)
+        resolver.close()
+        for thread in threads:
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+#!/usr/bin/python
+## @package onion_routing.tests.test_entry_node
+# Tests of building circuits of the configured number of hops.
+## @file test_entry_node.py
+# Implementation of @ref onion_routing.tests.test_entry_node
+#
+
+import socket
+import time
+import unittest
+
+from common import constants
+from common.async import timer_queue
+from common.utilities import path_util
+from entry.pollables import entry_node
+
+
+## Number of nodes in path in tests.
+HOPS = 3
+
+
+## Resolver which knows every address.
+class Resolver(object):
+
+    ## Resolved address.
+    # @param address (str) address.
+    # @returns (str) the address.
+    #
+    def lookup(
+        self,
+        address,
+    ):
+        return address
+
+
+## Free port of loopback.
+# @returns (int) port.
+#
+def free_port():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+## Entry Node path length tests.
+#
+# Registry and onion nodes do not run, sockets connecting to them are
+# created but never polled.
+#
+class EntryNodeHopsTest(unittest.TestCase):
+
+    ## Entry node with a registry of HOPS - 1 nodes.
+    def setUp(self):
+        self.sockets = []
+        self.app_context = {
+            "timers": timer_queue.TimerQueue(),
+            "max_connections": 16,
+            "max_buffer_size": 1024,
+            "circuit_pool_size": 0,
+            "hops": HOPS,
+            "allow_short_paths": False,
+            "optimistic_data": True,
+            "registry": {},
+            "registry_version": None,
+            "path_selector": path_util.PathSelector(),
+            "resolver": Resolver(),
+            "connections": {},
+            "dirty_sockets": set(),
+            "add_socket": self.sockets.append,
+            "http_address": "127.0.0.1",
+            "http_port": free_port(),
+        }
+        for i in range(HOPS - 1):
+            self.add_node()
+        self.node = entry_node.EntryNode("127.0.0.1", 0, self.app_context)
+        self.clients = []
+
+    ## Close entry node and every socket.
+    def tearDown(self):
+        self.node.close()
+        for s in self.sockets + [self.node.http_client] + self.clients:
+            s.close()
+
+    ## Register another node.
+    def add_node(self):
+        name = "127.0.0.1:%d" % (9000 + len(self.app_context["registry"]))
+        self.app_context["registry"][name] = {
+            "name": name,
+            "address": "127.0.0.1",
+            "port": free_port(),
+            "key": 1,
+            "capacity": 100,
+            "load": 0,
+        }
+        self.app_context["registry_version"] = (
+            0,
+            len(self.app_context["registry"]),
+        )
+
+    ## Connect browser to entry node and let it accept.
+    def connect(self):
+        client = socket.create_connection(self.node.socket.getsockname())
+        self.clients.append(client)
+        time.sleep(0.1)
+        self.node.on_read()
+
+    ## Streams added by entry node.
+    def streams(self):
+        return [s for s in self.sockets if s.__class__.__name__ == (
+            "Socks5Stream"
+        )]
+
+    ## Path shorter than hops is refused.
+    def test_short_path_refused(self):
+        self.assertRaises(RuntimeError, self.node._create_path)
+
+    ## Path shorter than hops is built when allowed.
+    def test_short_path_allowed(self):
+        self.app_context["allow_short_paths"] = True
+        self.assertEqual(len(self.node._create_path()), HOPS - 1)
+
+    ## Path has hops nodes once there are enough.
+    def test_full_path(self):
+        self.add_node()
+        self.assertEqual(len(self.node._create_path()), HOPS)
+
+    ## Browser connection waits until a path of hops nodes can be built.
+    def test_pending_connection(self):
+        self.connect()
+        self.assertEqual(self.streams(), [])
+        self.assertEqual(len(self.node._pending), 1)
+
+        self.add_node()
+        self.node._serve_pending()
+        self.assertEqual(len(self.streams()), 1)
+        self.assertEqual(len(self.node._pending), 0)
+        self.assertEqual(len(self.node._circuits[0].nodes), HOPS)
+
+    ## Browser connection which waited too long is closed.
+    def test_pending_timeout(self):
+        self.connect()
+        client, accept_time = self.node._pending[0]
+        self.node._pending[0] = (
+            client,
+            accept_time - constants.CIRCUIT_PENDING_TIMEOUT - 1,
+        )
+        self.node._serve_pending()
+        self.assertEqual(len(self.node._pending), 0)
+        self.assertEqual(self.clients[0].recv(1), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,212 @@
+#!/usr/bin/python
+## @package onion_routing.tests.test_heartbeat_service
+# Tests of heartbeats of nodes.
+## @file test_heartbeat_service.py
+# Implementation of @ref onion_routing.tests.test_heartbeat_service
+#
+
+import unittest
+import urlparse
+
+from common import constants
+from common.async import timer_wheel
+from common.utilities import directory_util
+from common.utilities import http_util
+from registry.services import heartbeat_service
+from registry.services import register_service
+from registry.services import unregister_service
+from tests import test_timer_wheel
+
+
+## Name of node in tests.
+NAME = "127.0.0.1:9000"
+
+## Name of second node in tests.
+OTHER_NAME = "127.0.0.1:9001"
+
+
+## Xml file of registry which is never written.
+class XmlHandler(object):
+
+    ## Write file.
+    def update(self):
+        pass
+
+
+## Publish load tests.
+class PublishLoadTest(unittest.TestCase):
+
+    ## Registry with one node of capacity 100.
+    def setUp(self):
+        self.app_context = {
+            "registry": {
+                NAME: {
+                    "name": NAME,
+                    "capacity": 100,
+                    "load": 0,
+                },
+            },
+            "directory": directory_util.create_directory(),
+        }
+        self.woken = []
+        self.app_context["directory"]["waiters"].add(
+            lambda: self.woken.append(True),
+        )
+
+    ## Publish load and return published load.
+    def publish(
+        self,
+        load,
+    ):
+        heartbeat_service.publish_load(self.app_context, NAME, load)
+        return self.app_context["registry"][NAME]["load"]
+
+    ## Load within a step is not recorded and wakes nobody.
+    def test_small_change(self):
+        for load in (1, 5, 9, 0, 3):
+            self.assertEqual(self.publish(load), 0)
+        self.assertEqual(self.app_context["directory"]["version"], 0)
+        self.assertEqual(self.woken, [])
+
+    ## Load a step away is recorded once.
+    def test_step_change(self):
+        self.assertEqual(self.publish(10), 10)
+        self.assertEqual(self.publish(15), 10)
+        self.assertEqual(self.publish(0), 0)
+        self.assertEqual(self.app_context["directory"]["version"], 2)
+        self.assertEqual(self.woken, [True])
+
+    ## Step is at least one connection.
+    def test_small_capacity(self):
+        self.app_context["registry"][NAME]["capacity"] = 3
+        self.assertEqual(self.publish(1), 1)
+        self.assertEqual(self.publish(1), 1)
+        self.assertEqual(self.app_context["directory"]["version"], 1)
+
+
+## Node expiry tests.
+#
+# Nodes register and send heartbeats through the services, the expiry
+# wheel reads time from a @ref tests.test_timer_wheel.Clock which the
+# tests move.
+#
+class ExpiryTest(unittest.TestCase):
+
+    ## Registry with an expiry wheel which unregisters expired nodes.
+    def setUp(self):
+        self.clock = test_timer_wheel.Clock()
+        self._time = timer_wheel.time
+        timer_wheel.time = self.clock
+        self.app_context = {
+            "registry": {},
+            "nodes": {},
+            "directory": directory_util.create_directory(),
+            "xml": XmlHandler(),
+        }
+        self.app_context["expiry"] = timer_wheel.TimerWheel(
+            constants.NODE_EXPIRY_TICK,
+            constants.NODE_EXPIRY_TIMEOUT,
+            lambda name: unregister_service.unregister(
+                self.app_context,
+                name,
+            ),
+        )
+
+    ## Restore time of wheel module.
+    def tearDown(self):
+        timer_wheel.time = self._time
+
+    ## Request service of node.
+    # @param service (class) service class.
+    # @param name (str) name of node.
+    #
+    def request(
+        self,
+        service,
+        name,
+    ):
+        address, port = name.split(":")
+        request_context = {
+            "app_context": self.app_context,
+            "parse": urlparse.urlparse(
+                "%s?address=%s&port=%s&key=1&load=0" % (
+                    service.NAME,
+                    address,
+                    port,
+                ),
+            ),
+            "response": "",
+            "response_headers": {},
+        }
+        service(request_context).before_response_headers()
+
+    ## Move clock by a heartbeat interval, nodes send heartbeats.
+    # @param alive (list) names of nodes which send heartbeats.
+    #
+    def heartbeat_interval(
+        self,
+        alive,
+    ):
+        self.clock.now += constants.NODE_HEARTBEAT_INTERVAL
+        self.app_context["expiry"].advance()
+        for name in alive:
+            self.request(heartbeat_service.HeartbeatService, name)
+
+    ## Crashed node is removed after expiry timeout, live node is kept.
+    def test_crashed_node_expires(self):
+        for name in (NAME, OTHER_NAME):
+            self.request(register_service.RegisterService, name)
+
+        intervals = (
+            constants.NODE_EXPIRY_TIMEOUT +
+            constants.NODE_EXPIRY_TICK
+        ) // constants.NODE_HEARTBEAT_INTERVAL + 1
+        for i in range(intervals):
+            self.heartbeat_interval([NAME])
+
+        self.assertEqual(self.app_context["registry"].keys(), [NAME])
+        self.assertEqual(self.app_context["nodes"].keys(), [NAME])
+        self.assertNotIn(OTHER_NAME, self.app_context["expiry"])
+        version = self.app_context["directory"]["version"]
+        self.assertEqual(
+            directory_util.changes(self.app_context["directory"], version - 1),
+            set([OTHER_NAME]),
+        )
+
+    ## Node is kept while it sends heartbeats, and expires once it stops.
+    def test_node_kept_alive(self):
+        self.request(register_service.RegisterService, NAME)
+        for i in range(10):
+            self.heartbeat_interval([NAME])
+        self.assertIn(NAME, self.app_context["registry"])
+
+        self.clock.now += (
+            constants.NODE_EXPIRY_TIMEOUT +
+            constants.NODE_EXPIRY_TICK
+        )
+        self.app_context["expiry"].advance()
+        self.assertNotIn(NAME, self.app_context["registry"])
+        self.assertEqual(len(self.app_context["expiry"]), 0)
+
+    ## Heartbeat of expired node is refused so it registers again.
+    def test_heartbeat_after_expiry(self):
+        self.request(register_service.RegisterService, NAME)
+        self.clock.now += (
+            constants.NODE_EXPIRY_TIMEOUT +
+            constants.NODE_EXPIRY_TICK
+        )
+        self.app_context["expiry"].advance()
+        with self.assertRaises(http_util.HTTPError) as e:
+            self.request(heartbeat_service.HeartbeatService, NAME)
+        self.assertEqual(e.exception.code, 404)
+
+    ## Unregistered node is removed from the wheel.
+    def test_unregister(self):
+        self.request(register_service.RegisterService, NAME)
+        self.request(unregister_service.UnregisterService, NAME)
+        self.assertNotIn(NAME, self.app_context["expiry"])
+        self.assertNotIn(NAME, self.app_context["registry"])
+
+
+if __name__ == "__main__":
+    unittest.main()
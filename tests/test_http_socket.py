@@ -0,0 +1,130 @@
+#!/usr/bin/python
+## @package onion_routing.tests.test_http_socket
+# Tests of errors of requests recieved by the registry.
+## @file test_http_socket.py
+# Implementation of @ref onion_routing.tests.test_http_socket
+#
+
+import socket
+import unittest
+
+from common import constants
+from common.async import event_object
+from common.async import timer_queue
+from common.utilities import buffer_util
+from common.utilities import http_util
+from common.utilities import router_util
+from registry.pollables import http_socket
+from registry.services import base_service
+
+
+## Service which answers pong.
+class PingService(base_service.BaseService):
+
+    ## Service name
+    NAME = "/ping"
+
+    ## Set response.
+    def before_response_status(self):
+        self._request_context["response"] = "pong"
+
+
+## Http Socket error tests.
+@unittest.skipUnless(hasattr(socket, "socketpair"), "no socketpair")
+class HttpSocketErrorTest(unittest.TestCase):
+
+    ## Http socket on one end of a socket pair.
+    def setUp(self):
+        self.client, s = socket.socketpair()
+        self.client.settimeout(1)
+        self.http = http_socket.HttpSocket(
+            s,
+            constants.ACTIVE,
+            {
+                "timers": timer_queue.TimerQueue(),
+                "router": router_util.Router([PingService]),
+                "max_buffer_size": 1024,
+                "dirty_sockets": set(),
+            },
+        )
+
+    ## Close both ends.
+    def tearDown(self):
+        self.http.close()
+        self.client.close()
+
+    ## Send requests and let socket respond.
+    # @param requests (str) requests.
+    #
+    def request(
+        self,
+        requests,
+    ):
+        self.client.sendall(requests)
+        self.http.on_read()
+        while self.http.get_events() & event_object.BaseEvent.POLLOUT:
+            self.http.on_write()
+
+    ## Recieve responses until count were recieved or nothing arrives.
+    # @param count (int) number of responses.
+    # @returns (list) tuples of status code, headers and content.
+    #
+    def responses(
+        self,
+        count,
+    ):
+        buffer = buffer_util.Buffer()
+        parser = http_util.HttpParser()
+        responses = []
+        content = ""
+        while len(responses) < count:
+            if (
+                parser.recv_first_line(buffer) is not None and
+                parser.recv_headers(buffer, set([constants.CONNECTION]))
+            ):
+                content += parser.recv_content(buffer)
+                if parser.state == constants.PARSE_DONE:
+                    responses.append(
+                        (int(parser.first_line[1]), parser.headers, content),
+                    )
+                    parser.reset()
+                    content = ""
+                    continue
+            try:
+                if not buffer.recv_into(self.client, 1024):
+                    break
+            except socket.timeout:
+                break
+        return responses
+
+    ## Request of unknown service is answered and next request on the
+    # same connection is served.
+    #
+    def test_not_found_keeps_connection(self):
+        self.request(
+            "GET /missing HTTP/1.1\r\nContent-Length: 5\r\n\r\nhello"
+            "GET /ping HTTP/1.1\r\n\r\n"
+        )
+        responses = self.responses(2)
+        self.assertEqual([r[0] for r in responses], [404, 200])
+        self.assertEqual(responses[0][1], {})
+        self.assertEqual(responses[1][2], "pong")
+        self.assertEqual(self.http.state, constants.ACTIVE)
+
+    ## Request whose end can not be found closes connection.
+    def test_bad_request_closes(self):
+        self.request(
+            "GET /ping HTTP/1.1\r\nContent-Length: x\r\n\r\n"
+            "GET /ping HTTP/1.1\r\n\r\n"
+        )
+        responses = self.responses(2)
+        self.assertEqual([r[0] for r in responses], [400])
+        self.assertEqual(
+            responses[0][1],
+            {constants.CONNECTION: "close"},
+        )
+        self.assertEqual(self.http.state, constants.CLOSING)
+
+
+if __name__ == "__main__":
+    unittest.main()
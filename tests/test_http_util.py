@@ -0,0 +1,199 @@
+#!/usr/bin/python
+## @package onion_routing.tests.test_http_util
+# Tests of the incremental HTTP parser.
+## @file test_http_util.py
+# Implementation of @ref onion_routing.tests.test_http_util
+#
+
+import random
+import unittest
+
+from common import constants
+from common.utilities import buffer_util
+from common.utilities import http_util
+
+
+## Number of random messages of fuzz test.
+FUZZ_MESSAGES = 500
+
+## Size of read buffer, default max_buffer_size of registry.
+MAX_BUFFER_SIZE = 1024
+
+
+## Parse messages from buffer.
+# @param parser (@ref common.utilities.http_util.HttpParser) parser.
+# @param buffer (@ref common.utilities.buffer_util.Buffer) recieved bytes.
+# @param messages (list) parsed messages, first line, headers and content,
+# complete messages are appended.
+# @param content (list) content of current message.
+#
+def parse(
+    parser,
+    buffer,
+    messages,
+    content,
+):
+    while True:
+        if parser.recv_first_line(buffer) is None:
+            return
+        if not parser.recv_headers(buffer, set(["Host", "X-Name"])):
+            return
+        content.append(parser.recv_content(buffer))
+        if parser.state != constants.PARSE_DONE:
+            return
+        messages.append((parser.first_line, parser.headers, "".join(content)))
+        del content[:]
+        parser.reset()
+
+
+## Random message.
+# @param rand (random.Random) random generator.
+# @returns (tuple) encoded message and expected parsed message.
+#
+def random_message(rand):
+    headers = {}
+    lines = ["GET /%d HTTP/1.1" % rand.randint(0, 1000)]
+    for i in range(rand.randint(0, 10)):
+        lines.append("X-Other-%d: %s" % (i, "v" * rand.randint(0, 20)))
+    if rand.random() < 0.5:
+        headers["Host"] = "host%d" % rand.randint(0, 9)
+        lines.append("Host:  %s" % headers["Host"])
+    if rand.random() < 0.3:
+        headers["X-Name"] = ""
+        lines.append("X-Name:")
+
+    body = "".join(
+        chr(rand.randint(0, 255)) for i in range(rand.randint(0, 300))
+    )
+    framing = rand.choice(("length", "chunked", "none"))
+    if framing == "length":
+        lines.append("Content-Length: %d" % len(body))
+        encoded = body
+    elif framing == "chunked":
+        lines.append("Transfer-Encoding: chunked")
+        encoded = ""
+        left = body
+        while left:
+            n = rand.randint(1, len(left))
+            encoded += "%x\r\n%s\r\n" % (n, left[:n])
+            left = left[n:]
+        encoded += "0\r\n\r\n"
+    else:
+        body = encoded = ""
+
+    return (
+        "\r\n".join(lines) + "\r\n\r\n" + encoded,
+        (lines[0].split(" ", 2), headers, body),
+    )
+
+
+## Http Parser tests.
+class HttpParserTest(unittest.TestCase):
+
+    ## Pipelined random messages split at random offsets.
+    def test_fuzz(self):
+        rand = random.Random(1)
+        data = ""
+        expected = []
+        for i in range(FUZZ_MESSAGES):
+            message, parsed = random_message(rand)
+            data += message
+            expected.append(parsed)
+
+        for fragment in (1, 7, 100, len(data)):
+            parser = http_util.HttpParser()
+            buffer = buffer_util.Buffer()
+            messages = []
+            content = []
+            offset = 0
+            while offset < len(data):
+                n = rand.randint(1, fragment)
+                buffer.append(data[offset:offset + n])
+                offset += n
+                parse(parser, buffer, messages, content)
+            self.assertEqual(messages, expected)
+            self.assertEqual(len(buffer), 0)
+
+    ## Message without headers.
+    def test_no_headers(self):
+        messages = []
+        buffer = buffer_util.Buffer()
+        buffer.append("GET / HTTP/1.1\r\n\r\nGET /2")
+        parse(http_util.HttpParser(), buffer, messages, [])
+        self.assertEqual(messages, [(["GET", "/", "HTTP/1.1"], {}, "")])
+        self.assertEqual(str(buffer), "GET /2")
+
+    ## Content after headers is not consumed as headers.
+    def test_content_with_empty_lines(self):
+        buffer = buffer_util.Buffer()
+        buffer.append(
+            "POST / HTTP/1.1\r\nContent-Length: 8\r\n\r\n\r\n\r\nA: b"
+        )
+        messages = []
+        parse(http_util.HttpParser(), buffer, messages, [])
+        self.assertEqual(messages[0][2], "\r\n\r\nA: b")
+
+    ## Headers larger than max are rejected before they end.
+    def test_max_header_size(self):
+        parser = http_util.HttpParser(max_header_size=100)
+        buffer = buffer_util.Buffer()
+        buffer.append("GET / HTTP/1.1\r\n")
+        parser.recv_first_line(buffer)
+        buffer.append("A: %s" % ("b" * 100))
+        with self.assertRaises(http_util.HTTPError) as e:
+            parser.recv_headers(buffer, set())
+        self.assertEqual(e.exception.code, 431)
+
+    ## Headers larger than the read buffer are parsed line by line.
+    #
+    # Buffer is filled the way sockets fill it, never past
+    # MAX_BUFFER_SIZE, so headers which must fit in it at once never end.
+    #
+    def test_headers_larger_than_buffer(self):
+        headers = "".join(
+            "X-Other-%d: %s\r\n" % (i, "v" * 100) for i in range(30)
+        )
+        data = "GET / HTTP/1.1\r\n%sHost: host\r\n\r\nGET /2" % headers
+        self.assertGreater(len(data), 3 * MAX_BUFFER_SIZE)
+        self.assertLess(len(data), constants.MAX_HEADER_SIZE)
+
+        parser = http_util.HttpParser()
+        buffer = buffer_util.Buffer()
+        messages = []
+        offset = 0
+        while offset < len(data):
+            n = MAX_BUFFER_SIZE - len(buffer)
+            self.assertGreater(n, 0)
+            buffer.append(data[offset:offset + n])
+            offset += n
+            parse(parser, buffer, messages, [])
+        self.assertEqual(
+            messages,
+            [(["GET", "/", "HTTP/1.1"], {"Host": "host"}, "")],
+        )
+        self.assertEqual(str(buffer), "GET /2")
+
+    ## More headers than max are rejected.
+    def test_max_headers(self):
+        parser = http_util.HttpParser(max_headers=3)
+        buffer = buffer_util.Buffer()
+        buffer.append("GET / HTTP/1.1\r\n%s\r\n" % ("A: b\r\n" * 4))
+        parser.recv_first_line(buffer)
+        with self.assertRaises(http_util.HTTPError) as e:
+            parser.recv_headers(buffer, set())
+        self.assertEqual(e.exception.code, 431)
+
+    ## Malformed headers are rejected.
+    def test_invalid_header(self):
+        for header in ("no separator", "Content-Length: -1"):
+            parser = http_util.HttpParser()
+            buffer = buffer_util.Buffer()
+            buffer.append("GET / HTTP/1.1\r\n%s\r\n\r\n" % header)
+            parser.recv_first_line(buffer)
+            with self.assertRaises(http_util.HTTPError) as e:
+                parser.recv_headers(buffer, set())
+            self.assertEqual(e.exception.code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
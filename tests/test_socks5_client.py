@@ -0,0 +1,140 @@
+#!/usr/bin/python
+## @package onion_routing.tests.test_socks5_client
+# Tests of requests sent by circuits of the entry node.
+## @file test_socks5_client.py
+# Implementation of @ref onion_routing.tests.test_socks5_client
+#
+
+import socket
+import unittest
+
+from common import constants
+from common.async import event_object
+from common.utilities import encryption_util
+from common.utilities import socks5_util
+from common.utilities import util
+from entry.pollables import socks5_client
+
+
+## Secret key of first node in tests.
+KEY = 7
+
+
+## Send a single byte of buffer.
+# @param sock (socket) the socket.
+# @param buffer (@ref common.utilities.buffer_util.Buffer) data to send.
+# @returns (int) number of bytes sent.
+#
+def send_byte(
+    sock,
+    buffer,
+):
+    sent = sock.send(buffer.peek(1))
+    buffer.consume(sent)
+    return sent
+
+
+## Recieve bytes until size bytes arrived or socket timed out.
+# @param sock (socket) the socket.
+# @param size (int) number of bytes.
+# @returns (str) recieved bytes.
+#
+def recv(
+    sock,
+    size,
+):
+    data = ""
+    try:
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+    except socket.timeout:
+        pass
+    return data
+
+
+## Socks5 Client short send tests.
+#
+# Socket accepts a single byte on every write, as a socket whose send
+# buffer is full.
+#
+class Socks5ClientShortSendTest(unittest.TestCase):
+
+    ## Circuit of two nodes connected to a listener as first node.
+    def setUp(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(1)
+        self.client = socks5_client.Socks5Client(
+            socket.socket(socket.AF_INET, socket.SOCK_STREAM),
+            constants.ACTIVE,
+            {
+                "max_buffer_size": 1024,
+                "dirty_sockets": set(),
+            },
+            {
+                "1": {
+                    "name": "first",
+                    "address": "127.0.0.1",
+                    "port": self.listener.getsockname()[1],
+                    "key": KEY,
+                },
+                "2": {
+                    "name": "second",
+                    "address": "127.0.0.1",
+                    "port": 9000,
+                    "key": KEY + 1,
+                },
+            },
+        )
+        self.node, address = self.listener.accept()
+        self.node.settimeout(1)
+
+        send_buffer = util.send_buffer
+        util.send_buffer = send_byte
+        self.addCleanup(setattr, util, "send_buffer", send_buffer)
+
+    ## Close sockets.
+    def tearDown(self):
+        self.client.socket.close()
+        self.node.close()
+        self.listener.close()
+
+    ## Greeting and connection request are sent completely before
+    # responses are read.
+    #
+    def test_requests_sent_in_parts(self):
+        while self.client.get_events() & event_object.BaseEvent.POLLOUT:
+            self.client.on_write()
+        self.assertTrue(
+            self.client.get_events() & event_object.BaseEvent.POLLIN,
+        )
+
+        requests = socks5_util.GreetingRequest.encode(
+            {
+                "version": constants.SOCKS5_VERSION,
+                "number_methods": len(constants.SUPPORTED_METHODS) + 1,
+                "methods": list(constants.SUPPORTED_METHODS) + [
+                    constants.MY_SOCKS_SIGNATURE,
+                ],
+            },
+        ) + socks5_util.Socks5Request.encode(
+            {
+                "version": constants.SOCKS5_VERSION,
+                "command": constants.CONNECT,
+                "reserved": constants.SOCKS5_RESERVED,
+                "address_type": constants.IP_4,
+                "address": "127.0.0.1",
+                "port": 9000,
+            },
+        )
+        self.assertEqual(
+            encryption_util.decrypt(recv(self.node, len(requests)), KEY),
+            requests,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+#!/usr/bin/python
+## @package onion_routing.tests.test_socks5_server
+# Tests of greetings recieved by onion nodes.
+## @file test_socks5_server.py
+# Implementation of @ref onion_routing.tests.test_socks5_server
+#
+
+import socket
+import unittest
+
+from common import constants
+from common.async import event_object
+from common.utilities import encryption_util
+from common.utilities import socks5_util
+from common.utilities import util
+from onion.pollables import socks5_server
+
+
+## Secret key of node in tests.
+KEY = 7
+
+
+## Send a single byte of buffer.
+# @param sock (socket) the socket.
+# @param buffer (@ref common.utilities.buffer_util.Buffer) data to send.
+# @returns (int) number of bytes sent.
+#
+def send_byte(
+    sock,
+    buffer,
+):
+    sent = sock.send(buffer.peek(1))
+    buffer.consume(sent)
+    return sent
+
+
+## Socks5 Server greeting tests.
+@unittest.skipUnless(hasattr(socket, "socketpair"), "no socketpair")
+class Socks5ServerGreetingTest(unittest.TestCase):
+
+    ## Server on one end of a socket pair.
+    def setUp(self):
+        self.client, s = socket.socketpair()
+        self.client.settimeout(1)
+        self.sockets = []
+        self.app_context = {
+            "loads": [0],
+            "worker": 0,
+            "max_buffer_size": 1024,
+            "dirty_sockets": set(),
+            "add_socket": self.sockets.append,
+        }
+        self.server = socks5_server.Socks5Server(
+            s,
+            constants.ACTIVE,
+            self.app_context,
+            KEY,
+        )
+
+    ## Close both ends and sockets added by server.
+    def tearDown(self):
+        self.server.socket.close()
+        self.client.close()
+        for s in self.sockets:
+            s.socket.close()
+
+    ## Send encrypted greeting and let server read it.
+    def greet(
+        self,
+        methods,
+    ):
+        self.client.sendall(
+            encryption_util.encrypt(
+                socks5_util.GreetingRequest.encode(
+                    {
+                        "version": constants.SOCKS5_VERSION,
+                        "number_methods": len(methods),
+                        "methods": methods,
+                    },
+                ),
+                KEY,
+            )
+        )
+        self.server.on_read()
+
+    ## Greeting without methods is a protocol error.
+    def test_no_methods(self):
+        self.assertRaises(socks5_util.Socks5Error, self.greet, [])
+
+    ## Greeting with a supported method is answered.
+    def test_supported_method(self):
+        self.greet([constants.NO_AUTH])
+        self.server.on_write()
+        response = socks5_util.GreetingResponse.decode(
+            encryption_util.decrypt(self.client.recv(2), KEY),
+        )
+        self.assertEqual(response["method"], constants.NO_AUTH)
+
+    ## Connection which only greets, such as a probe, is not in load.
+    def test_greeting_not_counted(self):
+        self.greet([constants.NO_AUTH])
+        self.server.on_write()
+        self.assertEqual(self.app_context["loads"], [0])
+        self.server.close()
+        self.assertEqual(self.app_context["loads"], [0])
+
+    ## Circuit is in load until closed.
+    def test_circuit_counted(self):
+        self.greet([constants.MY_CELL_SIGNATURE])
+        self.assertEqual(self.app_context["loads"], [0])
+        self.server.on_write()
+        self.assertEqual(self.app_context["loads"], [1])
+        self.server.close()
+        self.server.close()
+        self.assertEqual(self.app_context["loads"], [0])
+
+    ## Greeting response sent in parts is followed by the response to the
+    # connection request which was sent along with the greeting.
+    #
+    def test_pipelined_after_short_send(self):
+        send_buffer = util.send_buffer
+        util.send_buffer = send_byte
+        self.addCleanup(setattr, util, "send_buffer", send_buffer)
+        destination = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        destination.bind(("127.0.0.1", 0))
+        destination.listen(1)
+        self.addCleanup(destination.close)
+
+        self.client.sendall(
+            encryption_util.encrypt(
+                socks5_util.GreetingRequest.encode(
+                    {
+                        "version": constants.SOCKS5_VERSION,
+                        "number_methods": 2,
+                        "methods": [
+                            constants.NO_AUTH,
+                            constants.MY_SOCKS_SIGNATURE,
+                        ],
+                    },
+                ) + socks5_util.Socks5Request.encode(
+                    {
+                        "version": constants.SOCKS5_VERSION,
+                        "command": constants.CONNECT,
+                        "reserved": constants.SOCKS5_RESERVED,
+                        "address_type": constants.IP_4,
+                        "address": "127.0.0.1",
+                        "port": destination.getsockname()[1],
+                    },
+                ),
+                KEY,
+            )
+        )
+        self.server.on_read()
+        while self.server.get_events() & event_object.BaseEvent.POLLOUT:
+            self.server.on_write()
+
+        response = ""
+        try:
+            while len(response) < 12:
+                response += self.client.recv(12 - len(response))
+        except socket.timeout:
+            pass
+        response = encryption_util.decrypt(response, KEY)
+        self.assertEqual(
+            socks5_util.GreetingResponse.decode(response[:2])["method"],
+            constants.NO_AUTH,
+        )
+        self.assertEqual(
+            socks5_util.Socks5Response.decode(response[2:])["reply"],
+            constants.SUCCESS,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
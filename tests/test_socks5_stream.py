@@ -0,0 +1,191 @@
+#!/usr/bin/python
+## @package onion_routing.tests.test_socks5_stream
+# Tests of socks5 replies sent to the browser by the entry node.
+## @file test_socks5_stream.py
+# Implementation of @ref onion_routing.tests.test_socks5_stream
+#
+
+import socket
+import unittest
+
+from common import constants
+from common.utilities import path_util
+from common.utilities import socks5_util
+from entry.pollables import socks5_stream
+
+
+## Circuit which records BEGIN requests instead of sending cells.
+class Circuit(object):
+
+    ## Constructor.
+    def __init__(self):
+
+        ## Buffer of circuit, always empty.
+        self.buffer = ""
+
+        ## State of circuit.
+        self.state = constants.ACTIVE
+
+        ## Nodes of circuit.
+        self.nodes = []
+
+        ## Destinations requested by BEGIN, as (stream_id, address, port).
+        self.begins = []
+
+    ## Add stream.
+    # @param stream (@ref entry.pollables.socks5_stream.Socks5Stream)
+    # stream.
+    # @param stream_id (int) requested id, None for any.
+    # @returns (int) id of stream.
+    #
+    def add_stream(
+        self,
+        stream,
+        stream_id=None,
+    ):
+        return 1
+
+    ## Remove stream.
+    # @param stream_id (int) id of stream.
+    #
+    def remove_stream(
+        self,
+        stream_id,
+    ):
+        pass
+
+    ## Send cell.
+    # @param stream_id (int) id of stream.
+    # @param command (int) cell command.
+    # @param payload (str) content of cell.
+    #
+    def send_cell(
+        self,
+        stream_id,
+        command,
+        payload="",
+    ):
+        pass
+
+    ## Ask last node to connect stream.
+    # @param stream_id (int) id of stream.
+    # @param address (str) destination address.
+    # @param port (int) destination port.
+    #
+    def begin(
+        self,
+        stream_id,
+        address,
+        port,
+    ):
+        self.begins.append((stream_id, address, port))
+
+    ## Mark circuit dirty.
+    def mark_dirty(self):
+        pass
+
+    ## fileno of circuit.
+    def fileno(self):
+        return -1
+
+
+## Socks5 Stream reply tests.
+@unittest.skipUnless(hasattr(socket, "socketpair"), "no socketpair")
+class Socks5StreamReplyTest(unittest.TestCase):
+
+    ## Close both ends.
+    def tearDown(self):
+        self.stream.socket.close()
+        self.browser.close()
+
+    ## Stream on one end of a socket pair which read a connection request.
+    # @param optimistic_data (bool) whether optimistic data is on.
+    #
+    def connect(
+        self,
+        optimistic_data,
+    ):
+        self.browser, s = socket.socketpair()
+        self.circuit = Circuit()
+        self.stream = socks5_stream.Socks5Stream(
+            s,
+            constants.ACTIVE,
+            {
+                "max_buffer_size": 1024,
+                "optimistic_data": optimistic_data,
+                "connections": {},
+                "path_selector": path_util.PathSelector(),
+                "dirty_sockets": set(),
+            },
+            self.circuit,
+        )
+        self.browser.sendall(
+            socks5_util.GreetingRequest.encode(
+                {
+                    "version": constants.SOCKS5_VERSION,
+                    "number_methods": 1,
+                    "methods": [constants.NO_AUTH],
+                },
+            ) +
+            socks5_util.Socks5Request.encode(
+                {
+                    "version": constants.SOCKS5_VERSION,
+                    "command": constants.CONNECT,
+                    "reserved": 0,
+                    "address_type": constants.IP_4,
+                    "address": "127.0.0.1",
+                    "port": 80,
+                },
+            )
+        )
+        self.stream.on_read()
+        self.stream.on_write()
+        self.assertEqual(
+            self.circuit.begins,
+            [(1, "127.0.0.1", 80)],
+        )
+        self.assertEqual(
+            socks5_util.GreetingResponse.decode(self.browser.recv(2))[
+                "method"
+            ],
+            constants.NO_AUTH,
+        )
+
+    ## Socks5 reply sent to browser, None if nothing was sent.
+    def reply(self):
+        self.stream.on_write()
+        self.browser.setblocking(False)
+        try:
+            data = self.browser.recv(1024)
+        except socket.error:
+            return None
+        return socks5_util.Socks5Response.decode(data)["reply"]
+
+    ## Without optimistic data browser is answered only by last node.
+    def test_reply_waits_for_begin(self):
+        self.connect(False)
+        self.assertIsNone(self.reply())
+        self.stream.on_begin(constants.SUCCESS)
+        self.assertEqual(self.reply(), constants.SUCCESS)
+        self.assertEqual(self.stream.state, constants.ACTIVE)
+
+    ## Without optimistic data failure of last node is sent to browser.
+    def test_failure_replied(self):
+        self.connect(False)
+        self.stream.on_begin(constants.GENERAL_SERVER_FAILURE)
+        self.assertEqual(self.reply(), constants.GENERAL_SERVER_FAILURE)
+        self.assertEqual(self.stream.state, constants.CLOSING)
+
+    ## With optimistic data browser is answered success right away and
+    # stream is closed when last node failed.
+    #
+    def test_optimistic_failure_closes(self):
+        self.connect(True)
+        self.assertEqual(self.reply(), constants.SUCCESS)
+        self.stream.on_begin(constants.GENERAL_SERVER_FAILURE)
+        self.assertIsNone(self.reply())
+        self.assertEqual(self.stream.state, constants.CLOSING)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+#!/usr/bin/python
+## @package onion_routing.tests.test_timer_wheel
+# Tests of expiry of keys by the timer wheel.
+## @file test_timer_wheel.py
+# Implementation of @ref onion_routing.tests.test_timer_wheel
+#
+
+import logging
+import unittest
+
+from common.async import timer_wheel
+
+
+## Seconds between turns of wheel in tests.
+TICK = 1
+
+## Delay of keys in tests.
+DELAY = 5
+
+
+## Clock which moves only when told to.
+class Clock(object):
+
+    ## Constructor.
+    def __init__(self):
+        ## Current time.
+        self.now = 1000.0
+
+    ## Current time.
+    # @returns (float) seconds.
+    #
+    def time(self):
+        return self.now
+
+
+## Timer Wheel tests.
+#
+# Wheel reads time from a @ref Clock, so expiry does not wait for real
+# time to pass.
+#
+class TimerWheelTest(unittest.TestCase):
+
+    ## Wheel on a clock, recording expired keys.
+    def setUp(self):
+        self.clock = Clock()
+        self._time = timer_wheel.time
+        timer_wheel.time = self.clock
+        self.expired = []
+        self.wheel = timer_wheel.TimerWheel(
+            TICK,
+            DELAY,
+            self.expired.append,
+        )
+
+    ## Restore time of wheel module.
+    def tearDown(self):
+        timer_wheel.time = self._time
+
+    ## Move clock and turn wheel.
+    def advance(
+        self,
+        seconds,
+    ):
+        self.clock.now += seconds
+        self.wheel.advance()
+
+    ## Added key is kept until its delay passed.
+    def test_schedule(self):
+        self.wheel.add("a", DELAY)
+        self.assertIn("a", self.wheel)
+        self.assertEqual(len(self.wheel), 1)
+        self.advance(DELAY - TICK)
+        self.assertEqual(self.expired, [])
+        self.assertIn("a", self.wheel)
+
+    ## Key expires once, between delay and delay + tick.
+    def test_expiry(self):
+        self.wheel.add("a", DELAY)
+        self.advance(DELAY + TICK)
+        self.assertEqual(self.expired, ["a"])
+        self.assertNotIn("a", self.wheel)
+        self.assertEqual(len(self.wheel), 0)
+        self.advance(3 * DELAY)
+        self.assertEqual(self.expired, ["a"])
+
+    ## Adding key again postpones its expiry.
+    def test_reschedule(self):
+        self.wheel.add("a", DELAY)
+        for i in range(10):
+            self.advance(DELAY - TICK)
+            self.wheel.add("a", DELAY)
+        self.assertEqual(self.expired, [])
+        self.assertEqual(len(self.wheel), 1)
+        self.advance(DELAY + TICK)
+        self.assertEqual(self.expired, ["a"])
+
+    ## Removed key never expires.
+    def test_cancel(self):
+        self.wheel.add("a", DELAY)
+        self.wheel.add("b", DELAY)
+        self.wheel.remove("a")
+        self.wheel.remove("c")
+        self.advance(DELAY + TICK)
+        self.assertEqual(self.expired, ["b"])
+
+    ## Wheel turned late expires every key passed.
+    def test_late_advance(self):
+        for i in range(DELAY):
+            self.wheel.add(i, i + 1)
+        self.advance(10 * DELAY)
+        self.assertEqual(sorted(self.expired), range(DELAY))
+
+    ## Exception in callback does not stop other keys from expiring.
+    def test_callback_error(self):
+        def callback(key):
+            self.expired.append(key)
+            raise RuntimeError("callback failed")
+
+        self.wheel = timer_wheel.TimerWheel(TICK, DELAY, callback)
+        self.wheel.add("a", DELAY)
+        self.wheel.add("b", DELAY)
+        logging.disable(logging.ERROR)
+        try:
+            self.advance(DELAY + TICK)
+        finally:
+            logging.disable(logging.NOTSET)
+        self.assertEqual(sorted(self.expired), ["a", "b"])
+
+    ## Delay longer than the wheel is rejected.
+    def test_delay_too_long(self):
+        self.assertRaises(ValueError, self.wheel.add, "a", 10 * DELAY)
+
+
+if __name__ == "__main__":
+    unittest.main()
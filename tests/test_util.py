@@ -0,0 +1,107 @@
+#!/usr/bin/python
+## @package onion_routing.tests.test_util
+# Tests of general utilities.
+## @file test_util.py
+# Implementation of @ref onion_routing.tests.test_util
+#
+
+import os
+import signal
+import socket
+import time
+import unittest
+
+from common.pollables import tcp_socket
+from common.utilities import util
+
+
+## Set nodelay tests.
+class SetNodelayTest(unittest.TestCase):
+
+    ## Nagle algorithm is disabled on TCP sockets.
+    def test_tcp(self):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            util.set_nodelay(s)
+            self.assertTrue(
+                s.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY),
+            )
+        finally:
+            s.close()
+
+    ## Socket pairs are wrapped without the option.
+    @unittest.skipUnless(hasattr(socket, "socketpair"), "no socketpair")
+    def test_socketpair(self):
+        a, b = socket.socketpair()
+        try:
+            util.set_nodelay(a)
+            tcp_socket.TCPSocket(b, None, {})
+        finally:
+            a.close()
+            b.close()
+
+
+## Fork workers tests.
+#
+# Workers are forked by a supervisor process, which reports on a pipe the
+# index and pid of every worker it forked and the workers which died.
+#
+@unittest.skipIf(os.name == "nt", "no fork")
+class ForkWorkersTest(unittest.TestCase):
+
+    ## Fork supervisor.
+    # @param run_worker (callable) called with index of every worker.
+    #
+    def supervise(
+        self,
+        run_worker,
+    ):
+        r, w = os.pipe()
+        self.supervisor = os.fork()
+        if not self.supervisor:
+            try:
+                os.close(r)
+                died = []
+                worker = util.fork_workers(2, on_exit=died.append)
+                if worker is None:
+                    os.write(w, "died %s\n" % died)
+                else:
+                    os.write(w, "%d %d\n" % (worker, os.getpid()))
+                    run_worker(worker)
+            finally:
+                os._exit(0)
+        os.close(w)
+        self.reports = os.fdopen(r)
+
+    ## Close pipe and wait for supervisor.
+    def tearDown(self):
+        self.reports.close()
+        os.waitpid(self.supervisor, 0)
+
+    ## Worker which reported.
+    # @returns (tuple) index and pid.
+    #
+    def worker(self):
+        return tuple(int(x) for x in self.reports.readline().split())
+
+    ## Worker which was killed is forked again until workers are stopped.
+    def test_killed_worker_forked(self):
+        self.supervise(lambda worker: time.sleep(60))
+        workers = dict([self.worker(), self.worker()])
+        os.kill(workers[0], signal.SIGKILL)
+        index, pid = self.worker()
+        self.assertEqual(index, 0)
+        self.assertNotEqual(pid, workers[0])
+        os.kill(self.supervisor, signal.SIGTERM)
+        self.assertEqual(self.reports.readline(), "died [0]\n")
+
+    ## Worker which exited cleanly stops the other workers.
+    def test_exited_worker_stops(self):
+        self.supervise(lambda worker: worker == 0 and time.sleep(60))
+        self.assertEqual(self.reports.readline()[-1], "\n")
+        self.assertEqual(self.reports.readline()[-1], "\n")
+        self.assertEqual(self.reports.readline(), "died []\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/python
+## @package onion_routing.tests.test_xml_util
+# Tests of the statistics xml.
+## @file test_xml_util.py
+# Implementation of @ref onion_routing.tests.test_xml_util
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from common import constants
+from common.utilities import path_util
+from common.utilities import xml_util
+
+
+## Connection of statistics.
+class Connection(object):
+
+    ## Constructor.
+    # @param fd (int) fileno of connection.
+    #
+    def __init__(
+        self,
+        fd,
+    ):
+        self._fd = fd
+
+    ## fileno of connection.
+    def fileno(self):
+        return self._fd
+
+
+## Connections xml tests.
+class ConnectionsXmlTest(unittest.TestCase):
+
+    ## Temporary directory of xml file.
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    ## Remove temporary directory.
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    ## Render connections.
+    # @param ttfb (int) time to first byte of connection, None if not
+    # measured.
+    # @returns (str) xml.
+    #
+    def render(
+        self,
+        ttfb,
+    ):
+        path = os.path.join(self.directory, "statistics.xml")
+        handler = xml_util.XmlHandler(
+            path,
+            {
+                Connection(5): {
+                    "in": {"fd": 5, "bytes": 10},
+                    "out": {"fd": 6, "bytes": 20},
+                    "ttfb": ttfb,
+                },
+            },
+            constants.XML_CONNECTIONS,
+            path_util.PathSelector(),
+        )
+        try:
+            handler.update()
+            with open(path) as f:
+                return f.read()
+        finally:
+            handler.close()
+
+    ## Time to first byte in milliseconds.
+    def test_ttfb(self):
+        self.assertIn("<ttfb>42</ttfb>", self.render(42))
+
+    ## Connection without first byte shows "-".
+    def test_no_ttfb(self):
+        xml = self.render(None)
+        self.assertIn("<ttfb>-</ttfb>", xml)
+        self.assertNotIn("None", xml)
+
+
+if __name__ == "__main__":
+    unittest.main()